@@ -0,0 +1,37 @@
+from collections import deque
+import numpy as np
+
+
+class CaskController(object):
+    """
+    Chooses how many of the slowest envs (casks) a rollout does not wait
+    for, among `candidates`, so that the samples per second are maximal.
+
+    A rollout with k casks ends when the (nenvs - k)-th env completed its
+    nsteps and yields (nenvs - k) * nsteps samples. The completion time of
+    every order statistic is averaged over the last `window` rollouts, envs
+    that were cut off are extrapolated from their progress.
+    """
+    def __init__(self, nenvs, nsteps, candidates, window=5):
+        self.nenvs = nenvs
+        self.nsteps = nsteps
+        self.candidates = sorted(candidates)
+        assert self.candidates and 0 <= self.candidates[0] and self.candidates[-1] < nenvs
+        self.history = deque(maxlen=window)
+        self.num_casks = self.candidates[-1]
+
+    def update(self, completion_times, completed, elapsed):
+        """
+        Record a rollout that lasted `elapsed` seconds: completion_times of
+        the envs that completed, nan for the others, which had `completed`
+        steps by then. Returns the number of casks for the next rollout.
+        """
+        times = np.array(completion_times, dtype=np.float64)
+        cut = np.isnan(times)
+        times[cut] = elapsed * self.nsteps / np.maximum(np.asarray(completed)[cut], 1)
+        self.history.append(np.sort(times))
+        order = np.maximum(np.mean(self.history, axis=0), 1e-9)
+        rates = [(self.nenvs - k) / order[self.nenvs - k - 1] for k in self.candidates]
+        # ties go to fewer casks, they keep more samples
+        self.num_casks = self.candidates[int(np.argmax(rates))]
+        return self.num_casks
@@ -0,0 +1,200 @@
+"""
+Single file checkpoints that load memory mapped.
+
+Layout: the magic b'CKPT0001', the byte length of a JSON header as a little
+endian uint64, the header, and from the next 64 byte boundary on the raw
+arrays, each at a 64 byte aligned offset. The header lists the name,
+dtype, shape and offset of every array and holds a free form `meta` dict.
+"""
+import json
+import os
+import os.path as osp
+import queue
+import re
+import struct
+import tempfile
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+from baselines.common.running_mean_std import RunningMeanStd
+
+MAGIC = b'CKPT0001'
+ALIGN = 64
+# the names ppo2 gives its checkpoints, counted by keep_last
+CHECKPOINT_FILE = re.compile(r'^\d{5}\.ckpt$')
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def is_checkpoint(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def save(path, arrays, meta=None):
+    """
+    Write the name -> array mapping `arrays` and the JSON serializable
+    `meta` to path. The file is written next to path, synced and renamed
+    over it, so readers see either the old or the new checkpoint.
+    """
+    arrays = OrderedDict((name, np.asarray(arr, order='C')) for name, arr in arrays.items())
+    entries = []
+    offset = 0
+    for name, arr in arrays.items():
+        entries.append({'name': name, 'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset})
+        offset = _aligned(offset + arr.nbytes)
+    header = json.dumps({'arrays': entries, 'meta': meta or {}}).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.' + basename + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for entry, arr in zip(entries, arrays.values()):
+                f.seek(data_start + entry['offset'])
+                f.write(arr.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load(path, mmap=True):
+    """
+    (arrays, meta) of a checkpoint. arrays is an OrderedDict of read-only
+    views into a memory map of the file, or into a copy read at once.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a checkpoint' % path)
+        size, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(size).decode('utf-8'))
+    data_start = _aligned(len(MAGIC) + 8 + size)
+    if mmap:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        data = np.fromfile(path, dtype=np.uint8)
+        data.flags.writeable = False
+    arrays = OrderedDict()
+    for entry in header['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        start = data_start + entry['offset']
+        nbytes = int(np.prod(entry['shape'])) * dtype.itemsize
+        arrays[entry['name']] = data[start:start + nbytes].view(dtype).reshape(entry['shape'])
+    return arrays, header['meta']
+
+
+def rms_arrays(prefix, rms):
+    """
+    copies of the arrays of a RunningMeanStd, named <prefix>/mean, /var
+    and /count; safe while another thread updates rms
+    """
+    mean, var, count = rms.mean, rms.var, rms.count
+    return OrderedDict([(prefix + '/mean', np.array(mean)), (prefix + '/var', np.array(var)),
+                        (prefix + '/count', np.float64(count))])
+
+
+def rms_from_arrays(arrays, prefix):
+    """
+    the RunningMeanStd stored under prefix, None if there is none
+    """
+    if prefix + '/mean' not in arrays:
+        return None
+    rms = RunningMeanStd(shape=arrays[prefix + '/mean'].shape)
+    rms.mean = np.array(arrays[prefix + '/mean'])
+    rms.var = np.array(arrays[prefix + '/var'])
+    rms.count = float(arrays[prefix + '/count'])
+    return rms
+
+
+class CheckpointWriter(object):
+    """
+    Saves checkpoints in a background thread. submit() only blocks while
+    `max_pending` checkpoints wait to be written; with keep_last, only the
+    newest keep_last %.5i.ckpt files of a directory are kept, counting the
+    ones already there (from an earlier run) as older than any written.
+
+    A failed write is raised by the next submit(), flush() or close().
+    """
+    def __init__(self, max_pending=2, keep_last=None):
+        self.keep_last = keep_last
+        self.written = deque()
+        self._listed = set()
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._write, name='checkpoint-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, path, arrays, meta=None):
+        """
+        queue a checkpoint for save(), the arrays must not change afterwards
+        """
+        assert not self._closed, 'checkpoint writer is closed'
+        self._raise()
+        self._queue.put((path, arrays, meta))
+
+    def flush(self):
+        """
+        wait until every submitted checkpoint is written
+        """
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._raise()
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, arrays, meta = item
+                save(path, arrays, meta)
+                if self.keep_last:
+                    self._list_existing(osp.dirname(path), path)
+                if path in self.written:
+                    self.written.remove(path)
+                self.written.append(path)
+                while self.keep_last and len(self.written) > self.keep_last:
+                    old = self.written.popleft()
+                    if os.path.exists(old):
+                        os.remove(old)
+            except Exception as e:  # pylint: disable=W0703
+                self.error = e
+            finally:
+                self._queue.task_done()
+
+    def _list_existing(self, directory, path):
+        """
+        the first time directory is written to, count its checkpoints other
+        than path as written before, by update
+        """
+        if directory in self._listed:
+            return
+        self._listed.add(directory)
+        names = sorted(name for name in os.listdir(directory or '.') if CHECKPOINT_FILE.match(name))
+        existing = [osp.join(directory, name) for name in names]
+        self.written.extendleft(reversed([p for p in existing if p != path and p not in self.written]))
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
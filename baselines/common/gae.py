@@ -0,0 +1,130 @@
+"""
+Generalized advantage estimation over a whole (nsteps, nenvs) rollout block.
+
+Every engine takes time-major arrays and returns (advs, returns):
+ - rewards, values: float32 arrays of shape (nsteps, nenvs)
+ - dones: bool array of shape (nsteps, nenvs), dones[t] is "episode started at t"
+ - last_values, last_dones: bootstrap value and done flag after the last step
+
+The engines reproduce the reference loop bit for bit: the recurrence is
+carried in float64 and rounded to float32 when stored, exactly like the
+original `for t in reversed(range(nsteps))` loop in ppo2.Runner.run.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _outputs(rewards, advs, returns):
+    if advs is None:
+        advs = np.zeros_like(rewards)
+    if returns is None:
+        returns = np.zeros_like(rewards)
+    return advs, returns
+
+
+def gae_loop(rewards, values, dones, last_values, last_dones, gamma, lam, advs=None, returns=None):
+    """
+    reference implementation, one python iteration per timestep
+    """
+    nsteps = rewards.shape[0]
+    advs, returns = _outputs(rewards, advs, returns)
+    last_values = np.asarray(last_values, dtype=np.float64)
+    lastgaelam = 0
+    for t in reversed(range(nsteps)):
+        if t == nsteps - 1:
+            nextnonterminal = 1.0 - last_dones
+            nextvalues = last_values
+        else:
+            nextnonterminal = 1.0 - dones[t+1]
+            nextvalues = values[t+1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        advs[t] = lastgaelam = delta + gamma * lam * nextnonterminal * lastgaelam
+    np.add(advs, values, out=returns)
+    return advs, returns
+
+
+def gae_numpy(rewards, values, dones, last_values, last_dones, gamma, lam, advs=None, returns=None):
+    """
+    batched implementation: deltas and decay factors for the whole block are
+    computed in one vectorized pass, only the carry remains a per-step update
+    """
+    nsteps = rewards.shape[0]
+    advs, returns = _outputs(rewards, advs, returns)
+    last_values = np.asarray(last_values, dtype=np.float64)
+
+    nextnonterminal = np.empty(rewards.shape, dtype=np.float64)
+    np.subtract(1.0, dones[1:], out=nextnonterminal[:-1])
+    np.subtract(1.0, last_dones, out=nextnonterminal[-1])
+
+    deltas = np.empty(rewards.shape, dtype=np.float64)
+    deltas[:-1] = rewards[:-1] + gamma * values[1:] * nextnonterminal[:-1] - values[:-1]
+    deltas[-1] = rewards[-1] + gamma * last_values * nextnonterminal[-1] - values[-1]
+    decay = gamma * lam * nextnonterminal
+
+    lastgaelam = np.zeros(rewards.shape[1:], dtype=np.float64)
+    for t in range(nsteps - 1, -1, -1):
+        np.multiply(decay[t], lastgaelam, out=lastgaelam)
+        np.add(deltas[t], lastgaelam, out=lastgaelam)
+        advs[t] = lastgaelam
+    np.add(advs, values, out=returns)
+    return advs, returns
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _gae_kernel(rewards, values, dones, last_values, last_dones, gamma, lam, advs):
+        nsteps, nenvs = rewards.shape
+        gamma32 = np.float32(gamma)
+        for e in range(nenvs):
+            lastgaelam = 0.0
+            for t in range(nsteps - 1, -1, -1):
+                if t == nsteps - 1:
+                    nextnonterminal = 1.0 - np.float64(last_dones[e])
+                    discounted = gamma * last_values[e]
+                else:
+                    nextnonterminal = 1.0 - np.float64(dones[t+1, e])
+                    # float32 * float32 like numpy does for `gamma * values[t+1]`
+                    discounted = np.float64(np.float32(gamma32 * values[t+1, e]))
+                delta = np.float64(rewards[t, e]) + discounted * nextnonterminal - np.float64(values[t, e])
+                lastgaelam = delta + gamma * lam * nextnonterminal * lastgaelam
+                advs[t, e] = lastgaelam
+
+
+def gae_numba(rewards, values, dones, last_values, last_dones, gamma, lam, advs=None, returns=None):
+    """
+    compiled implementation, requires numba
+    """
+    if numba is None:
+        raise ImportError('numba is required for the numba gae engine')
+    advs, returns = _outputs(rewards, advs, returns)
+    last_values = np.ascontiguousarray(last_values, dtype=np.float64)
+    last_dones = np.ascontiguousarray(last_dones, dtype=np.bool_)
+    _gae_kernel(rewards, values, dones, last_values, last_dones, float(gamma), float(lam), advs)
+    np.add(advs, values, out=returns)
+    return advs, returns
+
+
+GAE_ENGINES = {
+    'loop': gae_loop,
+    'numpy': gae_numpy,
+    'numba': gae_numba,
+}
+
+
+def get_gae_engine(name='auto'):
+    """
+    'auto' picks the numba engine when numba is importable, numpy otherwise
+    """
+    if callable(name):
+        return name
+    if name == 'auto':
+        name = 'numba' if numba is not None else 'numpy'
+    if name not in GAE_ENGINES:
+        raise ValueError('unknown gae engine %r, expected one of %s' % (name, sorted(GAE_ENGINES)))
+    if name == 'numba' and numba is None:
+        raise ImportError('numba is required for the numba gae engine')
+    return GAE_ENGINES[name]
@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+import numpy as np
+from baselines.common.timing import Timings
+
+
+class InferenceRequest(object):
+    """
+    Pending policy step for one batch of observations.
+    """
+    def __init__(self, obs):
+        self.obs = obs
+        self.submitted = time.time()
+        self._event = threading.Event()
+        self._result = None
+        self._error = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        (actions, values, neglogpacs) rows of this request
+        """
+        if not self._event.wait(timeout):
+            raise TimeoutError('inference request not served within %s seconds' % timeout)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def _set(self, result=None, error=None):
+        self._result = result
+        self._error = error
+        self._event.set()
+
+
+class InferenceServer(object):
+    """
+    Runs policy steps for variable size batches of observations in a
+    background thread.
+
+    Requests queue up until `max_batch` observations are pending or the
+    oldest request waited `max_latency` seconds, then all of them are served
+    by a single forward pass. `step_fn(obs)` must accept any batch size and
+    return (actions, values, states, neglogpacs) like Model.step. The forward
+    passes are timed as the 'policy' span of `timings`.
+    """
+    def __init__(self, step_fn, max_batch, max_latency=0.005, timings=None):
+        self.step_fn = step_fn
+        self.timings = timings if timings is not None else Timings(enabled=False)
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.batches = 0
+        self.requests = 0
+        self.samples = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._serve, name='inference-server', daemon=True)
+        self._thread.start()
+
+    def submit(self, obs):
+        assert not self._closed, 'inference server is closed'
+        request = InferenceRequest(np.asarray(obs))
+        self._queue.put(request)
+        return request
+
+    def step(self, obs):
+        return self.submit(obs).result()
+
+    def mean_batch_size(self):
+        return self.samples / self.batches if self.batches else 0.0
+
+    def _collect(self, first):
+        batch = [first]
+        size = len(first.obs)
+        deadline = first.submitted + self.max_latency
+        while size < self.max_batch:
+            remaining = deadline - time.time()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # serve what we have, stop afterwards
+                self._queue.put(None)
+                break
+            batch.append(request)
+            size += len(request.obs)
+        return batch
+
+    def _serve(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = self._collect(request)
+            try:
+                obs = np.concatenate([r.obs for r in batch])
+                with self.timings.span('policy'):
+                    actions, values, _, neglogpacs = self.step_fn(obs)
+            except Exception as e:  # pylint: disable=W0703
+                for r in batch:
+                    r._set(error=e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            self.samples += len(obs)
+            start = 0
+            for r in batch:
+                end = start + len(r.obs)
+                r._set((actions[start:end], values[start:end], neglogpacs[start:end]))
+                start = end
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,84 @@
+import queue
+import threading
+import numpy as np
+
+
+class MinibatchPipeline(object):
+    """
+    Prefetching SGD minibatches for the nonrecurrent ppo2 update.
+
+    A background thread permutes the whole batch once per epoch into
+    contiguous buffers with np.take and normalizes the advantages of every
+    minibatch there, so the minibatches handed out are plain slices. The
+    thread works on epoch e+1 while epoch e trains; three buffer sets rotate
+    so that the one in use is never overwritten.
+    """
+    def __init__(self, nbatch, nbatch_train):
+        assert nbatch % nbatch_train == 0
+        self.nbatch = nbatch
+        self.nbatch_train = nbatch_train
+        self._buffers = None
+
+    def _allocate(self, arrays):
+        shapes = [(self.nbatch,) + arr.shape[1:] for arr in arrays]
+        if self._buffers is None or [buf.shape for buf in self._buffers[0]] != shapes:
+            self._buffers = [[np.empty(shape, dtype=arr.dtype) for shape, arr in zip(shapes, arrays)]
+                             for _ in range(3)]
+
+    def minibatches(self, noptepochs, obs, returns, masks, actions, values, neglogpacs, advs=None):
+        """
+        Yields (obs, returns, masks, actions, values, neglogpacs, advs)
+        minibatches for noptepochs shuffled passes over the first nbatch
+        samples. advs defaults to returns - values and is normalized per
+        minibatch. The slices are only valid until the next one is taken.
+        """
+        n = self.nbatch
+        if advs is None:
+            advs = returns[:n] - values[:n]
+        arrays = [arr[:n] for arr in (obs, returns, masks, actions, values, neglogpacs, advs)]
+        self._allocate(arrays)
+        epochs = queue.Queue(maxsize=1)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for epoch in range(noptepochs):
+                    buffers = self._buffers[epoch % 3]
+                    perm = np.random.permutation(n)
+                    for arr, buf in zip(arrays, buffers):
+                        np.take(arr, perm, axis=0, out=buf)
+                    mb_advs = buffers[-1].reshape(n // self.nbatch_train, self.nbatch_train)
+                    mb_advs -= mb_advs.mean(axis=1, keepdims=True)
+                    mb_advs /= mb_advs.std(axis=1, keepdims=True) + 1e-8
+                    while not self._put(epochs, buffers, stop):
+                        pass
+                    if stop.is_set():
+                        return
+            except Exception as e:  # pylint: disable=W0703
+                while not self._put(epochs, e, stop):
+                    pass
+
+        thread = threading.Thread(target=produce, name='minibatch-pipeline', daemon=True)
+        thread.start()
+        try:
+            for _ in range(noptepochs):
+                buffers = epochs.get()
+                if isinstance(buffers, Exception):
+                    raise buffers
+                for start in range(0, n, self.nbatch_train):
+                    end = start + self.nbatch_train
+                    yield tuple(buf[start:end] for buf in buffers)
+        finally:
+            stop.set()
+            thread.join()
+
+    @staticmethod
+    def _put(epochs, item, stop):
+        """
+        returns True once the item is queued or the consumer went away
+        """
+        try:
+            epochs.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            return stop.is_set()
@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class RolloutBuffer(object):
+    """
+    Preallocated storage for one rollout, laid out (nenvs, nsteps, ...).
+
+    Every env owns one row and two write cursors: `dispatched` counts the
+    observations an action was sent for, `completed` counts the rewards that
+    came back. Rows of envs that did not finish (casks) are dropped by a mask,
+    the kept rows are compacted in place and handed out as flattened views.
+    """
+    def __init__(self, nenvs, nsteps, ob_shape, ac_shape, ob_dtype=np.float32, ac_dtype=np.float32):
+        self.nenvs = nenvs
+        self.nsteps = nsteps
+        self.obs = np.zeros((nenvs, nsteps) + tuple(ob_shape), dtype=ob_dtype)
+        self.actions = np.zeros((nenvs, nsteps) + tuple(ac_shape), dtype=ac_dtype)
+        self.rewards = np.zeros((nenvs, nsteps), dtype=np.float32)
+        self.values = np.zeros((nenvs, nsteps), dtype=np.float32)
+        self.neglogpacs = np.zeros((nenvs, nsteps), dtype=np.float32)
+        self.dones = np.zeros((nenvs, nsteps), dtype=np.bool_)
+        self.advs = np.zeros((nenvs, nsteps), dtype=np.float32)
+        self.returns = np.zeros((nenvs, nsteps), dtype=np.float32)
+        self.dispatched = np.zeros(nenvs, dtype=np.int64)
+        self.completed = np.zeros(nenvs, dtype=np.int64)
+        self._fields = (self.obs, self.actions, self.rewards, self.values, self.neglogpacs, self.dones)
+
+    def reset(self):
+        self.dispatched[:] = 0
+        self.completed[:] = 0
+
+    def add_dispatch(self, env_ids, obs, values, neglogpacs, dones):
+        """
+        record the inputs of the actions sent to env_ids, one row per env id
+        """
+        env_ids = np.asarray(env_ids, dtype=np.int64)
+        if len(env_ids) == 0:
+            return
+        t = self.dispatched[env_ids]
+        assert np.all(t < self.nsteps), 'dispatching to a full env'
+        self.obs[env_ids, t] = obs
+        self.values[env_ids, t] = values
+        self.neglogpacs[env_ids, t] = neglogpacs
+        self.dones[env_ids, t] = dones
+        self.dispatched[env_ids] += 1
+
+    def add_result(self, env_ids, actions, rewards):
+        """
+        record the actions taken and rewards received by env_ids
+        """
+        env_ids = np.asarray(env_ids, dtype=np.int64)
+        if len(env_ids) == 0:
+            return
+        t = self.completed[env_ids]
+        assert np.all(t < self.dispatched[env_ids]), 'result without a dispatched action'
+        self.actions[env_ids, t] = actions
+        self.rewards[env_ids, t] = rewards
+        self.completed[env_ids] += 1
+
+    def cancel(self, env_ids):
+        """
+        forget the dispatched actions of env_ids that never got a result,
+        their next dispatch takes the same step
+        """
+        env_ids = np.asarray(env_ids, dtype=np.int64)
+        pending = env_ids[self.dispatched[env_ids] > self.completed[env_ids]]
+        self.dispatched[pending] -= 1
+
+    def take(self, env_ids):
+        """
+        copies of the rows of env_ids as (obs, actions, rewards, values,
+        neglogpacs, dones), their cursors restart at 0
+        """
+        env_ids = np.asarray(env_ids, dtype=np.int64)
+        rows = tuple(field[env_ids] for field in self._fields)
+        self.dispatched[env_ids] = 0
+        self.completed[env_ids] = 0
+        return rows
+
+    def full(self):
+        return self.completed >= self.nsteps
+
+    def finalize(self, keep):
+        """
+        Move the rows selected by the boolean mask `keep` to the front of the
+        buffer. Kept rows sitting behind a dropped one are swapped into its
+        place, so at most one row per dropped env is copied.
+
+        Returns the env index of every compacted row.
+        """
+        keep = np.asarray(keep, dtype=np.bool_)
+        rows = np.flatnonzero(keep)
+        n = len(rows)
+        holes = np.flatnonzero(~keep[:n])
+        donors = rows[rows >= n]
+        for hole, donor in zip(holes, donors):
+            for field in self._fields:
+                field[hole] = field[donor]
+        rows = np.arange(n)
+        rows[holes] = donors
+        return rows
+
+    def time_major(self, n):
+        """
+        (nsteps, n) views of rewards, values, dones, advs and returns of the first n rows
+        """
+        return tuple(arr[:n].T for arr in (self.rewards, self.values, self.dones, self.advs, self.returns))
+
+    def flat(self, n):
+        """
+        zero-copy (n * nsteps, ...) views of obs, returns, dones, actions, values, neglogpacs
+        """
+        return tuple(arr[:n].reshape((n * self.nsteps,) + arr.shape[2:])
+                     for arr in (self.obs, self.returns, self.dones, self.actions, self.values, self.neglogpacs))
@@ -7,8 +7,8 @@ class RunningMeanStd(object):
         self.count = epsilon
 
     def update(self, x):
-        batch_mean = np.mean(x, axis=0)
-        batch_var = np.var(x, axis=0)
+        batch_mean = np.mean(x, axis=0, dtype=np.float64)
+        batch_var = np.var(x, axis=0, dtype=np.float64)
         batch_count = x.shape[0]
         self.update_from_moments(batch_mean, batch_var, batch_count)
 
@@ -16,17 +16,46 @@ class RunningMeanStd(object):
         delta = batch_mean - self.mean
         tot_count = self.count + batch_count
 
-        new_mean = self.mean + delta * batch_count / tot_count        
-        m_a = self.var * (self.count)
-        m_b = batch_var * (batch_count)
-        M2 = m_a + m_b + np.square(delta) * self.count * batch_count / (self.count + batch_count)
-        new_var = M2 / (self.count + batch_count)
+        new_var = self.var * self.count
+        new_var += batch_var * batch_count + np.square(delta) * (self.count * batch_count / tot_count)
+        new_var /= tot_count
+        new_mean = self.mean + delta * (batch_count / tot_count)
+        # swapped in one statement and never written afterwards, so another
+        # thread (an async actor's VecNormalize vs. a checkpoint) only sees
+        # the stats before or after a merge
+        self.mean, self.var, self.count = new_mean, new_var, tot_count
 
-        new_count = batch_count + self.count
+    def normalize(self, x, out=None, clip=None, epsilon=1e-8, passthrough=None):
+        """
+        (x - mean) / sqrt(var + epsilon) as float32, clipped to [-clip, clip]
+        and written into out if given. The columns set in the boolean mask
+        passthrough are copied from x unchanged.
+        """
+        if out is None:
+            out = np.empty(np.shape(x), dtype=np.float32)
+        scale = 1.0 / np.sqrt(self.var + epsilon)
+        np.subtract(x, self.mean.astype(out.dtype), out=out, casting='same_kind')
+        np.multiply(out, scale.astype(out.dtype), out=out)
+        if clip is not None:
+            np.clip(out, -clip, clip, out=out)
+        if passthrough is not None:
+            np.copyto(out, x, casting='same_kind', where=passthrough)
+        return out
 
-        self.mean = new_mean
-        self.var = new_var
-        self.count = new_count    
+    def affine(self, clip, epsilon=1e-8, passthrough=None):
+        """
+        float32 (scale, offset, low, high) with which
+        clip(x * scale + offset, low, high) is normalize(x, clip=clip) for the
+        current stats, for normalizing with them frozen. The passthrough
+        columns get scale 1, offset 0 and no clipping.
+        """
+        scale = 1.0 / np.sqrt(self.var + epsilon)
+        offset = -self.mean * scale
+        low, high = np.full(np.shape(scale), -clip), np.full(np.shape(scale), clip)
+        if passthrough is not None:
+            scale, offset = np.where(passthrough, 1.0, scale), np.where(passthrough, 0.0, offset)
+            low, high = np.where(passthrough, -np.inf, low), np.where(passthrough, np.inf, high)
+        return tuple(np.asarray(a, dtype=np.float32) for a in (scale, offset, low, high))
 
 def test_runningmeanstd():
     for (x1, x2, x3) in [
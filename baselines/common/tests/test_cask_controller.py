@@ -0,0 +1,36 @@
+import numpy as np
+
+from baselines.common.cask_controller import CaskController
+
+
+def test_drops_a_straggler_but_not_the_regular_spread():
+    nenvs, nsteps = 8, 10
+    controller = CaskController(nenvs, nsteps, candidates=[0, 1, 2, 3])
+    # seven envs complete within 10% of each other, one takes ten times as long
+    times = np.array([1.0, 1.02, 1.04, 1.05, 1.06, 1.08, 1.1, 10.0])
+    assert controller.update(times, np.full(nenvs, nsteps), 10.0) == 1
+
+    # without the straggler waiting for everyone gives the most samples per second
+    controller = CaskController(nenvs, nsteps, candidates=[0, 1, 2, 3])
+    assert controller.update(times[:-1].tolist() + [1.11], np.full(nenvs, nsteps), 1.11) == 0
+
+
+def test_cut_off_envs_are_extrapolated_from_their_progress():
+    nenvs, nsteps = 4, 10
+    controller = CaskController(nenvs, nsteps, candidates=[0, 1, 2])
+    # the rollout ended at 1s with two envs at 9/10 and 2/10 steps
+    times = np.array([0.9, 1.0, np.nan, np.nan])
+    completed = np.array([10, 10, 9, 2])
+    # 9/10 extrapolates to 1.11s, 2/10 to 5s: dropping only the slowest wins
+    assert controller.update(times, completed, 1.0) == 1
+
+
+def test_choice_follows_the_window_average():
+    nenvs, nsteps = 4, 10
+    controller = CaskController(nenvs, nsteps, candidates=[0, 1], window=2)
+    slow = np.array([1.0, 1.0, 1.0, 5.0])
+    fast = np.array([1.0, 1.0, 1.0, 1.2])
+    assert controller.update(slow, np.full(nenvs, nsteps), 5.0) == 1
+    # averaged with the slow rollout the last env is still too slow
+    assert controller.update(fast, np.full(nenvs, nsteps), 1.2) == 1
+    assert controller.update(fast, np.full(nenvs, nsteps), 1.2) == 0
@@ -0,0 +1,112 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from baselines.common import checkpoint
+from baselines.common.running_mean_std import RunningMeanStd
+
+
+def _arrays():
+    rng = np.random.RandomState(0)
+    return OrderedDict([
+        ('model/pi_fc1/w:0', rng.randn(7, 5).astype(np.float32)),
+        ('model/pi_fc1/b:0', rng.randn(5).astype(np.float32)),
+        ('model/pi_fc1/w/Adam:0', rng.randn(7, 5).astype(np.float32)),
+        ('beta1_power:0', np.float32(0.9 ** 3)),
+        ('mask', np.array([True, False, True])),
+        ('empty', np.zeros((0, 3))),
+    ])
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_roundtrip(tmpdir, mmap):
+    path = str(tmpdir.join('00010.ckpt'))
+    arrays = _arrays()
+    checkpoint.save(path, arrays, meta={'update': 10, 'timesteps': 1280})
+    assert checkpoint.is_checkpoint(path)
+
+    loaded, meta = checkpoint.load(path, mmap=mmap)
+    assert meta == {'update': 10, 'timesteps': 1280}
+    assert list(loaded) == list(arrays)
+    for name, arr in arrays.items():
+        assert loaded[name].dtype == arr.dtype
+        assert np.array_equal(loaded[name], arr)
+        if mmap and arr.size:
+            # memory maps start on a page, the offsets in the file are aligned
+            assert loaded[name].ctypes.data % checkpoint.ALIGN == 0
+        assert not loaded[name].flags.writeable
+
+
+def test_save_replaces_atomically(tmpdir, monkeypatch):
+    path = str(tmpdir.join('latest.ckpt'))
+    checkpoint.save(path, _arrays(), meta={'update': 1})
+
+    def fsync(_fd):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(os, 'fsync', fsync)
+    with pytest.raises(OSError):
+        checkpoint.save(path, _arrays(), meta={'update': 2})
+    # the old checkpoint is intact and no temporary file is left behind
+    assert checkpoint.load(path)[1] == {'update': 1}
+    assert os.listdir(str(tmpdir)) == ['latest.ckpt']
+
+
+def test_legacy_files_are_not_checkpoints(tmpdir):
+    path = tmpdir.join('00000')
+    path.write_binary(b'\x80\x03legacy joblib pickle')
+    assert not checkpoint.is_checkpoint(str(path))
+    assert not checkpoint.is_checkpoint(str(tmpdir.join('missing')))
+    with pytest.raises(ValueError):
+        checkpoint.load(str(path))
+
+
+def test_running_mean_std_arrays(tmpdir):
+    rms = RunningMeanStd(shape=(4,))
+    rms.update(np.random.RandomState(1).randn(32, 4))
+    path = str(tmpdir.join('rms.ckpt'))
+    checkpoint.save(path, checkpoint.rms_arrays('ob_rms', rms))
+    arrays, _ = checkpoint.load(path)
+    restored = checkpoint.rms_from_arrays(arrays, 'ob_rms')
+    assert np.array_equal(restored.mean, rms.mean)
+    assert np.array_equal(restored.var, rms.var)
+    assert restored.count == rms.count
+    # the restored stats keep updating, they are not views of the file
+    restored.update(np.ones((2, 4)))
+    assert checkpoint.rms_from_arrays(arrays, 'ret_rms') is None
+
+
+def test_writer_keeps_the_newest(tmpdir):
+    writer = checkpoint.CheckpointWriter(max_pending=1, keep_last=2)
+    for update in range(1, 6):
+        writer.submit(str(tmpdir.join('%.5i.ckpt' % update)), _arrays(), meta={'update': update})
+    writer.close()
+    assert sorted(os.listdir(str(tmpdir))) == ['00004.ckpt', '00005.ckpt']
+    assert checkpoint.load(str(tmpdir.join('00005.ckpt')))[1] == {'update': 5}
+
+
+def test_writer_prunes_checkpoints_of_earlier_runs(tmpdir):
+    for update in (1, 2, 3):
+        checkpoint.save(str(tmpdir.join('%.5i.ckpt' % update)), _arrays())
+    tmpdir.join('00002_ob_rms.pkl').write('')
+    tmpdir.join('grades.json').write('{}')
+    # a resumed run overwrites 00003.ckpt and goes on
+    writer = checkpoint.CheckpointWriter(keep_last=2)
+    for update in (3, 4):
+        writer.submit(str(tmpdir.join('%.5i.ckpt' % update)), _arrays(), meta={'update': update})
+    writer.close()
+    assert sorted(os.listdir(str(tmpdir))) == ['00002_ob_rms.pkl', '00003.ckpt', '00004.ckpt', 'grades.json']
+    assert checkpoint.load(str(tmpdir.join('00003.ckpt')))[1] == {'update': 3}
+
+
+def test_writer_raises_failed_writes(tmpdir):
+    writer = checkpoint.CheckpointWriter()
+    writer.submit(str(tmpdir.join('missing', '00001.ckpt')), _arrays())
+    with pytest.raises(OSError):
+        writer.flush()
+    # the writer keeps going after a failure
+    writer.submit(str(tmpdir.join('00002.ckpt')), _arrays())
+    writer.close()
+    assert os.listdir(str(tmpdir)) == ['00002.ckpt']
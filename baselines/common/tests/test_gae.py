@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from baselines.common.gae import GAE_ENGINES, get_gae_engine, numba
+
+
+def _rollout(nsteps, nenvs, seed=0):
+    rng = np.random.RandomState(seed)
+    rewards = rng.randn(nsteps, nenvs).astype(np.float32)
+    values = rng.randn(nsteps, nenvs).astype(np.float32)
+    dones = rng.rand(nsteps, nenvs) < 0.05
+    last_values = rng.randn(nenvs).astype(np.float32)
+    last_dones = rng.rand(nenvs) < 0.05
+    return rewards, values, dones, last_values, last_dones
+
+
+def _runner_reference(rewards, values, dones, last_values, last_dones, gamma, lam):
+    # the loop as it was written in ppo2.Runner.run
+    nsteps = rewards.shape[0]
+    last_values = np.array(last_values.tolist())
+    last_dones = np.array(last_dones.tolist())
+    mb_advs = np.zeros_like(rewards)
+    lastgaelam = 0
+    for t in reversed(range(nsteps)):
+        if t == nsteps - 1:
+            nextnonterminal = 1.0 - last_dones
+            nextvalues = last_values
+        else:
+            nextnonterminal = 1.0 - dones[t+1]
+            nextvalues = values[t+1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        mb_advs[t] = lastgaelam = delta + gamma * lam * nextnonterminal * lastgaelam
+    return mb_advs, mb_advs + values
+
+
+@pytest.mark.parametrize('name', sorted(GAE_ENGINES))
+def test_engines_bit_compatible(name):
+    if name == 'numba' and numba is None:
+        pytest.skip('numba is not installed')
+    engine = get_gae_engine(name)
+    for nsteps, nenvs in [(1, 1), (7, 3), (256, 16)]:
+        batch = _rollout(nsteps, nenvs, seed=nsteps)
+        advs, returns = engine(*batch, gamma=0.99, lam=0.95)
+        ref_advs, ref_returns = _runner_reference(*batch, gamma=0.99, lam=0.95)
+        assert advs.dtype == np.float32
+        assert np.array_equal(advs, ref_advs)
+        assert np.array_equal(returns, ref_returns)
+
+
+@pytest.mark.parametrize('name', sorted(GAE_ENGINES))
+def test_engines_write_into_views(name):
+    if name == 'numba' and numba is None:
+        pytest.skip('numba is not installed')
+    rewards, values, dones, last_values, last_dones = _rollout(32, 4)
+    advs = np.zeros((4, 32), dtype=np.float32)
+    returns = np.zeros((4, 32), dtype=np.float32)
+    get_gae_engine(name)(rewards, values, dones, last_values, last_dones, 0.99, 0.95, advs=advs.T, returns=returns.T)
+    ref_advs, ref_returns = _runner_reference(rewards, values, dones, last_values, last_dones, 0.99, 0.95)
+    assert np.array_equal(advs.T, ref_advs)
+    assert np.array_equal(returns.T, ref_returns)
@@ -0,0 +1,60 @@
+import threading
+
+import numpy as np
+import pytest
+
+from baselines.common.inference_server import InferenceServer
+
+
+def _step(obs):
+    return obs * 2, obs.sum(axis=1), None, -obs.sum(axis=1)
+
+
+def test_requests_get_their_own_rows():
+    server = InferenceServer(_step, max_batch=8, max_latency=0.05)
+    try:
+        obs = [np.full((n, 3), k, dtype=np.float32) for k, n in enumerate([1, 3, 2])]
+        requests = [server.submit(o) for o in obs]
+        for o, request in zip(obs, requests):
+            actions, values, neglogpacs = request.result(timeout=5)
+            assert np.array_equal(actions, o * 2)
+            assert np.array_equal(values, o.sum(axis=1))
+            assert np.array_equal(neglogpacs, -o.sum(axis=1))
+        # submitted within the latency window, served by one forward pass
+        assert server.batches == 1
+        assert server.mean_batch_size() == 6
+    finally:
+        server.close()
+
+
+def test_batches_are_capped():
+    sizes = []
+    gate = threading.Event()
+
+    def step(obs):
+        gate.wait()
+        sizes.append(len(obs))
+        return _step(obs)
+
+    server = InferenceServer(step, max_batch=4, max_latency=0.2)
+    try:
+        requests = [server.submit(np.ones((2, 3))) for _ in range(5)]
+        gate.set()
+        for request in requests:
+            request.result(timeout=5)
+        assert sum(sizes) == 10
+        assert max(sizes) <= 4
+    finally:
+        server.close()
+
+
+def test_errors_reach_the_caller():
+    def step(obs):
+        raise ValueError('bad batch')
+
+    server = InferenceServer(step, max_batch=4, max_latency=0.0)
+    try:
+        with pytest.raises(ValueError):
+            server.step(np.ones((1, 3)))
+    finally:
+        server.close()
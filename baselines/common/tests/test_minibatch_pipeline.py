@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from baselines.common.minibatch_pipeline import MinibatchPipeline
+
+
+def _batch(nbatch, seed=0):
+    rng = np.random.RandomState(seed)
+    obs = np.arange(nbatch * 3, dtype=np.float32).reshape(nbatch, 3)
+    returns = rng.randn(nbatch).astype(np.float32)
+    masks = rng.rand(nbatch) < 0.1
+    actions = rng.rand(nbatch, 2).astype(np.float32)
+    values = rng.randn(nbatch).astype(np.float32)
+    neglogpacs = rng.randn(nbatch).astype(np.float32)
+    return obs, returns, masks, actions, values, neglogpacs
+
+
+def test_every_epoch_is_a_permutation_with_aligned_rows():
+    nbatch, nbatch_train, noptepochs = 64, 16, 4
+    obs, returns, masks, actions, values, neglogpacs = _batch(nbatch)
+    pipeline = MinibatchPipeline(nbatch, nbatch_train)
+    minibatches = list(tuple(a.copy() for a in mb) for mb in
+                       pipeline.minibatches(noptepochs, obs, returns, masks, actions, values, neglogpacs))
+    assert len(minibatches) == noptepochs * nbatch // nbatch_train
+    for epoch in range(noptepochs):
+        seen = []
+        for mb_obs, mb_returns, mb_masks, mb_actions, mb_values, mb_neglogpacs, mb_advs in \
+                minibatches[epoch * 4:(epoch + 1) * 4]:
+            rows = (mb_obs[:, 0] // 3).astype(np.int64)
+            seen += rows.tolist()
+            assert np.array_equal(mb_returns, returns[rows])
+            assert np.array_equal(mb_masks, masks[rows])
+            assert np.array_equal(mb_actions, actions[rows])
+            assert np.array_equal(mb_neglogpacs, neglogpacs[rows])
+            # advantages are normalized per minibatch, like Model.train did
+            advs = returns[rows] - values[rows]
+            assert np.allclose(mb_advs, (advs - advs.mean()) / (advs.std() + 1e-8), atol=1e-5)
+        assert sorted(seen) == list(range(nbatch))
+
+
+def test_given_advantages_and_extra_rows():
+    nbatch, nbatch_train = 32, 8
+    arrays = _batch(nbatch + 8, seed=1)
+    advs = np.random.RandomState(2).randn(nbatch).astype(np.float32)
+    pipeline = MinibatchPipeline(nbatch, nbatch_train)
+    for mb in pipeline.minibatches(2, *arrays, advs=advs):
+        rows = (mb[0][:, 0] // 3).astype(np.int64)
+        assert rows.max() < nbatch
+        expected = (advs[rows] - advs[rows].mean()) / (advs[rows].std() + 1e-8)
+        assert np.allclose(mb[-1], expected, atol=1e-5)
+
+
+def test_consumer_can_stop_early():
+    pipeline = MinibatchPipeline(16, 4)
+    for k, _ in enumerate(pipeline.minibatches(100, *_batch(16))):
+        if k == 5:
+            break
+    # errors in the prefetch thread surface in the consumer
+    with pytest.raises(IndexError):
+        list(pipeline.minibatches(2, *_batch(16), advs=np.zeros(3)))
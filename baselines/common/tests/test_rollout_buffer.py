@@ -0,0 +1,83 @@
+import numpy as np
+
+from baselines.common.rollout_buffer import RolloutBuffer
+
+
+def _fill(buffer, nenvs, nsteps, lagging, rng):
+    # every env but the lagging ones completes nsteps, the lagging ones stop halfway
+    expected = {i: [] for i in range(nenvs)}
+    for t in range(nsteps):
+        ids = [i for i in range(nenvs) if i not in lagging or t < nsteps // 2]
+        obs = rng.randn(len(ids), 3).astype(np.float32)
+        values = rng.randn(len(ids)).astype(np.float32)
+        buffer.add_dispatch(ids, obs, values, values * 2, np.zeros(len(ids), dtype=np.bool_))
+        actions = rng.rand(len(ids), 2).astype(np.float32)
+        rewards = rng.randn(len(ids)).astype(np.float32)
+        buffer.add_result(ids, actions, rewards)
+        for k, i in enumerate(ids):
+            expected[i].append((obs[k], actions[k], rewards[k], values[k]))
+    return expected
+
+
+def test_finalize_drops_casks_without_copying_views():
+    nenvs, nsteps = 6, 8
+    rng = np.random.RandomState(0)
+    buffer = RolloutBuffer(nenvs, nsteps, (3,), (2,))
+    expected = _fill(buffer, nenvs, nsteps, lagging={0, 3}, rng=rng)
+
+    full = buffer.full()
+    assert full.tolist() == [False, True, True, False, True, True]
+    rows = buffer.finalize(full)
+    assert sorted(rows.tolist()) == [1, 2, 4, 5]
+
+    obs, returns, dones, actions, values, neglogpacs = buffer.flat(len(rows))
+    assert obs.shape == (len(rows) * nsteps, 3)
+    assert actions.shape == (len(rows) * nsteps, 2)
+    assert np.shares_memory(obs, buffer.obs)
+    for row, env in enumerate(rows):
+        for t, (ob, action, reward, value) in enumerate(expected[env]):
+            assert np.array_equal(obs[row * nsteps + t], ob)
+            assert np.array_equal(actions[row * nsteps + t], action)
+            assert buffer.rewards[row, t] == reward
+            assert values[row * nsteps + t] == value
+            assert neglogpacs[row * nsteps + t] == value * 2
+
+
+def test_reset_rewinds_cursors():
+    buffer = RolloutBuffer(2, 4, (3,), (2,))
+    buffer.add_dispatch([1], np.ones((1, 3)), [1.0], [1.0], [False])
+    buffer.add_result([1], np.ones((1, 2)), [1.0])
+    assert buffer.completed.tolist() == [0, 1]
+    buffer.reset()
+    assert buffer.dispatched.tolist() == [0, 0]
+    assert buffer.completed.tolist() == [0, 0]
+
+
+def test_take_copies_rows_and_rewinds_them():
+    nenvs, nsteps = 4, 5
+    rng = np.random.RandomState(2)
+    buffer = RolloutBuffer(nenvs, nsteps, (3,), (2,))
+    expected = _fill(buffer, nenvs, nsteps, lagging={1}, rng=rng)
+
+    obs, actions, rewards, values, neglogpacs, dones = buffer.take([2, 0])
+    assert obs.shape == (2, nsteps, 3)
+    for k, i in enumerate([2, 0]):
+        assert np.array_equal(obs[k], [e[0] for e in expected[i]])
+        assert np.array_equal(rewards[k], [e[2] for e in expected[i]])
+    assert buffer.dispatched.tolist() == [0, nsteps // 2, 0, nsteps]
+    assert buffer.completed.tolist() == [0, nsteps // 2, 0, nsteps]
+    # the taken rows do not alias the buffer
+    buffer.add_dispatch([0], np.ones((1, 3)), [0.0], [0.0], [False])
+    assert not np.array_equal(obs[1, 0], buffer.obs[0, 0])
+
+
+def test_cancel_forgets_only_pending_dispatches():
+    buffer = RolloutBuffer(3, 4, (3,), (2,))
+    buffer.add_dispatch([0, 1], np.ones((2, 3)), [1.0, 1.0], [1.0, 1.0], [False, False])
+    buffer.add_result([1], np.ones((1, 2)), [1.0])
+    buffer.cancel([0, 1, 2])
+    assert buffer.dispatched.tolist() == [0, 1, 0]
+    assert buffer.completed.tolist() == [0, 1, 0]
+    # the cancelled step is dispatched again in the same slot
+    buffer.add_dispatch([0], np.full((1, 3), 2.0), [2.0], [2.0], [True])
+    assert buffer.obs[0, 0].tolist() == [2.0] * 3 and buffer.dones[0, 0]
@@ -0,0 +1,143 @@
+import copy
+import pickle
+import sys
+import threading
+
+import numpy as np
+from gym.spaces import Box
+
+from baselines.common import checkpoint
+from baselines.common.running_mean_std import RunningMeanStd
+from baselines.common.vec_env import VecEnv
+from baselines.common.vec_env.vec_normalize import VecNormalize
+
+
+def _reference(obs, mean, var, clip, epsilon, npassthrough):
+    # the deepcopy-and-loop normalization VecNormalize used to do
+    tmp = copy.deepcopy(obs)
+    out = np.clip((obs - mean) / np.sqrt(var + epsilon), -clip, clip)
+    for i in range(len(tmp)):
+        out[i][-npassthrough:] = tmp[i][-npassthrough:]
+    return out
+
+
+def test_update_matches_batch_moments():
+    rng = np.random.RandomState(0)
+    batches = [rng.randn(n, 5) * 3 + 1 for n in (1, 7, 16)]
+    rms = RunningMeanStd(epsilon=0.0, shape=(5,))
+    mean, var = rms.mean, rms.var
+    for batch in batches:
+        rms.update(batch.astype(np.float32))
+    x = np.concatenate(batches).astype(np.float32)
+    assert np.allclose(rms.mean, x.mean(axis=0, dtype=np.float64))
+    assert np.allclose(rms.var, x.var(axis=0, dtype=np.float64))
+    assert rms.count == len(x)
+    # arrays handed out before are snapshots, the update never writes them
+    assert not mean.any() and np.all(var == 1)
+
+
+def test_normalize_matches_reference():
+    rng = np.random.RandomState(1)
+    rms = RunningMeanStd(shape=(10,))
+    passthrough = np.zeros(10, dtype=np.bool_)
+    passthrough[-6:] = True
+    for _ in range(5):
+        obs = (rng.randn(8, 10) * 20).astype(np.float32)
+        rms.update(obs)
+        expected = _reference(obs, rms.mean, rms.var, 10., 1e-8, 6)
+        out = np.empty_like(obs)
+        assert rms.normalize(obs, out=out, clip=10., passthrough=passthrough) is out
+        assert out.dtype == np.float32
+        assert np.allclose(out, expected, rtol=1e-6, atol=1e-6)
+        assert np.array_equal(out[:, -6:], obs[:, -6:])
+
+
+def test_snapshots_while_updating_are_consistent():
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        rms = RunningMeanStd(shape=(64,))
+        # batches of mean 0 and variance 1, the stats start there and stay
+        batch = np.tile(np.array([[-1.], [1.]]), (1, 64))
+        stop = threading.Event()
+
+        def update():
+            while not stop.is_set():
+                rms.update(batch)
+
+        thread = threading.Thread(target=update)
+        thread.start()
+        try:
+            for _ in range(5000):
+                arrays = checkpoint.rms_arrays('ob_rms', rms)
+                assert np.allclose(arrays['ob_rms/var'], 1.0) and np.allclose(arrays['ob_rms/mean'], 0.0)
+        finally:
+            stop.set()
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_old_pickles_load_and_update():
+    rms = RunningMeanStd(shape=(3,))
+    # as pickled before the update was done in place
+    state = {'mean': np.float64([1., 2., 3.]), 'var': np.float64([4., 5., 6.]), 'count': 10.0}
+    old = RunningMeanStd.__new__(RunningMeanStd)
+    old.__dict__.update(state)
+    restored = pickle.loads(pickle.dumps(old))
+    restored.update(np.ones((2, 3)))
+    rms.mean, rms.var, rms.count = np.float64([1., 2., 3.]), np.float64([4., 5., 6.]), 10.0
+    rms.update_from_moments(np.ones(3), np.zeros(3), 2)
+    assert np.allclose(restored.mean, rms.mean) and np.allclose(restored.var, rms.var)
+    assert restored.normalize(np.zeros((1, 3))).shape == (1, 3)
+
+
+class _ObsEnv(VecEnv):
+    def __init__(self, obs):
+        VecEnv.__init__(self, len(obs[0]), Box(-10, 10, shape=obs[0].shape[1:], dtype=np.float32),
+                        Box(-1, 1, shape=(1,), dtype=np.float32))
+        self.obs = iter(obs)
+
+    def reset(self):
+        return next(self.obs)
+
+    def step_async(self, actions):
+        pass
+
+    def step_wait(self):
+        return next(self.obs), np.ones(self.num_envs), np.zeros(self.num_envs), [{}] * self.num_envs
+
+    def close(self):
+        pass
+
+
+def test_vec_normalize_passes_target_velocity_through():
+    rng = np.random.RandomState(2)
+    obs = [(rng.randn(4, 12) * 5).astype(np.float32) for _ in range(3)]
+    env = VecNormalize(_ObsEnv([o.copy() for o in obs]))
+    rms = RunningMeanStd(shape=(12,))
+    for i, o in enumerate(obs):
+        out = env.reset() if i == 0 else env.step(np.zeros((4, 1)))[0]
+        rms.update(o)
+        assert np.allclose(out, _reference(o, rms.mean, rms.var, 10., 1e-8, 6), rtol=1e-6, atol=1e-6)
+        assert np.array_equal(out[:, -6:], o[:, -6:])
+
+
+def test_frozen_vec_normalize_uses_loaded_stats():
+    rng = np.random.RandomState(3)
+    obs = [(rng.randn(4, 12) * 5).astype(np.float32) for _ in range(3)]
+    env = VecNormalize(_ObsEnv([o.copy() for o in obs]), frozen=True)
+    rms = RunningMeanStd(shape=(12,))
+    rms.update((rng.randn(50, 12) * 5 + 1).astype(np.float64))
+    env.ob_rms = rms
+    mean, var, count = rms.mean.copy(), rms.var.copy(), rms.count
+    scale = 1.0 / np.sqrt(var + 1e-8)
+    for i, o in enumerate(obs):
+        out, rews = (env.reset(), None) if i == 0 else env.step(np.zeros((4, 1)))[:2]
+        expected = np.clip(o * scale - mean * scale, -10., 10.)
+        expected[:, -6:] = o[:, -6:]
+        assert out.dtype == np.float32
+        assert np.allclose(out, expected, rtol=1e-5, atol=1e-5)
+        assert rews is None or np.array_equal(rews, np.ones(4))
+    assert np.array_equal(rms.mean, mean) and np.array_equal(rms.var, var) and rms.count == count
+    assert not env.ret.any()
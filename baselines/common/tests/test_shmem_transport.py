@@ -0,0 +1,44 @@
+import pickle
+from multiprocessing import Process
+
+import numpy as np
+
+from baselines.common.vec_env.shmem_transport import ShmemTransport
+
+
+def _write_steps(transport, env_id, nsteps):
+    for t in range(nsteps):
+        transport.write(env_id, np.full(3, env_id * 10 + t), float(t), t % 2 == 1)
+
+
+def test_worker_writes_are_visible_to_owner():
+    transport = ShmemTransport(4, (3,), nslots=2)
+    try:
+        workers = [Process(target=_write_steps, args=(pickle.loads(pickle.dumps(transport)), i, 3))
+                   for i in range(4)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+        # three steps in a ring of two: slot 0 holds step 2, slot 1 holds step 1
+        obs, rews, dones = transport.read(np.arange(4), [0, 0, 0, 0])
+        assert np.shares_memory(obs, transport.obs)
+        assert np.array_equal(obs[:, 0], [2, 12, 22, 32])
+        assert np.array_equal(rews, [2.0] * 4)
+        assert not dones.any()
+
+        obs, rews, dones = transport.read([3, 1], [1, 1])
+        assert np.array_equal(obs[:, 0], [31, 11])
+        assert dones.all()
+    finally:
+        transport.close()
+
+
+def test_only_owner_removes_file():
+    import os
+    transport = ShmemTransport(2, (3,))
+    attached = pickle.loads(pickle.dumps(transport))
+    attached.close()
+    assert os.path.exists(transport.path)
+    transport.close()
+    assert not os.path.exists(transport.path)
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+
+from baselines.common.timing import LatencyHistogram, Timings
+
+
+class _Logger(object):
+    def __init__(self):
+        self.kvs = {}
+
+    def logkv(self, key, val):
+        self.kvs[key] = val
+
+
+def test_spans_add_up_and_reset():
+    timings = Timings()
+    for _ in range(3):
+        with timings.span('env_wait'):
+            time.sleep(0.01)
+    with timings.span('sgd'):
+        pass
+    timings.add('save', 0.5)
+    assert timings.counts == {'env_wait': 3, 'sgd': 1, 'save': 1}
+    assert timings.totals['env_wait'] >= 0.03
+
+    logger = _Logger()
+    items = timings.logkvs(logger)
+    assert [name for name, _ in items] == ['env_wait', 'sgd', 'save']
+    assert logger.kvs['time_save'] == 0.5
+    assert not timings.totals
+
+
+def test_disabled_timings_record_nothing():
+    timings = Timings(enabled=False)
+    with timings.span('policy'):
+        pass
+    timings.add('policy', 1.0)
+    assert timings.span('a') is timings.span('b')
+    assert not timings.totals and not timings.counts
+
+
+def test_latency_percentiles():
+    hist = LatencyHistogram()
+    samples = np.concatenate([np.full(98, 0.01), [0.5, 2.0]])
+    for seconds in samples:
+        hist.add(seconds)
+    assert hist.count == 100
+    assert 0.01 <= hist.percentile(50) < 0.013
+    assert 0.5 <= hist.percentile(99) < 0.65
+    assert hist.percentile(100) == hist.max == 2.0
+
+    # out of range durations land in the outer bins
+    hist.add(1e-6)
+    hist.add(1e3)
+    assert hist.counts[0] == 1 and hist.counts[-1] == 1
+
+    other = LatencyHistogram()
+    other.add(0.01)
+    other.merge(hist)
+    assert other.count == 103 and other.max == 1e3
+    hist.reset()
+    assert hist.count == 0 and hist.percentile(50) == 0.0
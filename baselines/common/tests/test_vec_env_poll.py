@@ -0,0 +1,117 @@
+import numpy as np
+from gym import spaces
+
+from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
+from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv
+from baselines.common.vec_env.vec_frame_stack import VecFrameStack
+
+
+class _CountEnv(object):
+    """
+    observation [env id, steps taken], done every `length` steps
+    """
+    def __init__(self, env_id, length=3):
+        self.env_id = env_id
+        self.length = length
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(2,), dtype=np.float32)
+        self.action_space = spaces.Box(low=-1, high=1, shape=(1,), dtype=np.float32)
+        self.t = 0
+
+    def reset(self):
+        self.t = 0
+        return np.array([self.env_id, self.t], dtype=np.float32)
+
+    def step(self, action):
+        self.t += 1
+        ob = np.array([self.env_id, self.t], dtype=np.float32)
+        return ob, float(action[0]), self.t == self.length, {'t': self.t}
+
+    def close(self):
+        pass
+
+
+def _env_fns(nenvs):
+    return [lambda i=i: _CountEnv(i) for i in range(nenvs)]
+
+
+def _check_poll(venv):
+    venv.reset()
+    venv.step_async(np.array([[1.], [3.]]), [1, 3])
+    env_ids, obs, rews, dones, infos = venv.poll(min_ready=2)
+    assert env_ids.tolist() == [1, 3]
+    assert obs.tolist() == [[1, 1], [3, 1]]
+    assert rews.tolist() == [1, 3]
+    assert not dones.any()
+    assert [info['t'] for info in infos] == [1, 1]
+
+    # envs finish their episode and are reset on their own
+    for _ in range(2):
+        venv.step_async(np.array([[0.]]), [1])
+        env_ids, obs, rews, dones, infos = venv.poll()
+    assert env_ids.tolist() == [1]
+    assert obs.tolist() == [[1, 0]]
+    assert dones.tolist() == [True]
+    assert infos[0]['t'] == 3
+
+    # nothing stepping, nothing to return
+    env_ids, obs, rews, dones, infos = venv.poll(timeout=0)
+    assert len(env_ids) == 0 and len(obs) == 0 and infos == []
+
+
+def test_dummy_vec_env_poll():
+    _check_poll(DummyVecEnv(_env_fns(4)))
+
+
+def test_subproc_vec_env_poll():
+    venv = SubprocVecEnv(_env_fns(4))
+    try:
+        _check_poll(venv)
+    finally:
+        venv.close()
+
+
+def test_subproc_vec_env_poll_timeout():
+    venv = SubprocVecEnv(_env_fns(2))
+    try:
+        venv.reset()
+        venv.step_async(np.array([[1.], [2.]]), [0, 1])
+        # every finished env is returned once, whatever min_ready is
+        seen = []
+        while len(seen) < 2:
+            env_ids, obs, _, _, _ = venv.poll(timeout=1.0)
+            seen += env_ids.tolist()
+            assert obs.tolist() == [[i, 1] for i in env_ids]
+        assert sorted(seen) == [0, 1]
+    finally:
+        venv.close()
+
+
+def test_frame_stack_poll_stacks_only_polled_envs():
+    polled = VecFrameStack(DummyVecEnv(_env_fns(2)), 2)
+    stepped = VecFrameStack(DummyVecEnv(_env_fns(2)), 2)
+    polled.reset()
+    reset_obs = stepped.reset().copy()
+    for _ in range(4):
+        polled.step_async(np.array([[0.]]), [1])
+        env_ids, obs, _, dones, _ = polled.poll()
+        expected, _, expected_dones, _ = stepped.step(np.zeros((2, 1)))
+        assert env_ids.tolist() == [1]
+        assert np.array_equal(obs[0], expected[1])
+        assert dones[0] == expected_dones[1]
+    assert np.array_equal(polled.stackedobs[0], reset_obs[0])
+
+
+def test_step_still_steps_every_env():
+    venv = DummyVecEnv(_env_fns(2))
+    venv.reset()
+    obs, rews, dones, infos = venv.step(np.array([[1.], [2.]]))
+    assert obs.tolist() == [[0, 1], [1, 1]]
+    assert rews.tolist() == [1, 2]
+
+
+def test_subproc_vec_env_poll_shmem():
+    venv = SubprocVecEnv(_env_fns(4), shmem=True, ob_shape=(2,))
+    try:
+        _check_poll(venv)
+    finally:
+        venv.close()
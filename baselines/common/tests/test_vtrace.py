@@ -0,0 +1,42 @@
+import numpy as np
+
+from baselines.common.gae import gae_loop
+from baselines.common.vtrace import vtrace
+
+
+def _rollout(nsteps, nenvs, seed=0):
+    rng = np.random.RandomState(seed)
+    rewards = rng.randn(nsteps, nenvs).astype(np.float32)
+    values = rng.randn(nsteps, nenvs).astype(np.float32)
+    dones = rng.rand(nsteps, nenvs) < 0.1
+    last_values = rng.randn(nenvs).astype(np.float32)
+    last_dones = rng.rand(nenvs) < 0.1
+    neglogpacs = rng.randn(nsteps, nenvs).astype(np.float32)
+    return rewards, values, dones, last_values, last_dones, neglogpacs
+
+
+def test_on_policy_targets_are_gae_returns():
+    rewards, values, dones, last_values, last_dones, neglogpacs = _rollout(50, 4)
+    vs, pg_advs = vtrace(neglogpacs, neglogpacs, rewards, values, dones, last_values, last_dones, 0.99, 0.95)
+    _, returns = gae_loop(rewards, values, dones, last_values, last_dones, 0.99, 0.95)
+    assert np.allclose(vs, returns, atol=1e-5)
+
+    # one step advantage on top of the next target
+    next_vs = np.concatenate([vs[1:], last_values[None]])
+    nextnonterminal = 1.0 - np.concatenate([dones[1:], last_dones[None]])
+    assert np.allclose(pg_advs, rewards + 0.99 * nextnonterminal * next_vs - values, atol=1e-5)
+
+
+def test_importance_weights_are_clipped():
+    rewards, values, dones, last_values, last_dones, neglogpacs = _rollout(20, 3, seed=1)
+    # the target policy is far more likely than the behaviour policy everywhere
+    target = neglogpacs - 5.0
+    vs, pg_advs = vtrace(neglogpacs, target, rewards, values, dones, last_values, last_dones, 0.99)
+    on_vs, on_pg_advs = vtrace(neglogpacs, neglogpacs, rewards, values, dones, last_values, last_dones, 0.99)
+    assert np.allclose(vs, on_vs, atol=1e-5)
+    assert np.allclose(pg_advs, on_pg_advs, atol=1e-5)
+
+    # and far less likely: the updates shrink towards the current values
+    vs, pg_advs = vtrace(neglogpacs, neglogpacs + 20.0, rewards, values, dones, last_values, last_dones, 0.99)
+    assert np.allclose(vs, values, atol=1e-5)
+    assert np.allclose(pg_advs, 0, atol=1e-5)
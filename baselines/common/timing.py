@@ -0,0 +1,120 @@
+"""
+Wall-clock instrumentation for the rollout/learn cycle.
+
+Timings adds up named spans, LatencyHistogram counts durations in
+logarithmic bins. Both are meant to be read and reset once per log
+interval; a disabled Timings hands out a shared no-op span.
+"""
+import bisect
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class _Span(object):
+    __slots__ = ('totals', 'counts', 'name', 'tstart')
+
+    def __init__(self, totals, counts, name):
+        self.totals = totals
+        self.counts = counts
+        self.name = name
+
+    def __enter__(self):
+        self.tstart = time.perf_counter()
+        return self
+
+    def __exit__(self, *_args):
+        self.totals[self.name] = self.totals.get(self.name, 0.0) + time.perf_counter() - self.tstart
+        self.counts[self.name] = self.counts.get(self.name, 0) + 1
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Timings(object):
+    """
+    Seconds spent in named spans:
+
+        with timings.span('sgd'):
+            ...
+
+    Spans of the same name add up, in the order they were first entered.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.totals = OrderedDict()
+        self.counts = OrderedDict()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self.totals, self.counts, name)
+
+    def add(self, name, seconds):
+        if self.enabled:
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+
+    def logkvs(self, logger, prefix='time_'):
+        """
+        log the totals since the last reset and reset them, returns the
+        logged (name, seconds) pairs
+        """
+        items = list(self.totals.items())
+        for name, seconds in items:
+            logger.logkv(prefix + name, seconds)
+        self.reset()
+        return items
+
+
+class LatencyHistogram(object):
+    """
+    Counts of durations in log spaced bins between `low` and `high` seconds,
+    the first and last bin also hold everything below and above.
+    """
+    def __init__(self, low=1e-4, high=100.0, nbins=60):
+        self.edges = np.geomspace(low, high, nbins + 1)
+        self._edges = self.edges[1:-1].tolist()
+        self.counts = np.zeros(nbins, dtype=np.int64)
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect(self._edges, seconds)] += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def percentile(self, q):
+        """
+        upper edge of the bin holding the q-th percentile, 0 when empty
+        """
+        total = self.count
+        if total == 0:
+            return 0.0
+        k = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * total))
+        return min(float(self.edges[k + 1]), self.max)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.counts[:] = 0
+        self.max = 0.0
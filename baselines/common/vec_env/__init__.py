@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import numpy as np
 from baselines import logger
 
 class AlreadySteppingError(Exception):
@@ -73,6 +74,22 @@ class VecEnv(ABC):
         """
         pass
 
+    def poll(self, min_ready=1, timeout=None):
+        """
+        Wait until at least min_ready of the environments stepped with
+        step_async(actions, env_ids) are done, or timeout seconds passed.
+
+        Returns (env_ids, obs, rews, dones, infos) for the environments that
+        finished, every array aligned with env_ids. DummyVecEnv steps its
+        environments when polled, SubprocVecEnv and RemoteVecEnv step them
+        in parallel.
+
+        By default the environments only step together: this waits for the
+        step_async(actions) of all of them and returns every env id.
+        """
+        obs, rews, dones, infos = self.step_wait()
+        return np.arange(self.num_envs), obs, rews, dones, infos
+
     def step(self, actions):
         self.step_async(actions)
         return self.step_wait()
@@ -95,8 +112,14 @@ class VecEnvWrapper(VecEnv):
             observation_space=observation_space or venv.observation_space, 
             action_space=action_space or venv.action_space)
 
-    def step_async(self, actions):
-        self.venv.step_async(actions)
+    def step_async(self, actions, env_ids=None):
+        if env_ids is None:
+            self.venv.step_async(actions)
+        else:
+            self.venv.step_async(actions, env_ids)
+
+    def poll(self, min_ready=1, timeout=None):
+        return self.venv.poll(min_ready, timeout)
 
     @abstractmethod
     def reset(self):
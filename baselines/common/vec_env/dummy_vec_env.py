@@ -28,9 +28,16 @@ class DummyVecEnv(VecEnv):
         self.buf_rews  = np.zeros((self.num_envs,), dtype=np.float32)
         self.buf_infos = [{} for _ in range(self.num_envs)]
         self.actions = None
+        # env id -> action of the envs stepped with step_async(actions, env_ids)
+        self.pending = OrderedDict()
 
-    def step_async(self, actions):
-        self.actions = actions
+    def step_async(self, actions, env_ids=None):
+        if env_ids is None:
+            self.actions = actions
+            return
+        for e, action in zip(env_ids, actions):
+            assert e not in self.pending, 'env %d is already stepping' % e
+            self.pending[e] = action
 
     def step_wait(self):
         for e in range(self.num_envs):
@@ -41,6 +48,28 @@ class DummyVecEnv(VecEnv):
         return (self._obs_from_buf(), np.copy(self.buf_rews), np.copy(self.buf_dones),
                 self.buf_infos.copy())
 
+    def poll(self, min_ready=1, timeout=None):
+        """
+        Step the envs given to step_async(actions, env_ids) one after the
+        other and return all of them, see VecEnv.poll
+        """
+        env_ids = np.array(list(self.pending), dtype=np.int64)
+        rews = np.zeros((len(env_ids),), dtype=np.float32)
+        dones = np.zeros((len(env_ids),), dtype=np.bool_)
+        infos = []
+        for k, e in enumerate(env_ids):
+            obs, rews[k], dones[k], info = self.envs[e].step(self.pending[e])
+            if dones[k]:
+                obs = self.envs[e].reset()
+            self._save_obs(e, obs)
+            infos.append(info)
+        self.pending = OrderedDict()
+        if self.keys == [None]:
+            obs = self.buf_obs[None][env_ids]
+        else:
+            obs = {k: self.buf_obs[k][env_ids] for k in self.keys}
+        return env_ids, obs, rews, dones, infos
+
     def reset(self):
         for e in range(self.num_envs):
             obs = self.envs[e].reset()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import numpy as np
+
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class ShmemTransport(object):
+    """
+    Ring of `nslots` shared (nenvs, *ob_shape) float32 observation blocks,
+    with one reward and one done column per block, backed by a memory-mapped
+    file in /dev/shm.
+
+    Workers write their step results in place and only send back the slot
+    they used, the trainer reads the rows without unpickling anything. A slot
+    is rewritten `nslots` steps later, so results must be consumed (or
+    copied) before that.
+
+    The object pickles to its file path, so it can be handed to subprocesses
+    and ray actors on the same machine; only the creating process removes
+    the file on close().
+    """
+    def __init__(self, nenvs, ob_shape, nslots=2, path=None):
+        self.nenvs = nenvs
+        self.ob_shape = tuple(ob_shape)
+        self.nslots = nslots
+        self._owner = path is None
+        if path is None:
+            shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            fd, path = tempfile.mkstemp(prefix='vecenv-', dir=shm_dir)
+            os.ftruncate(fd, self._nbytes())
+            os.close(fd)
+        self.path = path
+        self._attach()
+
+    def _layout(self):
+        obs_shape = (self.nslots, self.nenvs) + self.ob_shape
+        rews_offset = _align(int(np.prod(obs_shape)) * 4)
+        dones_offset = _align(rews_offset + self.nslots * self.nenvs * 8)
+        return obs_shape, rews_offset, dones_offset
+
+    def _nbytes(self):
+        _, _, dones_offset = self._layout()
+        return dones_offset + self.nslots * self.nenvs
+
+    def _attach(self):
+        obs_shape, rews_offset, dones_offset = self._layout()
+        self.obs = np.memmap(self.path, dtype=np.float32, mode='r+', shape=obs_shape)
+        self.rews = np.memmap(self.path, dtype=np.float64, mode='r+', offset=rews_offset,
+                              shape=(self.nslots, self.nenvs))
+        self.dones = np.memmap(self.path, dtype=np.bool_, mode='r+', offset=dones_offset,
+                               shape=(self.nslots, self.nenvs))
+        # next slot to write, only meaningful for the envs this process writes
+        self._next_slot = np.zeros(self.nenvs, dtype=np.int64)
+
+    def __getstate__(self):
+        return {'nenvs': self.nenvs, 'ob_shape': self.ob_shape, 'nslots': self.nslots, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._owner = False
+        self._attach()
+
+    def write(self, env_id, ob, rew, done):
+        """
+        worker side: store one step result of env_id, returns the slot used
+        """
+        slot = self._next_slot[env_id]
+        self._next_slot[env_id] = (slot + 1) % self.nslots
+        self.obs[slot, env_id] = ob
+        self.rews[slot, env_id] = rew
+        self.dones[slot, env_id] = done
+        return int(slot)
+
+    def view(self, slot):
+        """
+        (obs, rews, dones) views of a whole slot
+        """
+        return self.obs[slot], self.rews[slot], self.dones[slot]
+
+    def read(self, env_ids, slots):
+        """
+        (obs, rews, dones) of env_ids[k] written in slots[k]. When all envs
+        wrote the same slot in order this is a view, otherwise the rows are
+        gathered into new arrays.
+        """
+        env_ids = np.asarray(env_ids, dtype=np.int64)
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(env_ids) == self.nenvs and np.all(slots == slots[0]) and np.array_equal(env_ids, np.arange(self.nenvs)):
+            return self.view(slots[0])
+        return self.obs[slots, env_ids], self.rews[slots, env_ids], self.dones[slots, env_ids]
+
+    def close(self):
+        # the mapping itself goes away with the last view still pointing into it
+        self.obs = self.rews = self.dones = None
+        if self._owner and os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,9 +1,13 @@
+import time
+from collections import OrderedDict
 import numpy as np
 from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
 from baselines.common.vec_env import VecEnv, CloudpickleWrapper
+from baselines.common.vec_env.shmem_transport import ShmemTransport
 
 
-def worker(remote, parent_remote, env_fn_wrapper):
+def worker(remote, parent_remote, env_fn_wrapper, env_id=None, transport=None):
     parent_remote.close()
     env = env_fn_wrapper.x()
     while True:
@@ -12,7 +16,11 @@ def worker(remote, parent_remote, env_fn_wrapper):
             ob, reward, done, info = env.step(data)
             if done:
                 ob = env.reset()
-            remote.send((ob, reward, done, info))
+            if transport is None:
+                remote.send((ob, reward, done, info))
+            else:
+                # the result is in shared memory, only tell which slot holds it
+                remote.send((transport.write(env_id, ob, reward, done), info))
         elif cmd == 'reset':
             ob = env.reset()
             remote.send(ob)
@@ -29,16 +37,21 @@ def worker(remote, parent_remote, env_fn_wrapper):
 
 
 class SubprocVecEnv(VecEnv):
-    def __init__(self, env_fns, spaces=None):
+    def __init__(self, env_fns, spaces=None, shmem=False, ob_shape=None):
         """
         envs: list of gym environments to run in subprocesses
+        shmem: return step results through a ShmemTransport instead of pickling
+            them through the pipes, ob_shape must be given in that case
         """
         self.waiting = False
         self.closed = False
+        # remote -> env id of the envs stepped with step_async(actions, env_ids)
+        self.pending = OrderedDict()
         nenvs = len(env_fns)
+        self.transport = ShmemTransport(nenvs, ob_shape) if shmem else None
         self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(nenvs)])
-        self.ps = [Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
-            for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
+        self.ps = [Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn), i, self.transport))
+            for i, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns))]
         for p in self.ps:
             p.daemon = True # if the main process crashes, we should not cause things to hang
             p.start()
@@ -49,14 +62,56 @@ class SubprocVecEnv(VecEnv):
         observation_space, action_space = self.remotes[0].recv()
         VecEnv.__init__(self, len(env_fns), observation_space, action_space)
 
-    def step_async(self, actions):
-        for remote, action in zip(self.remotes, actions):
+    def step_async(self, actions, env_ids=None):
+        if env_ids is None:
+            for remote, action in zip(self.remotes, actions):
+                remote.send(('step', action))
+            self.waiting = True
+            return
+        for i, action in zip(env_ids, actions):
+            remote = self.remotes[i]
+            assert remote not in self.pending, 'env %d is already stepping' % i
             remote.send(('step', action))
-        self.waiting = True
+            self.pending[remote] = i
+
+    def poll(self, min_ready=1, timeout=None):
+        """
+        Wait until at least min_ready of the envs stepped with
+        step_async(actions, env_ids) finished, or timeout seconds passed,
+        and return every one that did, see VecEnv.poll
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        min_ready = min(min_ready, len(self.pending))
+        ready = []
+        while True:
+            stepping = [remote for remote in self.pending if remote not in ready]
+            if not stepping:
+                break
+            wait_time = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+            ready += wait(stepping, wait_time)
+            if len(ready) >= min_ready or (deadline is not None and time.perf_counter() >= deadline):
+                break
+        # in env order, like step_wait
+        ready.sort(key=self.pending.get)
+        env_ids = np.array([self.pending.pop(remote) for remote in ready], dtype=np.int64)
+        results = [remote.recv() for remote in ready]
+        if not results:
+            obs = np.zeros((0,) + self.observation_space.shape, dtype=self.observation_space.dtype)
+            return env_ids, obs, np.zeros(0), np.zeros(0, dtype=np.bool_), []
+        if self.transport is not None:
+            slots, infos = zip(*results)
+            obs, rews, dones = self.transport.read(env_ids, slots)
+            return env_ids, obs, rews, dones, list(infos)
+        obs, rews, dones, infos = zip(*results)
+        return env_ids, np.stack(obs), np.stack(rews), np.stack(dones), list(infos)
 
     def step_wait(self):
         results = [remote.recv() for remote in self.remotes]
         self.waiting = False
+        if self.transport is not None:
+            slots, infos = zip(*results)
+            obs, rews, dones = self.transport.read(np.arange(self.num_envs), slots)
+            return obs, rews, dones, infos
         obs, rews, dones, infos = zip(*results)
         return np.stack(obs), np.stack(rews), np.stack(dones), infos
 
@@ -76,8 +131,12 @@ class SubprocVecEnv(VecEnv):
         if self.waiting:
             for remote in self.remotes:            
                 remote.recv()
+        for remote in self.pending:
+            remote.recv()
         for remote in self.remotes:
             remote.send(('close', None))
         for p in self.ps:
             p.join()
+        if self.transport is not None:
+            self.transport.close()
         self.closed = True
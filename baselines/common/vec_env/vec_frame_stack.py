@@ -25,6 +25,19 @@ class VecFrameStack(VecEnvWrapper):
         self.stackedobs[..., -obs.shape[-1]:] = obs
         return self.stackedobs, rews, news, infos
 
+    def poll(self, min_ready=1, timeout=None):
+        """
+        Stacked results of the environments that finished, see VecEnv.poll
+        """
+        env_ids, obs, rews, news, infos = self.venv.poll(min_ready, timeout)
+        if len(env_ids) == 0:
+            return env_ids, obs, rews, news, infos
+        stacked = np.roll(self.stackedobs[env_ids], shift=-1, axis=-1)
+        stacked[news] = 0
+        stacked[..., -obs.shape[-1]:] = obs
+        self.stackedobs[env_ids] = stacked
+        return env_ids, stacked.copy(), rews, news, infos
+
     def reset(self):
         """
         Reset all environments
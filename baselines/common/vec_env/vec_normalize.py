@@ -1,21 +1,34 @@
 from baselines.common.vec_env import VecEnvWrapper
 from baselines.common.running_mean_std import RunningMeanStd
 import numpy as np
-import copy
 
 class VecNormalize(VecEnvWrapper):
     """
     Vectorized environment base class
+
+    Observations are normalized to float32, except for the last
+    `npassthrough` columns (the target velocity), which are passed through.
+
+    With frozen=True the statistics are read-only: observations are
+    normalized with a scale and offset precomputed from ob_rms, which is
+    neither updated nor are returns accumulated. For evaluation, set ob_rms
+    from a checkpoint.
     """
-    def __init__(self, venv, ob=True, ret=True, clipob=10., cliprew=10., gamma=0.99, epsilon=1e-8):
+    def __init__(self, venv, ob=True, ret=True, clipob=10., cliprew=10., gamma=0.99, epsilon=1e-8,
+                 npassthrough=6, frozen=False):
         VecEnvWrapper.__init__(self, venv)
         self.ob_rms = RunningMeanStd(shape=self.observation_space.shape) if ob else None
+        self.passthrough = np.zeros(self.observation_space.shape, dtype=np.bool_)
+        if npassthrough:
+            self.passthrough[..., -npassthrough:] = True
         self.ret_rms = None
         self.clipob = clipob
         self.cliprew = cliprew
         self.ret = np.zeros(self.num_envs)
         self.gamma = gamma
         self.epsilon = epsilon
+        self.frozen = frozen
+        self._frozen_rms = None
 
     def step_wait(self):
         """
@@ -25,6 +38,8 @@ class VecNormalize(VecEnvWrapper):
         where 'news' is a boolean vector indicating whether each element is new.
         """
         obs, rews, news, infos = self.venv.step_wait()
+        if self.frozen:
+            return self._obfilt(obs), rews, news, infos
         self.ret = self.ret * self.gamma * (1 - news) + rews
         obs = self._obfilt(obs)
         if self.ret_rms:
@@ -32,14 +47,35 @@ class VecNormalize(VecEnvWrapper):
             rews = np.clip(rews / np.sqrt(self.ret_rms.var + self.epsilon), -self.cliprew, self.cliprew)
         return obs, rews, news, infos
 
+    def poll(self, min_ready=1, timeout=None):
+        """
+        Normalized results of the environments that finished, see VecEnv.poll
+        """
+        env_ids, obs, rews, news, infos = self.venv.poll(min_ready, timeout)
+        if len(env_ids) == 0:
+            return env_ids, obs, rews, news, infos
+        if self.frozen:
+            return env_ids, self._obfilt(obs), rews, news, infos
+        self.ret[env_ids] = self.ret[env_ids] * self.gamma * (1 - news) + rews
+        obs = self._obfilt(obs)
+        if self.ret_rms:
+            self.ret_rms.update(self.ret[env_ids])
+            rews = np.clip(rews / np.sqrt(self.ret_rms.var + self.epsilon), -self.cliprew, self.cliprew)
+        return env_ids, obs, rews, news, infos
+
     def _obfilt(self, obs):
-        if self.ob_rms:
-            tmp = copy.deepcopy(obs)
+        if self.ob_rms and self.frozen:
+            if self._frozen_rms is not self.ob_rms:
+                # ob_rms was (re)assigned, e.g. loaded with a checkpoint
+                self._frozen_rms = self.ob_rms
+                self._scale, self._offset, self._low, self._high = self.ob_rms.affine(
+                    self.clipob, self.epsilon, self.passthrough)
+            out = np.multiply(obs, self._scale, dtype=np.float32)
+            out += self._offset
+            return np.clip(out, self._low, self._high, out=out)
+        elif self.ob_rms:
             self.ob_rms.update(obs)
-            obs = np.clip((obs - self.ob_rms.mean) / np.sqrt(self.ob_rms.var + self.epsilon), -self.clipob, self.clipob)
-            for i in range(len(tmp)):
-                obs[i][-6:] = tmp[i][-6:]
-            return obs
+            return self.ob_rms.normalize(obs, clip=self.clipob, epsilon=self.epsilon, passthrough=self.passthrough)
         else:
             return obs
 
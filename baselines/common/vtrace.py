@@ -0,0 +1,45 @@
+"""
+V-trace off-policy targets (Espeholt et al. 2018) over a (nsteps, nenvs) block.
+
+Arrays are time-major like in baselines.common.gae, dones[t] is "episode
+started at t" and last_values / last_dones bootstrap after the last step.
+With on-policy data (equal neglogps) the value targets are the GAE returns.
+"""
+import numpy as np
+
+
+def vtrace(behaviour_neglogpacs, target_neglogpacs, rewards, values, dones, last_values, last_dones,
+           gamma, lam=1.0, clip_rho=1.0, clip_pg_rho=1.0, clip_c=1.0):
+    """
+    Returns (vs, pg_advs): the value targets and the policy gradient
+    advantages, both float32 arrays shaped like rewards.
+
+    The importance weights pi/mu are clipped at clip_rho for the temporal
+    differences, at clip_pg_rho for the advantages and at clip_c (times
+    lam) for the traces.
+    """
+    nsteps = rewards.shape[0]
+    log_rhos = np.asarray(behaviour_neglogpacs, dtype=np.float64) - target_neglogpacs
+    rhos = np.exp(log_rhos)
+    clipped_rhos = np.minimum(clip_rho, rhos)
+    cs = lam * np.minimum(clip_c, rhos)
+
+    nextnonterminal = np.empty(rewards.shape, dtype=np.float64)
+    np.subtract(1.0, dones[1:], out=nextnonterminal[:-1])
+    np.subtract(1.0, last_dones, out=nextnonterminal[-1])
+    values = np.asarray(values, dtype=np.float64)
+    nextvalues = np.concatenate([values[1:], np.asarray(last_values, dtype=np.float64)[None]])
+    discounts = gamma * nextnonterminal
+    deltas = clipped_rhos * (rewards + discounts * nextvalues - values)
+
+    # vs_t - V(x_t) = delta_t + discount_t * c_t * (vs_{t+1} - V(x_{t+1}))
+    vs_minus_v = np.zeros_like(values)
+    acc = np.zeros(values.shape[1:], dtype=np.float64)
+    for t in reversed(range(nsteps)):
+        acc = deltas[t] + discounts[t] * cs[t] * acc
+        vs_minus_v[t] = acc
+    vs = values + vs_minus_v
+
+    next_vs = np.concatenate([vs[1:], np.asarray(last_values, dtype=np.float64)[None]])
+    pg_advs = np.minimum(clip_pg_rho, rhos) * (rewards + discounts * next_vs - values)
+    return vs.astype(np.float32), pg_advs.astype(np.float32)
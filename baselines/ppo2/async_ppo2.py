@@ -0,0 +1,262 @@
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+import numpy as np
+import tensorflow as tf
+from baselines import logger
+from baselines.common import checkpoint, explained_variance
+from baselines.common.minibatch_pipeline import MinibatchPipeline
+from baselines.common.vtrace import vtrace
+from baselines.common.timing import Timings
+from baselines.ppo2.ppo2 import (Model, Runner, constfn, load_checkpoint, log_actor_health, log_timings,
+                               save_checkpoint, safemean)
+
+# env-major (nenvs, nsteps, ...) trajectory block, `version` is the oldest
+# policy snapshot that acted in it
+Trajectories = namedtuple('Trajectories', ['obs', 'actions', 'rewards', 'values', 'neglogpacs', 'dones',
+                                           'last_obs', 'last_dones', 'version'])
+
+
+class PolicySnapshot(object):
+    """
+    Copy of the model parameters the actors act with. The learner refreshes
+    it with sync() after its updates, in between the actors use a stale
+    policy.
+    """
+    def __init__(self, policy, model, ob_space, ac_space):
+        sess = tf.get_default_session()
+        with tf.variable_scope('snapshot'):
+            self.act_model = policy(sess, ob_space, ac_space, None, 1, reuse=False)
+        params = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='snapshot')
+        assert len(params) == len(model.params)
+        self._sync = tf.group(*[p.assign(src) for p, src in zip(params, model.params)])
+        sess.run(tf.variables_initializer(params))
+        self.sess = sess
+        self.version = 0
+        self._lock = threading.Lock()
+        self.sync(0)
+
+    def sync(self, version):
+        with self._lock:
+            self.sess.run(self._sync)
+            self.version = version
+
+    def step(self, obs):
+        with self._lock:
+            actions, values, _, neglogpacs = self.act_model.step(obs)
+            return actions, values, neglogpacs, self.version
+
+
+class AsyncActor(Runner):
+    """
+    Keeps every env stepping with a PolicySnapshot in a background thread.
+    Envs never wait for each other: as soon as one has nsteps transitions
+    its row is cut out, and every `batch_envs` rows are pushed to a bounded
+    queue as Trajectories. The thread only stalls when the learner falls
+    `queue_size` batches behind, that time is counted in `idle_time`.
+    """
+    def __init__(self, *, env, model, snapshot, nsteps, batch_envs, queue_size, writer, timings=None):
+        super().__init__(env=env, model=model, nsteps=nsteps, gamma=0.0, lam=0.0, writer=writer, timings=timings)
+        self.snapshot = snapshot
+        self.batch_envs = batch_envs
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.epinfos = deque()
+        self.idle_time = 0.0
+        self.segment_version = np.zeros(self.nenvs, dtype=np.int64)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._act, name='async-actor', daemon=True)
+        self.error = None
+
+    def start(self):
+        self.buffer.reset()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def get(self):
+        """
+        next Trajectories batch, blocks until the actor thread delivers one
+        """
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                return self.queue.get(timeout=1.0)
+            except queue.Empty:
+                pass
+
+    def _act(self):
+        try:
+            self._loop()
+        except Exception as e:  # pylint: disable=W0703
+            self.error = e
+
+    def _loop(self):
+        buffer = self.buffer
+        rows = []
+        while not self._stop.is_set():
+            ready = [i for i in range(self.nenvs) if i not in self.in_flight and buffer.dispatched[i] < self.nsteps]
+            if ready:
+                with self.timings.span('policy'):
+                    actions, values, neglogpacs, version = self.snapshot.step(self.obs[ready])
+                self.segment_version[[i for i in ready if buffer.dispatched[i] == 0]] = version
+                with self.timings.span('buffer'):
+                    buffer.add_dispatch(ready, self.obs[ready], values, neglogpacs, self.dones[ready])
+                self._dispatch(ready, actions)
+
+            env_ids = self._collect(self._poll(timeout=0.1), self.epinfos)
+            with self.timings.span('buffer'):
+                for i in env_ids:
+                    if buffer.completed[i] >= self.nsteps:
+                        rows.append((i, buffer.take([i]), self.obs[i].copy(), self.dones[i]))
+
+            while len(rows) >= self.batch_envs:
+                batch, rows = rows[:self.batch_envs], rows[self.batch_envs:]
+                self._put(self._stack(batch))
+
+    def _stack(self, batch):
+        env_ids = [i for i, _, _, _ in batch]
+        fields = [np.concatenate(field) for field in zip(*[row for _, row, _, _ in batch])]
+        last_obs = np.stack([ob for _, _, ob, _ in batch])
+        last_dones = np.array([done for _, _, _, done in batch], dtype=np.bool_)
+        return Trajectories(*fields, last_obs, last_dones, int(self.segment_version[env_ids].min()))
+
+    def _put(self, batch):
+        tstart = time.time()
+        while not self._stop.is_set():
+            try:
+                self.queue.put(batch, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.idle_time += time.time() - tstart
+
+
+def learn(*, policy, env, nsteps, total_timesteps, ent_coef, lr,
+            vf_coef=0.5,  max_grad_norm=0.5, gamma=0.99, lam=0.95,
+            log_interval=10, nminibatches=4, noptepochs=4, cliprange=0.2,
+            save_interval=0, load_path=None, num_casks=0, queue_size=2,
+            clip_rho=1.0, clip_c=1.0, in_graph_update=False, timing=False, keep_checkpoints=None):
+    """
+    Asynchronous PPO: actors keep stepping with a policy snapshot while the
+    learner optimizes. Every update consumes one (num_envs - num_casks) x
+    nsteps batch, its targets and advantages are V-trace corrected for the
+    policy lag and the PPO ratio is taken against the acting policy.
+    """
+    if isinstance(lr, float): lr = constfn(lr)
+    else: assert callable(lr)
+    if isinstance(cliprange, float): cliprange = constfn(cliprange)
+    else: assert callable(cliprange)
+    total_timesteps = int(total_timesteps)
+
+    batch_envs = env.num_envs - num_casks
+    ob_space = env.observation_space
+    ac_space = env.action_space
+    nbatch = batch_envs * nsteps
+    assert nbatch % nminibatches == 0
+    nbatch_train = nbatch // nminibatches
+
+    model = Model(policy=policy, ob_space=ob_space, ac_space=ac_space, nbatch_act=None, nbatch_train=nbatch_train,
+                  nsteps=nsteps, ent_coef=ent_coef, vf_coef=vf_coef, max_grad_norm=max_grad_norm,
+                  noptepochs=noptepochs if in_graph_update else None, nminibatches=nminibatches)
+    # a single file checkpoint resumes its update counter
+    meta = load_checkpoint(model, env, load_path) if load_path is not None else {}
+    start = meta.get('update', 0)
+    snapshot = PolicySnapshot(policy, model, ob_space, ac_space)
+    if start:
+        snapshot.sync(start)
+    # tensorboard
+    writer = tf.summary.FileWriter(logger.get_dir(), tf.get_default_session().graph)
+    timings = Timings(enabled=timing)
+    actor = AsyncActor(env=env, model=model, snapshot=snapshot, nsteps=nsteps, batch_envs=batch_envs,
+                       queue_size=queue_size, writer=writer, timings=timings)
+    actor.start()
+
+    ckpt_writer = checkpoint.CheckpointWriter(keep_last=keep_checkpoints) if save_interval and logger.get_dir() else None
+
+    epinfobuf = deque(maxlen=100)
+    tfirststart = tlast = time.time()
+    idle_last = 0.0
+    lags = []
+    pipeline = MinibatchPipeline(nbatch, nbatch_train)
+
+    nupdates = total_timesteps//nbatch
+    for update in range(start + 1, nupdates+1):
+        tstart = time.time()
+        frac = 1.0 - (update - 1.0) / nupdates
+        lrnow = lr(frac)
+        cliprangenow = cliprange(frac)
+        batch = actor.get()
+        # number of learner updates the oldest acting policy is behind
+        lags.append(update - 1 - batch.version)
+        while actor.epinfos:
+            epinfobuf.append(actor.epinfos.popleft())
+
+        obs = batch.obs.reshape((nbatch,) + batch.obs.shape[2:])
+        actions = batch.actions.reshape((nbatch,) + batch.actions.shape[2:])
+        masks = batch.dones.reshape(nbatch)
+        neglogpacs = batch.neglogpacs.reshape(nbatch)
+        values, target_neglogpacs = model.evaluate(obs, actions)
+        last_values = model.value(batch.last_obs)
+        vs, pg_advs = vtrace(batch.neglogpacs.T, target_neglogpacs.reshape(batch_envs, nsteps).T,
+                             batch.rewards.T, values.reshape(batch_envs, nsteps).T, batch.dones.T,
+                             last_values, batch.last_dones, gamma, lam, clip_rho=clip_rho, clip_c=clip_c)
+        returns = vs.T.reshape(nbatch)
+        advs = pg_advs.T.reshape(nbatch)
+
+        mblossvals = []
+        with timings.span('sgd'):
+            if in_graph_update:
+                mblossvals.append(model.update(lrnow, cliprangenow, obs, returns, actions, values, neglogpacs,
+                                               advs=advs))
+            else:
+                for *slices, mbadvs in pipeline.minibatches(noptepochs, obs, returns, masks, actions, values,
+                                                            neglogpacs, advs=advs):
+                    mblossvals.append(model.train(lrnow, cliprangenow, *slices, advs=mbadvs))
+        snapshot.sync(update)
+
+        lossvals = np.mean(mblossvals, axis=0)
+        tnow = time.time()
+        fps = int(nbatch / (tnow - tstart))
+        if update % log_interval == 0 or update == start + 1:
+            ev = explained_variance(values, returns)
+            idle = (actor.idle_time - idle_last) / (tnow - tlast)
+            idle_last, tlast = actor.idle_time, tnow
+            logger.logkv("nupdates", update)
+            logger.logkv("total_timesteps", update*nbatch)
+            logger.logkv("fps", fps)
+            logger.logkv("explained_variance", float(ev))
+            logger.logkv('eprewmean', safemean([epinfo['r'] for epinfo in epinfobuf]))
+            logger.logkv('eplenmean', safemean([epinfo['l'] for epinfo in epinfobuf]))
+            logger.logkv('epsrewmean', safemean([epinfo['sr'] for epinfo in epinfobuf]))
+            logger.logkv('policy_lag', safemean(lags))
+            logger.logkv('policy_lag_max', max(lags))
+            logger.logkv('actor_idle_fraction', idle)
+            logger.logkv('queue_size', actor.queue.qsize())
+            logger.logkv('time_elapsed', tnow - tfirststart)
+            for (lossval, lossname) in zip(lossvals, model.loss_names):
+                logger.logkv(lossname, lossval)
+            # tensorboard
+            summary = tf.Summary()
+            log_timings(timings, env, summary)
+            log_actor_health(env, summary)
+            logger.dumpkvs()
+            summary.value.add(tag='iteration/reward_mean', simple_value=safemean([epinfo['r'] for epinfo in epinfobuf]))
+            summary.value.add(tag='iteration/length_mean', simple_value=safemean([epinfo['l'] for epinfo in epinfobuf]))
+            summary.value.add(tag='iteration/shaped_reward_mean', simple_value=safemean([epinfo['sr'] for epinfo in epinfobuf]))
+            summary.value.add(tag='iteration/fps', simple_value=fps)
+            summary.value.add(tag='async/policy_lag', simple_value=safemean(lags))
+            summary.value.add(tag='async/actor_idle_fraction', simple_value=idle)
+            with timings.span('tensorboard'):
+                writer.add_summary(summary, update)
+            lags = []
+        if save_interval and (update % save_interval == 0 or update == start + 1) and logger.get_dir():
+            with timings.span('save'):
+                save_checkpoint(model, env, update, update * nbatch, writer=ckpt_writer)
+    actor.stop()
+    if ckpt_writer is not None:
+        ckpt_writer.close()
+    env.close()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the gae engines on synthetic rollouts.
+
+    python -m baselines.ppo2.bench_gae --num-envs=24 --num-steps 1000 10000 100000
+"""
+import argparse
+import timeit
+import numpy as np
+from baselines.common.gae import GAE_ENGINES, numba
+
+
+def make_rollout(nsteps, nenvs, seed=0):
+    rng = np.random.RandomState(seed)
+    rewards = rng.randn(nsteps, nenvs).astype(np.float32)
+    values = rng.randn(nsteps, nenvs).astype(np.float32)
+    dones = rng.rand(nsteps, nenvs) < 0.01
+    last_values = rng.randn(nenvs).astype(np.float32)
+    last_dones = np.zeros(nenvs, dtype=np.bool_)
+    return rewards, values, dones, last_values, last_dones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GAE engine micro-benchmark')
+    parser.add_argument('--num-envs', default=24, type=int, help='number of envs per rollout')
+    parser.add_argument('--num-steps', default=[1000, 10000, 100000], type=int, nargs='+', help='rollout lengths')
+    parser.add_argument('--repeat', default=5, type=int, help='number of timed runs, the best one is reported')
+    args = parser.parse_args()
+
+    engines = [name for name in ('loop', 'numpy', 'numba') if name != 'numba' or numba is not None]
+    print('%10s %10s %12s %10s' % ('nsteps', 'engine', 'best (ms)', 'speedup'))
+    for nsteps in args.num_steps:
+        rollout = make_rollout(nsteps, args.num_envs)
+        advs = np.zeros_like(rollout[0])
+        returns = np.zeros_like(rollout[0])
+        baseline = None
+        for name in engines:
+            engine = GAE_ENGINES[name]
+            # warm up, this also triggers the numba compilation
+            engine(*rollout, 0.99, 0.95, advs=advs, returns=returns)
+            best = min(timeit.repeat(lambda: engine(*rollout, 0.99, 0.95, advs=advs, returns=returns),
+                                     repeat=args.repeat, number=1))
+            baseline = baseline or best
+            print('%10d %10s %12.3f %9.1fx' % (nsteps, name, best * 1e3, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
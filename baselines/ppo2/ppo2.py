@@ -7,18 +7,31 @@ import tensorflow as tf
 from baselines import logger
 from collections import deque
 from baselines.common import explained_variance
+from baselines.common.cask_controller import CaskController
+from baselines.common.gae import get_gae_engine
+from baselines.common.inference_server import InferenceServer
+from baselines.common.minibatch_pipeline import MinibatchPipeline
+from baselines.common.rollout_buffer import RolloutBuffer
 from baselines.common.runners import AbstractEnvRunner
+from baselines.common.vec_env import VecEnv
+from baselines.common.timing import LatencyHistogram, Timings
 
 import pickle
-import copy
+from collections import OrderedDict
+from baselines.common import checkpoint
 
 class Model(object):
     def __init__(self, *, policy, ob_space, ac_space, nbatch_act, nbatch_train,
-                nsteps, ent_coef, vf_coef, max_grad_norm):
+                nsteps, ent_coef, vf_coef, max_grad_norm, noptepochs=None, nminibatches=None):
         sess = tf.get_default_session()
 
-        act_model = policy(sess, ob_space, ac_space, nbatch_act, 1, reuse=False)
-        train_model = policy(sess, ob_space, ac_space, nbatch_train, nsteps, reuse=True)
+        # noptepochs builds the in-graph update, it reads the parameters inside
+        # a tf.while_loop where only resource variables are read afresh
+        in_graph_update = noptepochs is not None
+        with tf.variable_scope(tf.get_variable_scope(), use_resource=in_graph_update or None,
+                               auxiliary_name_scope=False):
+            act_model = policy(sess, ob_space, ac_space, nbatch_act, 1, reuse=False)
+            train_model = policy(sess, ob_space, ac_space, nbatch_train, nsteps, reuse=True)
 
         A = train_model.pdtype.sample_placeholder([None])
         ADV = tf.placeholder(tf.float32, [None])
@@ -28,44 +41,111 @@ class Model(object):
         LR = tf.placeholder(tf.float32, [])
         CLIPRANGE = tf.placeholder(tf.float32, [])
 
-        neglogpac = train_model.pd.neglogp(A)
-        entropy = tf.reduce_mean(train_model.pd.entropy())
-
-        vpred = train_model.vf
-        vpredclipped = OLDVPRED + tf.clip_by_value(train_model.vf - OLDVPRED, - CLIPRANGE, CLIPRANGE)
-        vf_losses1 = tf.square(vpred - R)
-        vf_losses2 = tf.square(vpredclipped - R)
-        vf_loss = .5 * tf.reduce_mean(tf.maximum(vf_losses1, vf_losses2))
-        ratio = tf.exp(OLDNEGLOGPAC - neglogpac)
-        pg_losses = -ADV * ratio
-        pg_losses2 = -ADV * tf.clip_by_value(ratio, 1.0 - CLIPRANGE, 1.0 + CLIPRANGE)
-        pg_loss = tf.reduce_mean(tf.maximum(pg_losses, pg_losses2))
-        approxkl = .5 * tf.reduce_mean(tf.square(neglogpac - OLDNEGLOGPAC))
-        clipfrac = tf.reduce_mean(tf.to_float(tf.greater(tf.abs(ratio - 1.0), CLIPRANGE)))
-        loss = pg_loss - entropy * ent_coef + vf_loss * vf_coef
+        def ppo_loss(train_model, A, ADV, R, OLDNEGLOGPAC, OLDVPRED):
+            neglogpac = train_model.pd.neglogp(A)
+            entropy = tf.reduce_mean(train_model.pd.entropy())
+
+            vpred = train_model.vf
+            vpredclipped = OLDVPRED + tf.clip_by_value(train_model.vf - OLDVPRED, - CLIPRANGE, CLIPRANGE)
+            vf_losses1 = tf.square(vpred - R)
+            vf_losses2 = tf.square(vpredclipped - R)
+            vf_loss = .5 * tf.reduce_mean(tf.maximum(vf_losses1, vf_losses2))
+            ratio = tf.exp(OLDNEGLOGPAC - neglogpac)
+            pg_losses = -ADV * ratio
+            pg_losses2 = -ADV * tf.clip_by_value(ratio, 1.0 - CLIPRANGE, 1.0 + CLIPRANGE)
+            pg_loss = tf.reduce_mean(tf.maximum(pg_losses, pg_losses2))
+            approxkl = .5 * tf.reduce_mean(tf.square(neglogpac - OLDNEGLOGPAC))
+            clipfrac = tf.reduce_mean(tf.to_float(tf.greater(tf.abs(ratio - 1.0), CLIPRANGE)))
+            loss = pg_loss - entropy * ent_coef + vf_loss * vf_coef
+            return loss, [pg_loss, vf_loss, entropy, approxkl, clipfrac]
+
+        loss, stats = ppo_loss(train_model, A, ADV, R, OLDNEGLOGPAC, OLDVPRED)
         with tf.variable_scope('model'):
             params = tf.trainable_variables()
-        grads = tf.gradients(loss, params)
-        if max_grad_norm is not None:
-            grads, _grad_norm = tf.clip_by_global_norm(grads, max_grad_norm)
-        grads = list(zip(grads, params))
         trainer = tf.train.AdamOptimizer(learning_rate=LR, epsilon=1e-5)
-        _train = trainer.apply_gradients(grads)
 
-        def train(lr, cliprange, obs, returns, masks, actions, values, neglogpacs, states=None):
-            advs = returns - values
-            advs = (advs - advs.mean()) / (advs.std() + 1e-8)
+        def apply_gradients(grads):
+            if max_grad_norm is not None:
+                grads, _grad_norm = tf.clip_by_global_norm(grads, max_grad_norm)
+            return trainer.apply_gradients(list(zip(grads, params)))
+
+        _train = apply_gradients(tf.gradients(loss, params))
+
+        def train(lr, cliprange, obs, returns, masks, actions, values, neglogpacs, states=None, advs=None):
+            # advantages given by the caller are used as they are, normalized or not
+            if advs is None:
+                advs = returns - values
+                advs = (advs - advs.mean()) / (advs.std() + 1e-8)
             td_map = {train_model.X:obs, A:actions, ADV:advs, R:returns, LR:lr,
                     CLIPRANGE:cliprange, OLDNEGLOGPAC:neglogpacs, OLDVPRED:values}
             if states is not None:
                 td_map[train_model.S] = states
                 td_map[train_model.M] = masks
             return sess.run(
-                [pg_loss, vf_loss, entropy, approxkl, clipfrac, _train],
+                stats + [_train],
                 td_map
             )[:-1]
         self.loss_names = ['policy_loss', 'value_loss', 'policy_entropy', 'approxkl', 'clipfrac']
 
+        if in_graph_update:
+            # the whole batch is fed once, the epochs and minibatches run in the graph
+            nbatch = nbatch_train * nminibatches
+            nsgd = noptepochs * nminibatches
+            B_OBS = tf.placeholder(train_model.X.dtype, [nbatch] + train_model.X.shape.as_list()[1:])
+            B_A = train_model.pdtype.sample_placeholder([nbatch])
+            B_ADV = tf.placeholder(tf.float32, [nbatch])
+            B_R = tf.placeholder(tf.float32, [nbatch])
+            B_OLDNEGLOGPAC = tf.placeholder(tf.float32, [nbatch])
+            B_OLDVPRED = tf.placeholder(tf.float32, [nbatch])
+            # one shuffle per epoch, one row of sample indices per minibatch
+            minibatch_inds = tf.reshape(tf.stack([tf.random_shuffle(tf.range(nbatch)) for _ in range(noptepochs)]),
+                                        [nsgd, nbatch_train])
+
+            reads = {}
+            def read_value(getter, *args, **kwargs):
+                var = getter(*args, **kwargs)
+                reads[var] = var.read_value()
+                return reads[var]
+
+            def sgd_step(i, stat_sums):
+                # reads in step i wait for the update of step i - 1
+                with tf.control_dependencies([i]):
+                    inds = minibatch_inds[i]
+                    with tf.variable_scope(tf.get_variable_scope(), custom_getter=read_value,
+                                           auxiliary_name_scope=False):
+                        mb_model = policy(sess, ob_space, ac_space, nbatch_train, nsteps, reuse=True,
+                                          X=tf.gather(B_OBS, inds))
+                    mb_advs = tf.gather(B_ADV, inds)
+                    mean, variance = tf.nn.moments(mb_advs, axes=[0])
+                    mb_advs = (mb_advs - mean) / (tf.sqrt(variance) + 1e-8)
+                    mb_loss, mb_stats = ppo_loss(mb_model, tf.gather(B_A, inds), mb_advs, tf.gather(B_R, inds),
+                                                 tf.gather(B_OLDNEGLOGPAC, inds), tf.gather(B_OLDVPRED, inds))
+                    mb_train = apply_gradients(tf.gradients(mb_loss, [reads[p] for p in params]))
+                with tf.control_dependencies([mb_train]):
+                    return i + 1, stat_sums + tf.stack(mb_stats)
+
+            _, stat_sums = tf.while_loop(lambda i, _: i < nsgd, sgd_step, [tf.constant(0), tf.zeros([len(stats)])],
+                                         parallel_iterations=1)
+            _update = stat_sums / nsgd
+
+            def update(lr, cliprange, obs, returns, actions, values, neglogpacs, advs=None):
+                """
+                noptepochs x nminibatches PPO steps on a whole batch in one
+                session call, returns the loss stats averaged over the steps.
+                advs defaults to returns - values and is normalized per minibatch.
+                """
+                if advs is None:
+                    advs = returns - values
+                return sess.run(_update, {B_OBS:obs, B_A:actions, B_ADV:advs, B_R:returns, LR:lr, CLIPRANGE:cliprange,
+                                          B_OLDNEGLOGPAC:neglogpacs, B_OLDVPRED:values})
+
+        # values and neglogps of given actions under the current policy
+        ACT_A = act_model.pdtype.sample_placeholder([None])
+        act_neglogpac = act_model.pd.neglogp(ACT_A)
+
+        def evaluate(obs, actions):
+            return sess.run([act_model.vf, act_neglogpac], {act_model.X:obs, ACT_A:actions})
+
         def save(save_path):
             ps = sess.run(params)
             joblib.dump(ps, save_path)
@@ -78,7 +158,36 @@ class Model(object):
             sess.run(restores)
             # If you want to load weights, also save/load observation scaling inside VecNormalize
 
+        # the parameters and the Adam moments and beta powers, by variable name
+        state_variables = params + trainer.variables()
+        state_restores = {}
+
+        def get_state():
+            return OrderedDict(zip([v.name for v in state_variables], sess.run(state_variables)))
+
+        def set_state(arrays):
+            """
+            assign the variables found in arrays, every parameter must be there
+            """
+            missing = [p.name for p in params if p.name not in arrays]
+            assert not missing, 'parameters missing from the checkpoint: %s' % missing
+            ops, feed = [], {}
+            for v in state_variables:
+                if v.name not in arrays:
+                    continue
+                if v not in state_restores:
+                    value = tf.placeholder(v.dtype.base_dtype, v.shape)
+                    state_restores[v] = (value, v.assign(value))
+                value, assign = state_restores[v]
+                feed[value] = arrays[v.name]
+                ops.append(assign)
+            sess.run(ops, feed)
+
         self.train = train
+        if in_graph_update:
+            self.update = update
+        self.evaluate = evaluate
+        self.params = params
         self.train_model = train_model
         self.act_model = act_model
         self.step = act_model.step
@@ -86,148 +195,196 @@ class Model(object):
         self.initial_state = act_model.initial_state
         self.save = save
         self.load = load
+        self.get_state = get_state
+        self.set_state = set_state
         tf.global_variables_initializer().run(session=sess) #pylint: disable=E1101
 
 class Runner(AbstractEnvRunner):
 
-    def __init__(self, *, env, model, nsteps, gamma, lam, writer, num_casks=0):
+    def __init__(self, *, env, model, nsteps, gamma, lam, writer, num_casks=0, gae_engine='auto',
+                 inference_server=None, timings=None):
         super().__init__(env=env, model=model, nsteps=nsteps)
         self.lam = lam
         self.gamma = gamma
+        self.gae = get_gae_engine(gae_engine)
+        # with a server, only the envs that need an action are evaluated
+        self.server = inference_server
+        self.timings = timings if timings is not None else Timings(enabled=False)
 
         self.nenvs = env.num_envs
-        self.good = set()
+        self.buffer = RolloutBuffer(self.nenvs, nsteps, env.observation_space.shape, env.action_space.shape,
+                                    ob_dtype=self.obs.dtype)
+        self.dones = np.zeros(self.nenvs, dtype=np.bool_)
         self.valid = self.nenvs - num_casks
-        self.casks = set()
+        # envs with a step in flight, casks keep stepping across runs
+        self.in_flight = set()
+        # envs without their own poll only step all together
+        self.lockstep_env = type(env.unwrapped).poll is VecEnv.poll
+        self.actions = np.zeros((self.nenvs,) + env.action_space.shape, dtype=np.float32)
+        # seconds from the start of the run until each env completed nsteps
+        self.run_start = time.perf_counter()
+        self.completion_times = np.full(self.nenvs, np.nan)
+        self.rollout_time = 0.0
 
         # tensorboard
         self.writer = writer
         self.num_episode = 0
 
     def run(self):
-        mb_obs, mb_rewards, mb_actions, mb_values, mb_dones, mb_neglogpacs = [], [], [], [], [], []
-        for i in range(self.nenvs):
-            mb_obs.append([])
-            mb_rewards.append([])
-            mb_actions.append([])
-            mb_values.append([])
-            mb_dones.append([])
-            mb_neglogpacs.append([])
-
+        self.buffer.reset()
+        self.run_start = time.perf_counter()
+        self.completion_times[:] = np.nan
         mb_states = self.states
         epinfos = []
-
-        # not initialize cask agents last run
-        # self.good = set([i for i in range(self.nenvs)])
-        self.good = set()
-        for i in range(self.nenvs):
-            if i not in self.casks:
-                self.good.add(i)
+        if self.server is None:
+            self._run_lockstep(epinfos)
+        else:
+            self._run_served(epinfos)
+        return self._finish(mb_states, epinfos)
+
+    def _run_lockstep(self, epinfos):
+        buffer = self.buffer
+        timings = self.timings
+        # casks of the last run are still in flight, record their inputs without stepping them again
+        carried = sorted(self.in_flight)
         while True:
-            actions, values, self.states, neglogpacs = self.model.step(self.obs, self.states, self.dones)
-
-            tmp_obs = self.obs.copy()
-            for i in range(self.nenvs):
-                if i in self.good or i in self.casks:
-                    mb_obs[i].append(tmp_obs[i])
-                    # mb_actions.append(actions)
-                    mb_values[i].append(values[i])
-                    mb_neglogpacs[i].append(neglogpacs[i])
-                    mb_dones[i].append(self.dones[i])
-                if i not in self.good:
-                    actions[i] = False
-            self.casks = set()
-            self.obs[:], rewards, self.dones, infos = self.env.step(actions)
-
-            self.good = set()
-            for i in range(self.nenvs):
-                if not infos[i].get("bad", True):
-                    self.good.add(i)
-
-            for i in range(self.nenvs):
-                if i in self.good:
-                    action = infos[i].get("action", actions[i])
-                    mb_actions[i].append(action)
-                    mb_rewards[i].append(rewards[i])
-
-                    if len(mb_rewards[i]) >= self.nsteps:
-                        self.good.remove(i)
-
-            print([len(mb_rewards[i]) for i in range(self.nenvs)])
-            print(self.good)
-
-            # when done, add episodic information to tensorboard
-            for i in range(self.nenvs):
-                if self.dones[i] and i in self.good:
-                    epinfos.append({'r': infos[i]['episode']['r'], 'l': infos[i]['episode']['l'], 'sr': infos[i]['episode']['shaped_reward']})
-                    self.num_episode += 1
-                    summary = tf.Summary()
-                    summary.value.add(tag='episode/length', simple_value=infos[i]['episode']['l'])
-                    summary.value.add(tag='episode/original_reward', simple_value=infos[i]['episode']['r'])
-                    summary.value.add(tag='episode/shaped_reward', simple_value=infos[i]['episode']['shaped_reward'])
-                    summary.value.add(tag='penalty/activation_penalty', simple_value=infos[i]['episode']['activation_penalty'])
-                    summary.value.add(tag='penalty/vx_penalty', simple_value=infos[i]['episode']['vx_penalty'])
-                    summary.value.add(tag='penalty/vz_penalty', simple_value=infos[i]['episode']['vz_penalty'])
-                    self.writer.add_summary(summary, self.num_episode)
-
+            # act again only on idle envs that still need samples
+            full = buffer.full()
+            ready = [i for i in range(self.nenvs) if i not in self.in_flight and not full[i]]
+            if ready or carried:
+                # the act model takes the whole batch, rows of busy envs are discarded
+                with timings.span('policy'):
+                    actions, values, self.states, neglogpacs = self.model.step(self.obs, self.states, self.dones)
+                recorded = sorted(ready + carried)
+                carried = []
+                with timings.span('buffer'):
+                    buffer.add_dispatch(recorded, self.obs[recorded], values[recorded], neglogpacs[recorded],
+                                        self.dones[recorded])
+                self._dispatch(ready, actions[ready])
+
+            # wait for all but the num_casks slowest envs in flight, so the
+            # policy runs about once per step and not once per finished env
+            min_ready = max(1, len(self.in_flight) - (self.nenvs - self.valid))
+            self._collect(self._poll(min_ready), epinfos)
             # Cask Effect: top self.nenvs - num_casks is ready
-            # if all([len(mb_rewards[i]) >= 128 for i in range(self.nenvs)]):
-            if sum([len(mb_rewards[i]) >= self.nsteps for i in range(self.nenvs)]) >= self.valid:
-                for i in range(self.nenvs):
-                    if len(mb_rewards[i]) < self.nsteps:
-                        self.casks.add(i)
+            if buffer.full().sum() >= self.valid:
                 break
 
-        # remove casks' sample
-        cask_list = sorted(list(self.casks))
-        print('casks:', cask_list)
-        cask_list.reverse()
-        for i in cask_list:
-            mb_obs.pop(i)
-            mb_rewards.pop(i)
-            mb_actions.pop(i)
-            mb_values.pop(i)
-            mb_neglogpacs.pop(i)
-            mb_dones.pop(i)
-
-        #batch of steps to batch of rollouts
-        mb_obs = np.asarray(mb_obs, dtype=self.obs.dtype).transpose((1, 0, 2))
-        mb_rewards = np.asarray(mb_rewards, dtype=np.float32).transpose((1, 0))
-        mb_actions = np.asarray(mb_actions).transpose((1, 0, 2))
-        mb_values = np.asarray(mb_values, dtype=np.float32).transpose((1, 0))
-        mb_neglogpacs = np.asarray(mb_neglogpacs, dtype=np.float32).transpose((1, 0))
-        mb_dones = np.asarray(mb_dones, dtype=np.bool).transpose((1, 0))
-        last_values = self.model.value(self.obs, self.states, self.dones)
-
-        last_values = last_values.tolist()
-        copy_dones = copy.deepcopy(self.dones)
-        self.dones = self.dones.tolist()
-        for i in cask_list:
-            last_values.pop(i)
-            self.dones.pop(i)
-        last_values = np.array(last_values)
-        self.dones = np.array(self.dones)
+    def _run_served(self, epinfos):
+        buffer = self.buffer
+        server = self.server
+        timings = self.timings
+        carried = sorted(self.in_flight)
+        if carried:
+            _, values, neglogpacs = server.step(self.obs[carried])
+            buffer.add_dispatch(carried, self.obs[carried], values, neglogpacs, self.dones[carried])
+        # requests in flight at the server, envs waiting for them are idle
+        pending = []
+        requested = set()
+
+        def request(env_ids):
+            env_ids = [i for i in env_ids if i not in requested and buffer.dispatched[i] < self.nsteps]
+            if env_ids:
+                pending.append((env_ids, server.submit(self.obs[env_ids])))
+                requested.update(env_ids)
+
+        request([i for i in range(self.nenvs) if i not in self.in_flight])
+        while buffer.full().sum() < self.valid:
+            # step every env whose action is ready
+            while pending and pending[0][1].done():
+                env_ids, req = pending.pop(0)
+                actions, values, neglogpacs = req.result()
+                requested.difference_update(env_ids)
+                with timings.span('buffer'):
+                    buffer.add_dispatch(env_ids, self.obs[env_ids], values, neglogpacs, self.dones[env_ids])
+                self._dispatch(env_ids, actions)
+
+            # while actions are pending only wait as long as the server batches
+            timeout = server.max_latency if pending else None
+            env_ids = self._collect(self._poll(timeout=timeout), epinfos)
+            request(env_ids.tolist())
+
+        # envs with an unanswered request simply stay idle until the next run
+        for _, req in pending:
+            req.result()
+
+    def _dispatch(self, env_ids, actions):
+        self.actions[env_ids] = actions
+        if self.lockstep_env:
+            assert len(env_ids) == self.nenvs, \
+                '%s steps all envs together, casks and the inference server need a VecEnv with poll' % \
+                type(self.env.unwrapped).__name__
+            self.env.step_async(self.actions)
+        else:
+            self.env.step_async(actions, env_ids)
+        self.in_flight.update(env_ids)
+
+    def _poll(self, min_ready=1, timeout=None):
+        with self.timings.span('env_wait'):
+            return self.env.poll(min_ready, timeout)
+
+    def _collect(self, results, epinfos):
+        """
+        store the step results returned by env.poll, returns their env ids
+        """
+        env_ids, obs, rewards, dones, infos = results
+        self.in_flight.difference_update(env_ids.tolist())
+        # envs of a replaced actor start over, the step they were taking is lost
+        replaced = np.array([info.get("replaced", False) for info in infos], dtype=np.bool_)
+        with self.timings.span('buffer'):
+            self.obs[env_ids] = obs
+            self.dones[env_ids] = dones
+            if replaced.any():
+                self.buffer.cancel(env_ids[replaced])
+            stepped = np.flatnonzero(~replaced)
+            actions = [infos[k].get("action", self.actions[env_ids[k]]) for k in stepped]
+            self.buffer.add_result(env_ids[stepped], actions, rewards[stepped])
+            stepped = env_ids[stepped]
+            completed = stepped[self.buffer.completed[stepped] == self.nsteps]
+            self.completion_times[completed] = time.perf_counter() - self.run_start
+
+        logger.debug('completed:', self.buffer.completed.tolist(), 'in flight:', sorted(self.in_flight))
+
+        # when done, add episodic information to tensorboard
+        for k, i in enumerate(env_ids):
+            if dones[k] and not replaced[k]:
+                info = infos[k]
+                epinfos.append({'r': info['episode']['r'], 'l': info['episode']['l'], 'sr': info['episode']['shaped_reward']})
+                self.num_episode += 1
+                summary = tf.Summary()
+                summary.value.add(tag='episode/length', simple_value=info['episode']['l'])
+                summary.value.add(tag='episode/original_reward', simple_value=info['episode']['r'])
+                summary.value.add(tag='episode/shaped_reward', simple_value=info['episode']['shaped_reward'])
+                summary.value.add(tag='penalty/activation_penalty', simple_value=info['episode']['activation_penalty'])
+                summary.value.add(tag='penalty/vx_penalty', simple_value=info['episode']['vx_penalty'])
+                summary.value.add(tag='penalty/vz_penalty', simple_value=info['episode']['vz_penalty'])
+                with self.timings.span('tensorboard'):
+                    self.writer.add_summary(summary, self.num_episode)
+        return env_ids
+
+    def _finish(self, mb_states, epinfos):
+        buffer = self.buffer
+        timings = self.timings
+        self.rollout_time = time.perf_counter() - self.run_start
+        full = buffer.full()
+        # drop casks' rows, the remaining rows are compacted to the front of the buffer
+        logger.debug('casks:', np.flatnonzero(~full).tolist())
+        with timings.span('buffer'):
+            rows = buffer.finalize(full)
+        nrows = len(rows)
+        with timings.span('policy'):
+            last_values = self.model.value(self.obs, self.states, self.dones)
+        last_values = np.asarray(last_values)[rows]
+        last_dones = self.dones[rows]
 
         #discount/bootstrap off value fn
-        mb_returns = np.zeros_like(mb_rewards)
-        mb_advs = np.zeros_like(mb_rewards)
-        lastgaelam = 0
-        for t in reversed(range(self.nsteps)):
-            if t == self.nsteps - 1:
-                nextnonterminal = 1.0 - self.dones
-                nextvalues = last_values
-            else:
-                nextnonterminal = 1.0 - mb_dones[t+1]
-                nextvalues = mb_values[t+1]
-            delta = mb_rewards[t] + self.gamma * nextvalues * nextnonterminal - mb_values[t]
-            mb_advs[t] = lastgaelam = delta + self.gamma * self.lam * nextnonterminal * lastgaelam
-        mb_returns = mb_advs + mb_values
-
-        # revert valid + cask dimension dones
-        self.dones = copy_dones
-
-        return (*map(sf01, (mb_obs, mb_returns, mb_dones, mb_actions, mb_values, mb_neglogpacs)),
-            mb_states, epinfos)
+        mb_rewards, mb_values, mb_dones, mb_advs, mb_returns = buffer.time_major(nrows)
+        with timings.span('gae'):
+            self.gae(mb_rewards, mb_values, mb_dones, last_values, last_dones, self.gamma, self.lam,
+                     advs=mb_advs, returns=mb_returns)
+
+        # flattened views into the buffer, valid until the next run
+        return (*buffer.flat(nrows), mb_states, epinfos)
 # obs, returns, masks, actions, values, neglogpacs, states = runner.run()
 def sf01(arr):
     """
@@ -244,7 +401,9 @@ def constfn(val):
 def learn(*, policy, env, nsteps, total_timesteps, ent_coef, lr,
             vf_coef=0.5,  max_grad_norm=0.5, gamma=0.99, lam=0.95,
             log_interval=10, nminibatches=4, noptepochs=4, cliprange=0.2,
-            save_interval=0, load_path=None, num_casks=0):
+            save_interval=0, load_path=None, num_casks=0, gae_engine='auto',
+            inference_server=False, max_latency=0.005, in_graph_update=False, timing=False,
+            adaptive_casks=False, keep_checkpoints=None):
 
     if isinstance(lr, float): lr = constfn(lr)
     else: assert callable(lr)
@@ -258,104 +417,214 @@ def learn(*, policy, env, nsteps, total_timesteps, ent_coef, lr,
     nbatch = nenvs * nsteps
     nbatch_train = nbatch // nminibatches
 
-    make_model = lambda : Model(policy=policy, ob_space=ob_space, ac_space=ac_space, nbatch_act=env.num_envs, nbatch_train=nbatch_train,
+    # the inference server feeds batches of any size to the act model
+    nbatch_act = None if inference_server else env.num_envs
+    make_model = lambda : Model(policy=policy, ob_space=ob_space, ac_space=ac_space, nbatch_act=nbatch_act, nbatch_train=nbatch_train,
                     nsteps=nsteps, ent_coef=ent_coef, vf_coef=vf_coef,
-                    max_grad_norm=max_grad_norm)
+                    max_grad_norm=max_grad_norm, noptepochs=noptepochs if in_graph_update else None,
+                    nminibatches=nminibatches)
     if save_interval and logger.get_dir():
         import cloudpickle
         with open(osp.join(logger.get_dir(), 'make_model.pkl'), 'wb') as fh:
             fh.write(cloudpickle.dumps(make_model))
     model = make_model()
-    if load_path is not None:
-        model.load(load_path)
-        # load running mean std
-        checkdir = load_path[0:-5]
-        checkpoint = int(load_path.split('/')[-1])
-        if osp.exists(osp.join(checkdir, '%.5i_ob_rms.pkl' % checkpoint)):
-            with open(osp.join(checkdir, '%.5i_ob_rms.pkl' % checkpoint), 'rb') as ob_rms_fp:
-                env.ob_rms = pickle.load(ob_rms_fp)
-        # if osp.exists(osp.join(checkdir, '%.5i_ret_rms.pkl' % checkpoint)):
-        #     with open(osp.join(checkdir, '%.5i_ret_rms.pkl' % checkpoint), 'rb') as ret_rms_fp:
-        #         env.ret_rms = pickle.load(ret_rms_fp)
+    # a single file checkpoint resumes its update and timestep counters
+    meta = load_checkpoint(model, env, load_path) if load_path is not None else {}
     # tensorboard
     writer = tf.summary.FileWriter(logger.get_dir(), tf.get_default_session().graph)
-    runner = Runner(env=env, model=model, nsteps=nsteps, gamma=gamma, lam=lam, writer=writer, num_casks=num_casks)
+    # named wall-clock spans of the update cycle, logged as time_<span>
+    timings = Timings(enabled=timing)
+    server = InferenceServer(model.step, max_batch=env.num_envs, max_latency=max_latency,
+                             timings=timings) if inference_server else None
+    runner = Runner(env=env, model=model, nsteps=nsteps, gamma=gamma, lam=lam, writer=writer, num_casks=num_casks,
+                    gae_engine=gae_engine, inference_server=server, timings=timings)
+
+    # with adaptive casks num_casks is the most the runner may drop, every
+    # cask count it picks keeps whole minibatches of nbatch_train
+    controller = None
+    if adaptive_casks:
+        assert not in_graph_update, 'the in-graph update needs a fixed batch size'
+        candidates = [k for k in range(num_casks + 1) if (env.num_envs - k) * nsteps % nbatch_train == 0]
+        controller = CaskController(env.num_envs, nsteps, candidates)
+
+    # checkpoints are written off the update loop, keep_checkpoints newest are kept
+    ckpt_writer = checkpoint.CheckpointWriter(keep_last=keep_checkpoints) if save_interval and logger.get_dir() else None
 
     epinfobuf = deque(maxlen=100)
     tfirststart = time.time()
+    pipelines = {nbatch: MinibatchPipeline(nbatch, nbatch_train)}
 
     nupdates = total_timesteps//nbatch
-    for update in range(1, nupdates+1):
-        assert nbatch % nminibatches == 0
-        nbatch_train = nbatch // nminibatches
+    # timesteps are counted in whole nominal batches, adaptive batches may be larger
+    budget = nupdates * nbatch
+    timesteps = meta.get('timesteps', 0)
+    start = update = meta.get('update', 0)
+    while timesteps < budget:
+        update += 1
         tstart = time.time()
-        frac = 1.0 - (update - 1.0) / nupdates
+        frac = 1.0 - timesteps / budget
         lrnow = lr(frac)
         cliprangenow = cliprange(frac)
+        if controller is not None:
+            runner.valid = env.num_envs - controller.num_casks
+            nbatch = runner.valid * nsteps
+            if nbatch not in pipelines:
+                pipelines[nbatch] = MinibatchPipeline(nbatch, nbatch_train)
+        assert nbatch % nbatch_train == 0
+        pipeline = pipelines[nbatch]
         obs, returns, masks, actions, values, neglogpacs, states, epinfos = runner.run() #pylint: disable=E0632
         epinfobuf.extend(epinfos)
+        timesteps += nbatch
+        if controller is not None:
+            controller.update(runner.completion_times, runner.buffer.completed, runner.rollout_time)
         mblossvals = []
-        if states is None: # nonrecurrent version
-            inds = np.arange(nbatch)
-            for _ in range(noptepochs):
-                np.random.shuffle(inds)
-                for start in range(0, nbatch, nbatch_train):
-                    end = start + nbatch_train
-                    mbinds = inds[start:end]
-                    slices = (arr[mbinds] for arr in (obs, returns, masks, actions, values, neglogpacs))
-                    mblossvals.append(model.train(lrnow, cliprangenow, *slices))
-        else: # recurrent version
-            assert nenvs % nminibatches == 0
-            envsperbatch = nenvs // nminibatches
-            envinds = np.arange(nenvs)
-            flatinds = np.arange(nenvs * nsteps).reshape(nenvs, nsteps)
-            envsperbatch = nbatch_train // nsteps
-            for _ in range(noptepochs):
-                np.random.shuffle(envinds)
-                for start in range(0, nenvs, envsperbatch):
-                    end = start + envsperbatch
-                    mbenvinds = envinds[start:end]
-                    mbflatinds = flatinds[mbenvinds].ravel()
-                    slices = (arr[mbflatinds] for arr in (obs, returns, masks, actions, values, neglogpacs))
-                    mbstates = states[mbenvinds]
-                    mblossvals.append(model.train(lrnow, cliprangenow, *slices, mbstates))
+        with timings.span('sgd'):
+            if states is None and in_graph_update: # all epochs in one session call
+                slices = (arr[:nbatch] for arr in (obs, returns, actions, values, neglogpacs))
+                mblossvals.append(model.update(lrnow, cliprangenow, *slices))
+            elif states is None: # nonrecurrent version
+                for *slices, mbadvs in pipeline.minibatches(noptepochs, obs, returns, masks, actions, values, neglogpacs):
+                    mblossvals.append(model.train(lrnow, cliprangenow, *slices, advs=mbadvs))
+            else: # recurrent version
+                assert nenvs % nminibatches == 0
+                envsperbatch = nenvs // nminibatches
+                envinds = np.arange(nenvs)
+                flatinds = np.arange(nenvs * nsteps).reshape(nenvs, nsteps)
+                envsperbatch = nbatch_train // nsteps
+                for _ in range(noptepochs):
+                    np.random.shuffle(envinds)
+                    for mbstart in range(0, nenvs, envsperbatch):
+                        mbend = mbstart + envsperbatch
+                        mbenvinds = envinds[mbstart:mbend]
+                        mbflatinds = flatinds[mbenvinds].ravel()
+                        slices = (arr[mbflatinds] for arr in (obs, returns, masks, actions, values, neglogpacs))
+                        mbstates = states[mbenvinds]
+                        mblossvals.append(model.train(lrnow, cliprangenow, *slices, mbstates))
 
         lossvals = np.mean(mblossvals, axis=0)
         tnow = time.time()
         fps = int(nbatch / (tnow - tstart))
-        if update % log_interval == 0 or update == 1:
+        if update % log_interval == 0 or update == start + 1:
             ev = explained_variance(values, returns)
             logger.logkv("serial_timesteps", update*nsteps)
             logger.logkv("nupdates", update)
-            logger.logkv("total_timesteps", update*nbatch)
+            logger.logkv("total_timesteps", timesteps)
             logger.logkv("fps", fps)
             logger.logkv("explained_variance", float(ev))
             logger.logkv('eprewmean', safemean([epinfo['r'] for epinfo in epinfobuf]))
             logger.logkv('eplenmean', safemean([epinfo['l'] for epinfo in epinfobuf]))
             logger.logkv('epsrewmean', safemean([epinfo['sr'] for epinfo in epinfobuf]))
             logger.logkv('time_elapsed', tnow - tfirststart)
+            logger.logkv('num_casks', env.num_envs - runner.valid)
+            if server is not None:
+                logger.logkv('inference_batch_size', server.mean_batch_size())
             for (lossval, lossname) in zip(lossvals, model.loss_names):
                 logger.logkv(lossname, lossval)
-            logger.dumpkvs()
             # tensorboard
             summary = tf.Summary()
+            log_timings(timings, env, summary)
+            log_actor_health(env, summary)
+            logger.dumpkvs()
             summary.value.add(tag='iteration/reward_mean', simple_value=safemean([epinfo['r'] for epinfo in epinfobuf]))
             summary.value.add(tag='iteration/length_mean', simple_value=safemean([epinfo['l'] for epinfo in epinfobuf]))
             summary.value.add(tag='iteration/shaped_reward_mean', simple_value=safemean([epinfo['sr'] for epinfo in epinfobuf]))
             summary.value.add(tag='iteration/fps', simple_value=fps)
-            writer.add_summary(summary, update)
-        if save_interval and (update % save_interval == 0 or update == 1) and logger.get_dir():
-            checkdir = osp.join(logger.get_dir(), 'checkpoints')
-            os.makedirs(checkdir, exist_ok=True)
-            savepath = osp.join(checkdir, '%.5i'%update)
-            print('Saving to', savepath)
-            model.save(savepath)
-            # save running mean std
-            with open(osp.join(checkdir, '%.5i_ob_rms.pkl' % update), 'wb') as ob_rms_fp:
-                pickle.dump(env.ob_rms, ob_rms_fp)
-            with open(osp.join(checkdir, '%.5i_ret_rms.pkl' % update), 'wb') as ret_rms_fp:
-                pickle.dump(env.ret_rms, ret_rms_fp)
+            summary.value.add(tag='iteration/num_casks', simple_value=env.num_envs - runner.valid)
+            with timings.span('tensorboard'):
+                writer.add_summary(summary, update)
+        if save_interval and (update % save_interval == 0 or update == start + 1) and logger.get_dir():
+            with timings.span('save'):
+                save_checkpoint(model, env, update, timesteps, writer=ckpt_writer)
+    if ckpt_writer is not None:
+        ckpt_writer.close()
+    if server is not None:
+        server.close()
     env.close()
 
+def load_checkpoint(model, env, load_path):
+    """
+    restore the model and the normalization stats of env, returns the meta
+    of a single file checkpoint, {} for the legacy joblib + pickles layout
+    """
+    if checkpoint.is_checkpoint(load_path):
+        arrays, meta = checkpoint.load(load_path)
+        model.set_state(arrays)
+        for name in ('ob_rms', 'ret_rms'):
+            rms = checkpoint.rms_from_arrays(arrays, name)
+            if rms is not None:
+                setattr(env, name, rms)
+        return meta
+    model.load(load_path)
+    # load running mean std
+    checkdir = load_path[0:-5]
+    update = int(load_path.split('/')[-1])
+    if osp.exists(osp.join(checkdir, '%.5i_ob_rms.pkl' % update)):
+        with open(osp.join(checkdir, '%.5i_ob_rms.pkl' % update), 'rb') as ob_rms_fp:
+            env.ob_rms = pickle.load(ob_rms_fp)
+    # if osp.exists(osp.join(checkdir, '%.5i_ret_rms.pkl' % update)):
+    #     with open(osp.join(checkdir, '%.5i_ret_rms.pkl' % update), 'rb') as ret_rms_fp:
+    #         env.ret_rms = pickle.load(ret_rms_fp)
+    return {}
+
+def save_checkpoint(model, env, update, timesteps, writer=None):
+    """
+    one file with the parameters, the Adam state, the normalization stats
+    and the update counters, written in the background by a CheckpointWriter
+    """
+    checkdir = osp.join(logger.get_dir(), 'checkpoints')
+    os.makedirs(checkdir, exist_ok=True)
+    savepath = osp.join(checkdir, '%.5i.ckpt'%update)
+    print('Saving to', savepath)
+    arrays = model.get_state()
+    for name in ('ob_rms', 'ret_rms'):
+        rms = getattr(env, name, None)
+        if rms is not None:
+            arrays.update(checkpoint.rms_arrays(name, rms))
+    meta = {'update': update, 'timesteps': timesteps}
+    if writer is not None:
+        writer.submit(savepath, arrays, meta)
+    else:
+        checkpoint.save(savepath, arrays, meta)
+
+def log_timings(timings, env, summary):
+    """
+    log the spans and the per actor step latencies collected since the last
+    call to the logger and to a tensorboard summary, then reset them
+    """
+    for name, seconds in timings.logkvs(logger):
+        summary.value.add(tag='timing/' + name, simple_value=seconds)
+    step_latency = getattr(env.unwrapped, 'step_latency', None)
+    if not step_latency:
+        return
+    total = LatencyHistogram()
+    for aid, hist in enumerate(step_latency):
+        total.merge(hist)
+        summary.value.add(tag='step_latency/actor%d' % aid,
+                          histo=tf.HistogramProto(min=0.0, max=hist.max, num=hist.count,
+                                                  bucket_limit=hist.edges[1:].tolist(), bucket=hist.counts.tolist()))
+    for q in (50, 90, 99):
+        logger.logkv('step_latency_p%d' % q, total.percentile(q))
+    logger.logkv('step_latency_max', total.max)
+    logger.logkv('step_latency_slowest_actor', int(np.argmax([hist.percentile(99) for hist in step_latency])))
+    for hist in step_latency:
+        hist.reset()
+
+def log_actor_health(env, summary):
+    """
+    log the actor replacements and the latencies of the slowest actor of a
+    RemoteVecEnv
+    """
+    health = getattr(env.unwrapped, 'health', None)
+    if not health:
+        return
+    replacements = sum(h.replacements for h in health)
+    ewmas = [h.ewma for h in health]
+    logger.logkv('actor_replacements', replacements)
+    logger.logkv('actor_latency_ewma_max', max(ewmas))
+    logger.logkv('actor_latency_p99_max', max(h.p99 for h in health))
+    logger.logkv('slowest_actor', int(np.argmax(ewmas)))
+    summary.value.add(tag='actors/replacements', simple_value=replacements)
+    summary.value.add(tag='actors/latency_ewma_max', simple_value=max(ewmas))
+
 def safemean(xs):
     return np.nan if len(xs) == 0 else np.mean(xs)
@@ -0,0 +1,63 @@
+import pickle
+
+import joblib
+import numpy as np
+import pytest
+
+from baselines.common import checkpoint
+from baselines.common.running_mean_std import RunningMeanStd
+
+pytest.importorskip('tensorflow')
+from baselines.ppo2.ppo2 import load_checkpoint  # noqa: E402
+
+
+class _Model(object):
+    def __init__(self):
+        self.loaded = None
+        self.state = None
+
+    def load(self, load_path):
+        self.loaded = joblib.load(load_path)
+
+    def set_state(self, arrays):
+        self.state = {name: np.array(arr) for name, arr in arrays.items()}
+
+
+class _Env(object):
+    ob_rms = None
+    ret_rms = None
+
+
+def _ob_rms():
+    rms = RunningMeanStd(shape=(3,))
+    rms.update(np.random.RandomState(0).randn(10, 3))
+    return rms
+
+
+def test_load_single_file_checkpoint(tmpdir):
+    ob_rms = _ob_rms()
+    arrays = {'model/pi/w:0': np.ones((3, 2), np.float32)}
+    arrays.update(checkpoint.rms_arrays('ob_rms', ob_rms))
+    path = str(tmpdir.join('00007.ckpt'))
+    checkpoint.save(path, arrays, meta={'update': 7, 'timesteps': 896})
+
+    model, env = _Model(), _Env()
+    assert load_checkpoint(model, env, path) == {'update': 7, 'timesteps': 896}
+    assert np.array_equal(model.state['model/pi/w:0'], arrays['model/pi/w:0'])
+    assert np.array_equal(env.ob_rms.mean, ob_rms.mean)
+    assert env.ret_rms is None
+
+
+def test_load_legacy_checkpoint(tmpdir):
+    ob_rms = _ob_rms()
+    checkdir = tmpdir.mkdir('checkpoints')
+    joblib.dump([np.zeros(2), np.ones(3)], str(checkdir.join('00000')))
+    with open(str(checkdir.join('00000_ob_rms.pkl')), 'wb') as ob_rms_fp:
+        pickle.dump(ob_rms, ob_rms_fp)
+
+    model, env = _Model(), _Env()
+    with tmpdir.as_cwd():
+        # as run.sh passes it, relative to the working directory
+        assert load_checkpoint(model, env, 'checkpoints/00000') == {}
+    assert len(model.loaded) == 2
+    assert np.array_equal(env.ob_rms.var, ob_rms.var)
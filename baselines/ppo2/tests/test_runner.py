@@ -0,0 +1,148 @@
+import time
+import types
+
+import numpy as np
+import pytest
+from gym import spaces
+
+from baselines.common.vec_env import VecEnv
+from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
+from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv
+
+pytest.importorskip('tensorflow')
+from baselines.ppo2.ppo2 import Runner  # noqa: E402
+
+EPISODE_LENGTH = 3
+
+
+class _CountEnv(object):
+    """
+    observation [env id, steps taken], the reward is the action
+    """
+    def __init__(self, env_id, delay=0.0):
+        self.env_id = env_id
+        self.delay = delay
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(2,), dtype=np.float32)
+        self.action_space = spaces.Box(low=-np.inf, high=np.inf, shape=(1,), dtype=np.float32)
+        self.t = 0
+        self.ret = 0.0
+
+    def reset(self):
+        self.t, self.ret = 0, 0.0
+        return np.array([self.env_id, self.t], dtype=np.float32)
+
+    def step(self, action):
+        time.sleep(self.delay)
+        self.t += 1
+        self.ret += float(action[0])
+        done = self.t == EPISODE_LENGTH
+        info = {}
+        if done:
+            info['episode'] = {'r': self.ret, 'l': self.t, 'shaped_reward': self.ret, 'activation_penalty': 0.0,
+                               'vx_penalty': 0.0, 'vz_penalty': 0.0}
+        return np.array([self.env_id, self.t], dtype=np.float32), float(action[0]), done, info
+
+    def close(self):
+        pass
+
+
+class _Model(object):
+    """
+    acts env id + 1, values 0
+    """
+    train_model = types.SimpleNamespace(X=np.zeros(0, dtype=np.float32))
+    initial_state = None
+
+    def __init__(self):
+        self.steps = 0
+
+    def step(self, obs, states, dones):
+        self.steps += 1
+        n = len(obs)
+        return obs[:, :1] + 1, np.zeros(n, np.float32), states, np.zeros(n, np.float32)
+
+    def value(self, obs, states, dones):
+        return np.zeros(len(obs), np.float32)
+
+
+class _Writer(object):
+    def add_summary(self, summary, step):
+        pass
+
+
+class _LockstepVecEnv(VecEnv):
+    """
+    a VecEnv written before poll, its envs only step together
+    """
+    def __init__(self, nenvs):
+        self.envs = [_CountEnv(i) for i in range(nenvs)]
+        VecEnv.__init__(self, nenvs, self.envs[0].observation_space, self.envs[0].action_space)
+
+    def reset(self):
+        return np.stack([env.reset() for env in self.envs])
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        results = []
+        for env, action in zip(self.envs, self.actions):
+            ob, rew, done, info = env.step(action)
+            results.append((env.reset() if done else ob, rew, done, info))
+        obs, rews, dones, infos = zip(*results)
+        return np.stack(obs), np.array(rews), np.array(dones), list(infos)
+
+    def close(self):
+        pass
+
+
+def _check_rollout(env, nenvs, nsteps=5):
+    runner = Runner(env=env, model=_Model(), nsteps=nsteps, gamma=0.99, lam=0.95, writer=_Writer())
+    obs, returns, dones, actions, values, neglogpacs, states, epinfos = runner.run()
+    obs = obs.reshape(nenvs, nsteps, 2)
+    for i in range(nenvs):
+        assert obs[i, :, 0].tolist() == [i] * nsteps
+        assert obs[i, :, 1].tolist() == [t % EPISODE_LENGTH for t in range(nsteps)]
+    assert actions.reshape(nenvs, nsteps).tolist() == [[i + 1] * nsteps for i in range(nenvs)]
+    assert dones.reshape(nenvs, nsteps)[:, EPISODE_LENGTH].all()
+    assert sorted(epinfo['r'] for epinfo in epinfos) == [EPISODE_LENGTH * (i + 1) for i in range(nenvs)]
+    # one policy evaluation per step, not one per finished env
+    assert runner.model.steps == nsteps
+
+
+def test_runner_on_dummy_vec_env():
+    _check_rollout(DummyVecEnv([lambda i=i: _CountEnv(i) for i in range(3)]), 3)
+
+
+def test_runner_on_vec_env_without_poll():
+    _check_rollout(_LockstepVecEnv(3), 3)
+
+
+def test_runner_on_shmem_subproc_vec_env():
+    env = SubprocVecEnv([lambda i=i: _CountEnv(i) for i in range(3)], shmem=True, ob_shape=(2,))
+    try:
+        _check_rollout(env, 3)
+    finally:
+        env.close()
+
+
+def test_runner_steps_policy_once_per_step_on_subproc_vec_env():
+    env = SubprocVecEnv([lambda i=i: _CountEnv(i, delay=0.01 * i) for i in range(4)])
+    try:
+        _check_rollout(env, 4)
+    finally:
+        env.close()
+
+
+def test_runner_does_not_wait_for_casks():
+    # env 2 is far slower than the others and is left behind as a cask
+    env = SubprocVecEnv([lambda i=i: _CountEnv(i, delay=0.5 if i == 2 else 0.0) for i in range(3)])
+    try:
+        nsteps = 3
+        runner = Runner(env=env, model=_Model(), nsteps=nsteps, gamma=0.99, lam=0.95, writer=_Writer(), num_casks=1)
+        obs = runner.run()[0]
+        assert runner.model.steps == nsteps
+        assert obs.reshape(2, nsteps, 2)[:, 0, 0].tolist() == [0, 1]
+        assert runner.in_flight == {2}
+    finally:
+        env.close()
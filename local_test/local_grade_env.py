@@ -1,13 +1,18 @@
+from collections import OrderedDict
 import numpy as np
 import gym
 from gym.spaces import Box
 from osim.env import ProstheticsEnv
 
+from nips.observation import ObservationSchema, TAIL_TARGET
+from nips.step_metrics import step_metrics
+from nips.trajectory import TrajectoryWriter, record_step
+
 OBSERVATION_SPACE = 224
 
 
 class LocalGradeEnv(ProstheticsEnv):
-    def __init__(self, random_seeds, visualization=True, integrator_accuracy=5e-5):
+    def __init__(self, random_seeds, visualization=True, integrator_accuracy=5e-5, record_dir=None):
         super().__init__(visualization, integrator_accuracy, difficulty=1)
         self.episode_length = 0
         self.original_reward = 0.0
@@ -16,17 +21,48 @@ class LocalGradeEnv(ProstheticsEnv):
         self.vx_penalty = 0.0
         self.vz_penalty = 0.0
         self.observation_space = Box(low=-10, high=+10, shape=[OBSERVATION_SPACE])
+        self.observation_schema = None
         # local grade
-        self.random_seeds = random_seeds
+        self.set_seeds(random_seeds)
+        # trajectories of the graded episodes, see nips.trajectory; one shard
+        # per episode, grading workers are terminated without close()
+        self.recorder = TrajectoryWriter(record_dir, episodes_per_shard=1) if record_dir else None
+
+    def set_seeds(self, random_seeds):
+        """
+        grade the episodes of random_seeds from the next reset on
+        """
+        self.random_seeds = list(random_seeds)
         self.num_seeds = len(self.random_seeds)
         self.seed_idx = 0
         self.total_length = 0
         self.total_reward = 0.0
+        self.results = []
+
+    def episode_result(self):
+        """
+        seed, score, length and penalty breakdown of the current episode
+        """
+        return OrderedDict([('seed', self.random_seeds[self.seed_idx - 1]),
+                            ('score', float(self.original_reward)),
+                            ('length', self.episode_length),
+                            ('shaped_reward', float(self.shaped_reward)),
+                            ('activation_penalty', float(self.activation_penalty)),
+                            ('vx_penalty', float(self.vx_penalty)),
+                            ('vz_penalty', float(self.vz_penalty))])
 
     def reset(self):
+        """
+        the first observation of the next seed's episode, None once every
+        seed is graded; the results are in self.results
+        """
+        if self.recorder is not None and self.seed_idx > 0:
+            # an episode cut short by a reset is recorded as truncated
+            self.recorder.end_episode(truncated=True, **self.episode_result())
         if self.seed_idx > 0:
             print('random seed:', self.random_seeds[self.seed_idx - 1])
             print('score:', self.original_reward, 'length:', self.episode_length)
+            self.results.append(self.episode_result())
 
         self.total_length += self.episode_length
         self.total_reward += self.original_reward
@@ -35,8 +71,7 @@ class LocalGradeEnv(ProstheticsEnv):
             print('Local Grade Finished!')
             print('mean reward:', self.total_reward / self.num_seeds)
             print('mean length:', self.total_length / self.num_seeds)
-            import sys
-            sys.exit(0)
+            return None
         super().reset(project=False, seed=self.random_seeds[self.seed_idx])
         self.seed_idx += 1
 
@@ -51,15 +86,21 @@ class LocalGradeEnv(ProstheticsEnv):
         return obs
 
     def step(self, action):
-        obs, rew, done, info = super().step(np.clip(np.array(action), 0.0, 1.0))
+        action = np.clip(np.array(action), 0.0, 1.0)
+        obs, rew, done, info = super().step(action)
         self.episode_length += 1
         self.original_reward += super().reward_round2()
         self.shaped_reward += rew
 
-        state_desc = self.get_state_desc()
-        self.activation_penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
-        self.vx_penalty += (state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) ** 2
-        self.vz_penalty += (state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) ** 2
+        metrics = step_metrics(self)
+        self.activation_penalty += metrics.activation * 0.001
+        self.vx_penalty += metrics.vx_error ** 2
+        self.vz_penalty += metrics.vz_error ** 2
+
+        if self.recorder is not None:
+            record_step(self.recorder, self, action, rew)
+            if done:
+                self.recorder.end_episode(**self.episode_result())
 
         # target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
         # pelvis_vx, pelvis_vz = state_desc['body_vel']['pelvis'][0], state_desc['body_vel']['pelvis'][2]
@@ -68,49 +109,16 @@ class LocalGradeEnv(ProstheticsEnv):
         # print(f'    target_vz={target_vz:3.2f} current_vz={pelvis_vz:3.2f}')
         return obs, rew, done, info
 
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        super().close()
+
     def get_observation(self):
         state_desc = self.get_state_desc()
-        res = []
-        pelvis = None
-
-        for body_part in ["pelvis", "head", "torso", "toes_l", "talus_l", "pros_foot_r", "pros_tibia_r"]:
-            cur = []
-            cur += state_desc["body_pos"][body_part]
-            cur += state_desc["body_vel"][body_part]
-            cur += state_desc["body_acc"][body_part]
-            cur += state_desc["body_pos_rot"][body_part]
-            cur += state_desc["body_vel_rot"][body_part]
-            cur += state_desc["body_acc_rot"][body_part]
-            if body_part == "pelvis":
-                pelvis = cur
-                res += cur[1:]  # make sense, pelvis.x is not important
-            else:
-                cur[0] -= pelvis[0]
-                cur[2] -= pelvis[2]     # relative position work for x / z axis
-                res += cur
-
-        for joint in ["ankle_l", "ankle_r", "back", "hip_l", "hip_r", "knee_l", "knee_r"]:
-            res += state_desc["joint_pos"][joint]
-            res += state_desc["joint_vel"][joint]
-            res += state_desc["joint_acc"][joint]
-
-        for muscle in sorted(state_desc["muscles"].keys()):
-            res += [state_desc["muscles"][muscle]["activation"]]
-            res += [state_desc["muscles"][muscle]["fiber_length"]]
-            res += [state_desc["muscles"][muscle]["fiber_velocity"]]
-
-        cm_pos = state_desc["misc"]["mass_center_pos"]  # relative x / z axis center of mass position
-        cm_pos[0] -= pelvis[0]
-        cm_pos[2] -= pelvis[0]
-        res = res + cm_pos
-
-        # information about target velocity
-        target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
-        current_vx, current_vz = state_desc["body_vel"]["pelvis"][0], state_desc["body_vel"]["pelvis"][2]
-        diff_vx, diff_vz = current_vx - target_vx, current_vz - target_vz
-        res = res + [diff_vz, target_vx, diff_vx, diff_vx, target_vz, diff_vz]
-
-        return res
+        if self.observation_schema is None:
+            self.observation_schema = ObservationSchema(state_desc, tail=TAIL_TARGET)
+        return self.observation_schema(state_desc)
 
 
 class LocalGradeRepeatActionEnv(gym.ActionWrapper):
@@ -127,3 +135,8 @@ class LocalGradeRepeatActionEnv(gym.ActionWrapper):
                 break
 
         return obs, total_reward, done, info
+
+
+def make_local_grade_env(random_seeds=(), record_dir=None):
+    local_env = LocalGradeEnv(random_seeds, visualization=False, record_dir=record_dir)
+    return LocalGradeRepeatActionEnv(env=local_env, repeat=2)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of ObservationSchema against the list based get_observation
+it replaced, on synthetic state descriptions.
+
+    python -m nips.bench_observation --num-calls 10000
+"""
+import argparse
+import copy
+import timeit
+import numpy as np
+from nips.observation import ObservationSchema, TAILS, TAIL_TARGET_CLIPPED, TAIL_TARGET, TAIL_MASS_CENTER
+from nips.observation import BODY_PARTS, BODY_FIELDS, JOINT_FIELDS
+
+JOINT_SIZES = {"ankle_l": 1, "ankle_r": 1, "back": 1, "hip_l": 3, "hip_r": 3, "knee_l": 1, "knee_r": 1}
+MUSCLES = ["abd_r", "add_r", "hamstrings_r", "bifemsh_r", "glut_max_r", "iliopsoas_r", "rect_fem_r", "vasti_r",
+           "abd_l", "add_l", "hamstrings_l", "bifemsh_l", "glut_max_l", "iliopsoas_l", "rect_fem_l", "vasti_l",
+           "gastroc_l", "soleus_l", "tib_ant_l"]
+
+
+def make_state_desc(seed=0, scale=1.0):
+    """
+    random state_desc with the layout of the prosthetics env
+    """
+    rng = np.random.RandomState(seed)
+
+    def values(n):
+        return (rng.randn(n) * scale).tolist()
+
+    state_desc = {field: {part: values(3) for part in BODY_PARTS} for field in BODY_FIELDS}
+    state_desc.update({field: {joint: values(n) for joint, n in JOINT_SIZES.items()} for field in JOINT_FIELDS})
+    state_desc["muscles"] = {muscle: {"activation": rng.rand(), "fiber_length": rng.rand(),
+                                      "fiber_velocity": rng.randn(), "fiber_force": rng.randn()}
+                             for muscle in MUSCLES}
+    state_desc["misc"] = {"mass_center_pos": values(3), "mass_center_vel": values(3), "mass_center_acc": values(3)}
+    state_desc["target_vel"] = values(3)
+    return state_desc
+
+
+def legacy_observation(state_desc, tail=TAIL_TARGET_CLIPPED):
+    # CustomEnv.get_observation as it was, note that it modifies state_desc
+    res = []
+    pelvis = None
+
+    for body_part in ["pelvis", "head", "torso", "toes_l", "talus_l", "pros_foot_r", "pros_tibia_r"]:
+        cur = []
+        cur += state_desc["body_pos"][body_part]
+        cur += state_desc["body_vel"][body_part]
+        cur += state_desc["body_acc"][body_part]
+        cur += state_desc["body_pos_rot"][body_part]
+        cur += state_desc["body_vel_rot"][body_part]
+        cur += state_desc["body_acc_rot"][body_part]
+        if body_part == "pelvis":
+            pelvis = cur
+            res += cur[1:]  # make sense, pelvis.x is not important
+        else:
+            cur[0] -= pelvis[0]
+            cur[2] -= pelvis[2]     # relative position work for x / z axis
+            res += cur
+
+    for joint in ["ankle_l", "ankle_r", "back", "hip_l", "hip_r", "knee_l", "knee_r"]:
+        res += state_desc["joint_pos"][joint]
+        res += state_desc["joint_vel"][joint]
+        res += state_desc["joint_acc"][joint]
+
+    for muscle in sorted(state_desc["muscles"].keys()):
+        res += [state_desc["muscles"][muscle]["activation"]]
+        res += [state_desc["muscles"][muscle]["fiber_length"]]
+        res += [state_desc["muscles"][muscle]["fiber_velocity"]]
+
+    cm_pos = state_desc["misc"]["mass_center_pos"]  # relative x / z axis center of mass position
+    cm_pos[0] -= pelvis[0]
+    cm_pos[2] -= pelvis[0]
+    res = res + cm_pos
+    if tail == TAIL_MASS_CENTER:
+        return res + state_desc["misc"]["mass_center_vel"] + state_desc["misc"]["mass_center_acc"]
+
+    # information about target velocity
+    target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
+    current_vx, current_vz = state_desc["body_vel"]["pelvis"][0], state_desc["body_vel"]["pelvis"][2]
+    diff_vx, diff_vz = current_vx - target_vx, current_vz - target_vz
+    if tail == TAIL_TARGET_CLIPPED:
+        if diff_vx > 0.3:
+            diff_vx, target_vx = 0.3, current_vx - 0.3
+        elif diff_vx < -0.3:
+            diff_vx, target_vx = -0.3, current_vx + 0.3
+
+        if diff_vz > 0.15:
+            diff_vz, target_vz = 0.15, current_vz - 0.15
+        elif diff_vz < -0.15:
+            diff_vz, target_vz = -0.15, current_vz + 0.15
+
+    res = res + [diff_vz, target_vx, diff_vx, diff_vx, target_vz, diff_vz]
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description='observation builder micro-benchmark')
+    parser.add_argument('--num-calls', default=10000, type=int, help='calls per timed run')
+    parser.add_argument('--repeat', default=5, type=int, help='number of timed runs, the best one is reported')
+    args = parser.parse_args()
+
+    print('%16s %10s %14s %10s' % ('tail', 'builder', 'per call (us)', 'speedup'))
+    for tail in TAILS:
+        state_desc = make_state_desc()
+        schema = ObservationSchema(state_desc, tail=tail)
+        expected = np.asarray(legacy_observation(copy.deepcopy(state_desc), tail), dtype=np.float32)
+        assert np.array_equal(schema(state_desc), expected), tail
+
+        # the legacy builder keeps shifting mass_center_pos, which does not change its cost
+        builders = [('legacy', lambda: np.asarray(legacy_observation(state_desc, tail), dtype=np.float32)),
+                    ('schema', lambda: schema(state_desc))]
+        baseline = None
+        for name, builder in builders:
+            best = min(timeit.repeat(builder, repeat=args.repeat, number=args.num_calls)) / args.num_calls
+            baseline = baseline or best
+            print('%16s %10s %14.2f %9.1fx' % (tail, name, best * 1e6, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
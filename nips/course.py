@@ -1,110 +1,33 @@
-
-def course_0(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = min(3.0, state_desc["body_vel"]["pelvis"][0]) * 4 + 2
-
-    lean_back = max(0, state_desc["body_pos"]["pelvis"][0] - state_desc["body_pos"]["head"][0] - 0.0)
-    reward -= lean_back * 40
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 100
-
-    return reward * 0.05
-
-
-def course_1(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = min(3.0, state_desc["body_vel"]["pelvis"][0]) * 2 + 2 \
-             + state_desc["body_vel"]["pros_foot_r"][0] + state_desc["body_vel"]["toes_l"][0]
-
-    lean_back = max(0, state_desc["body_pos"]["pelvis"][0] - state_desc["body_pos"]["head"][0] - 0.2)
-    reward -= lean_back * 40
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 100
-
-    return reward * 0.05
-
-
-def course_2_3(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = min(3.0, state_desc["body_vel"]["pelvis"][0]) * 2 + 2 \
-             + state_desc["body_vel"]["pros_foot_r"][0] + state_desc["body_vel"]["toes_l"][0]
-
-    front_foot = state_desc["body_pos"]["pros_foot_r"][0]
-    back_foot = state_desc["body_pos"]["toes_l"][0]
-    dist = max(0.0, front_foot - back_foot - 0.9)
-    reward -= dist * 40
-
-    lean_back = max(0, state_desc["body_pos"]["pelvis"][0] - state_desc["body_pos"]["head"][0] - 0.2)
-    reward -= lean_back * 40
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 100
-
-    return reward * 0.05
-
-
-def course_4(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    super_reward = 9.0 - (state_desc["body_vel"]["pelvis"][0] - 3.0) ** 2
-
-    reward = super_reward * 0.5 + 1 + state_desc["body_vel"]["pros_foot_r"][0] + state_desc["body_vel"]["toes_l"][0]
-
-    front_foot = state_desc["body_pos"]["pros_foot_r"][0]
-    back_foot = state_desc["body_pos"]["toes_l"][0]
-    dist = max(0.0, front_foot - back_foot - 0.9)
-    reward -= dist * 40
-
-    lean_back = max(0, state_desc["body_pos"]["pelvis"][0] - state_desc["body_pos"]["head"][0] - 0.2)
-    reward -= lean_back * 40
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 100
-
-    return reward * 0.05
-
-
-def course_5(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    pelvis_vx = state_desc["body_vel"]["pelvis"][0]
-    if pelvis_vx < 1.0:
-        reward = -1
-    else:
-        reward = 9.0 - (pelvis_vx - 3.0) ** 2
-
-    front_foot = state_desc["body_pos"]["pros_foot_r"][0]
-    back_foot = state_desc["body_pos"]["toes_l"][0]
-    dist = max(0.0, front_foot - back_foot - 0.9)
-    reward -= dist * 40
-
-    lean_back = max(0, state_desc["body_pos"]["pelvis"][0] - state_desc["body_pos"]["head"][0] - 0.2)
-    reward -= lean_back * 40
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.7 - pelvis) * 100
-
-    pelvis_z = abs(state_desc["body_pos"]["pelvis"][2])
-    reward -= max(0, pelvis_z - 0.6) * 100
-
-    return reward * 0.05
+from nips.step_metrics import RewardTerms, Term
+
+FEET_VELOCITY = [Term(1, "pros_foot_vx"), Term(1, "toes_vx")]
+LEAN_BACK = [Term(-40, "lean_back", "hinge_above", 0.2)]
+STRIDE = [Term(-40, "stride", "hinge_above", 0.9)]
+LOW_PELVIS = [Term(-100, "pelvis_y", "hinge_below", 0.70)]
+
+course_0 = RewardTerms([
+    Term(4, "pelvis_vx", "min", 3.0), Term(2, "one"),
+    Term(-40, "lean_back", "hinge_above", 0.0),
+] + LOW_PELVIS, scale=0.05)
+
+course_1 = RewardTerms([
+    Term(2, "pelvis_vx", "min", 3.0), Term(2, "one"),
+] + FEET_VELOCITY + LEAN_BACK + LOW_PELVIS, scale=0.05)
+
+course_2_3 = RewardTerms([
+    Term(2, "pelvis_vx", "min", 3.0), Term(2, "one"),
+] + FEET_VELOCITY + STRIDE + LEAN_BACK + LOW_PELVIS, scale=0.05)
+
+# 0.5 * (9 - (vx - 3) ** 2) + 1
+course_4 = RewardTerms([
+    Term(5.5, "one"), Term(-0.5, "pelvis_vx", "square", 3.0),
+] + FEET_VELOCITY + STRIDE + LEAN_BACK + LOW_PELVIS, scale=0.05)
+
+# -1 below 1 m/s, 9 - (vx - 3) ** 2 above
+course_5 = RewardTerms([
+    Term(-1, "one", gate="pelvis_vx", gate_threshold=1.0, gate_above=False),
+    Term(9, "one", gate="pelvis_vx", gate_threshold=1.0),
+    Term(-1, "pelvis_vx", "square", 3.0, gate="pelvis_vx", gate_threshold=1.0),
+] + STRIDE + LEAN_BACK + LOW_PELVIS + [
+    Term(-100, "pelvis_abs_z", "hinge_above", 0.6),
+], scale=0.05)
@@ -2,6 +2,8 @@ from osim.env import ProstheticsEnv
 import gym
 from gym.spaces import Box
 
+from nips.observation import ObservationSchema, TAIL_MASS_CENTER
+
 OBSERVATION_SPACE = 224
 
 
@@ -14,6 +16,7 @@ class CustomEnv(ProstheticsEnv):
         self.episode_shaped_reward = 0.0
 
         self.observation_space = Box(low=-10, high=+10, shape=[OBSERVATION_SPACE])
+        self.observation_schema = None
 
     def step(self, action, project=True):
         obs, r, done, info = super(CustomEnv, self).step(action)
@@ -48,42 +51,9 @@ class CustomEnv(ProstheticsEnv):
 
     def get_observation(self):
         state_desc = self.get_state_desc()
-
-        res = []
-        pelvis = None
-
-        for body_part in ["pelvis", "head", "torso", "toes_l", "talus_l", "pros_foot_r", "pros_tibia_r"]:
-            cur = []
-            cur += state_desc["body_pos"][body_part]
-            cur += state_desc["body_vel"][body_part]
-            cur += state_desc["body_acc"][body_part]
-            cur += state_desc["body_pos_rot"][body_part]
-            cur += state_desc["body_vel_rot"][body_part]
-            cur += state_desc["body_acc_rot"][body_part]
-            if body_part == "pelvis":
-                pelvis = cur
-                res += cur[1:]  # make sense, pelvis.x is not important
-            else:
-                cur[0] -= pelvis[0]
-                cur[2] -= pelvis[2]     # relative position work for x / z axis
-                res += cur
-
-        for joint in ["ankle_l", "ankle_r", "back", "hip_l", "hip_r", "knee_l", "knee_r"]:
-            res += state_desc["joint_pos"][joint]
-            res += state_desc["joint_vel"][joint]
-            res += state_desc["joint_acc"][joint]
-
-        for muscle in sorted(state_desc["muscles"].keys()):
-            res += [state_desc["muscles"][muscle]["activation"]]
-            res += [state_desc["muscles"][muscle]["fiber_length"]]
-            res += [state_desc["muscles"][muscle]["fiber_velocity"]]
-
-        cm_pos = state_desc["misc"]["mass_center_pos"]  # relative x / z axis center of mass position
-        cm_pos[0] -= pelvis[0]
-        cm_pos[2] -= pelvis[0]
-        res = res + cm_pos + state_desc["misc"]["mass_center_vel"] + state_desc["misc"]["mass_center_acc"]
-
-        return res
+        if self.observation_schema is None:
+            self.observation_schema = ObservationSchema(state_desc, tail=TAIL_MASS_CENTER)
+        return self.observation_schema(state_desc)
 
     def reward(self):
         state_desc = self.get_state_desc()
@@ -0,0 +1,111 @@
+"""
+Local grading of a checkpoint over many seeds in parallel.
+
+Every worker process builds one grading env when it starts and then grades
+one (checkpoint, seed) pair per task, loading each checkpoint's PolicyRunner
+once. N seeds on N cores take about as long as the slowest episode.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import os.path as osp
+from collections import OrderedDict
+import numpy as np
+
+from nips.policy_runner import PolicyRunner
+
+_worker = {}
+
+
+def _make_local_grade_env(record_dir=None):
+    # imported here, the parent process does not need osim
+    from local_test.local_grade_env import make_local_grade_env
+    return make_local_grade_env(record_dir=record_dir)
+
+
+def _init_worker(make_env, record_dir, runner_kwargs):
+    make_env = make_env or _make_local_grade_env
+    _worker['env'] = make_env(record_dir=record_dir) if record_dir else make_env()
+    _worker['runner_kwargs'] = runner_kwargs
+    _worker['runners'] = {}
+
+
+def grade_pair(pair):
+    """
+    grade the episode of (path, seed) in this worker, the result of
+    episode_result()
+    """
+    path, seed = pair
+    runners = _worker['runners']
+    if path not in runners:
+        runners[path] = PolicyRunner.load(path, **_worker['runner_kwargs'])
+    env, runner = _worker['env'], runners[path]
+    grade_env = env.unwrapped
+    grade_env.set_seeds([seed])
+    # sampled actions are reproducible per seed
+    runner.rng.seed(seed % 2 ** 32)
+    obs, done = env.reset(), False
+    while not done:
+        obs, _, done, _ = env.step(runner.act(obs))
+    return grade_env.episode_result()
+
+
+def grade_pairs(pairs, processes=None, make_env=None, record_dir=None, **runner_kwargs):
+    """
+    Yields ((path, seed), result) for every pair as it finishes. make_env()
+    builds the env of a worker, by default a LocalGradeEnv with repeated
+    actions; its unwrapped env needs set_seeds and episode_result. With
+    record_dir, make_env(record_dir=record_dir) records the graded episodes
+    there, see nips.trajectory. runner_kwargs go to PolicyRunner.load.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return
+    processes = processes or min(len(pairs), os.cpu_count() or 1)
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(make_env, record_dir, runner_kwargs)) as pool:
+        for i, result in pool.imap_unordered(_grade_indexed, enumerate(pairs)):
+            yield pairs[i], result
+
+
+def _grade_indexed(item):
+    i, pair = item
+    return i, grade_pair(pair)
+
+
+def grade(path, seeds, processes=None, make_env=None, record_dir=None, **runner_kwargs):
+    """
+    The results of grading the checkpoint at path on every seed, in the
+    order of seeds, see grade_pairs.
+    """
+    seeds = list(seeds)
+    results = dict(grade_pairs([(path, seed) for seed in seeds], processes, make_env, record_dir, **runner_kwargs))
+    return [results[path, seed] for seed in seeds]
+
+
+def summarize(results):
+    scores = np.array([r['score'] for r in results], dtype=np.float64)
+    lengths = np.array([r['length'] for r in results], dtype=np.float64)
+    return OrderedDict([('seeds', len(results)),
+                        ('mean_score', float(scores.mean())),
+                        ('std_score', float(scores.std())),
+                        ('min_score', float(scores.min())),
+                        ('mean_length', float(lengths.mean()))])
+
+
+def write_results(results, path):
+    """
+    per seed results as CSV if path ends with .csv, else as JSON together
+    with their summary
+    """
+    dirname = osp.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, 'w') as f:
+            json.dump(OrderedDict([('summary', summarize(results)), ('results', results)]), f, indent=2)
@@ -0,0 +1,105 @@
+import functools
+import itertools
+import operator
+import numpy as np
+
+BODY_PARTS = ["pelvis", "head", "torso", "toes_l", "talus_l", "pros_foot_r", "pros_tibia_r"]
+BODY_FIELDS = ["body_pos", "body_vel", "body_acc", "body_pos_rot", "body_vel_rot", "body_acc_rot"]
+JOINTS = ["ankle_l", "ankle_r", "back", "hip_l", "hip_r", "knee_l", "knee_r"]
+JOINT_FIELDS = ["joint_pos", "joint_vel", "joint_acc"]
+MUSCLE_FIELDS = ["activation", "fiber_length", "fiber_velocity"]
+
+# what follows the mass center position
+TAIL_TARGET_CLIPPED = 'target_clipped'  # round 2 training: velocity error clipped to +-0.3 / +-0.15
+TAIL_TARGET = 'target'                  # local grading: unclipped velocity error
+TAIL_MASS_CENTER = 'mass_center'        # round 1: mass center velocity and acceleration
+TAILS = (TAIL_TARGET_CLIPPED, TAIL_TARGET, TAIL_MASS_CENTER)
+
+
+class ObservationSchema(object):
+    """
+    Layout of the observation vector, compiled once from a state_desc.
+
+    The dictionary walk of the original CustomEnv.get_observation is turned
+    into one itemgetter per top level field (muscle names sorted once), the
+    fetched lists are concatenated in observation order at C level, the
+    pelvis-relative offsets are applied to the few entries that need them and
+    the list is converted in a single pass. The result is identical to the
+    original list cast to dtype, except that state_desc is not modified in
+    place any more.
+    """
+    def __init__(self, state_desc, tail=TAIL_TARGET_CLIPPED, dtype=np.float32):
+        assert tail in TAILS, tail
+        self.tail = tail
+        self.dtype = dtype
+        self.muscles = sorted(state_desc["muscles"].keys())
+        self._body_getters = [(field, operator.itemgetter(*BODY_PARTS)) for field in BODY_FIELDS]
+        self._joint_getters = [(field, operator.itemgetter(*JOINTS)) for field in JOINT_FIELDS]
+        self._muscle_getter = operator.itemgetter(*self.muscles)
+        self._muscle_fields = operator.itemgetter(*MUSCLE_FIELDS)
+        misc = ["mass_center_pos"]
+        if tail == TAIL_MASS_CENTER:
+            misc += ["mass_center_vel", "mass_center_acc"]
+        self._misc_getter = operator.itemgetter(*misc) if len(misc) > 1 \
+            else (lambda d, key=misc[0]: (d[key],))
+
+        # offsets of the relative entries in the flat list, pelvis.x still included
+        rel = []
+        size = 0
+        for part in BODY_PARTS:
+            if part == "pelvis":
+                pelvis_x, pelvis_z = size, size + 2
+            else:
+                # relative position work for x / z axis
+                rel += [(size, pelvis_x), (size + 2, pelvis_z)]
+            size += sum(len(state_desc[field][part]) for field in BODY_FIELDS)
+        size += sum(len(state_desc[field][joint]) for joint in JOINTS for field in JOINT_FIELDS)
+        size += len(self.muscles) * len(MUSCLE_FIELDS)
+        # relative x / z axis center of mass position, z is relative to pelvis.x as it always was
+        rel += [(size, pelvis_x), (size + 2, pelvis_x)]
+        size += sum(len(state_desc["misc"][key]) for key in misc)
+        self._rel = rel
+        # pelvis.x is dropped from the front, the target velocity tail appended at the back
+        self.size = size - 1 + (6 if tail != TAIL_MASS_CENTER else 0)
+
+    def flatten(self, state_desc):
+        """
+        body, joint, muscle and mass center values in observation order, pelvis.x included
+        """
+        chain = itertools.chain.from_iterable
+        body = zip(*[getter(state_desc[field]) for field, getter in self._body_getters])
+        joints = zip(*[getter(state_desc[field]) for field, getter in self._joint_getters])
+        flat = functools.reduce(operator.iconcat, chain(body), [])
+        functools.reduce(operator.iconcat, chain(joints), flat)
+        muscles = self._muscle_getter(state_desc["muscles"])
+        functools.reduce(operator.iconcat, map(self._muscle_fields, muscles), flat)
+        return functools.reduce(operator.iconcat, self._misc_getter(state_desc["misc"]), flat)
+
+    def __call__(self, state_desc, out=None):
+        flat = self.flatten(state_desc)
+        for i, j in self._rel:
+            flat[i] -= flat[j]
+        del flat[0]  # make sense, pelvis.x is not important
+
+        if self.tail != TAIL_MASS_CENTER:
+            # information about target velocity
+            target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
+            current_vx, current_vz = state_desc["body_vel"]["pelvis"][0], state_desc["body_vel"]["pelvis"][2]
+            diff_vx, diff_vz = current_vx - target_vx, current_vz - target_vz
+            if self.tail == TAIL_TARGET_CLIPPED:
+                if diff_vx > 0.3:
+                    diff_vx, target_vx = 0.3, current_vx - 0.3
+                elif diff_vx < -0.3:
+                    diff_vx, target_vx = -0.3, current_vx + 0.3
+
+                if diff_vz > 0.15:
+                    diff_vz, target_vz = 0.15, current_vz - 0.15
+                elif diff_vz < -0.15:
+                    diff_vz, target_vz = -0.15, current_vz + 0.15
+            flat += (diff_vz, target_vx, diff_vx, diff_vx, target_vz, diff_vz)
+
+        obs = np.fromiter(flat, dtype=self.dtype, count=self.size)
+        if out is None:
+            return obs
+        out[:] = obs
+        return out
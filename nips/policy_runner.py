@@ -0,0 +1,109 @@
+import os.path as osp
+import pickle
+import joblib
+import numpy as np
+
+from baselines.common import checkpoint
+from baselines.common.running_mean_std import RunningMeanStd
+
+# the trainable variables of MlpPolicy in creation order, the order of the
+# arrays in a legacy joblib checkpoint
+MLP_PARAMS = ("pi_fc1/w", "pi_fc1/b", "pi_fc2/w", "pi_fc2/b", "vf_fc1/w", "vf_fc1/b", "vf_fc2/w", "vf_fc2/b",
+              "vf/w", "vf/b", "pi/w", "pi/b", "logstd")
+
+
+def legacy_rms_path(path):
+    """
+    the %.5i_ob_rms.pkl next to the legacy joblib checkpoint at path
+    """
+    checkdir, update = osp.split(path)
+    return osp.join(checkdir, "%.5i_ob_rms.pkl" % int(update))
+
+
+def load_params(path):
+    """
+    (params, ob_rms) of a checkpoint: params maps the MLP_PARAMS names to
+    arrays, ob_rms is None when the checkpoint has none. path is either a
+    .ckpt file or a legacy joblib file next to its %.5i_ob_rms.pkl.
+    """
+    if checkpoint.is_checkpoint(path):
+        arrays, _ = checkpoint.load(path, mmap=False)
+        params = {name: np.array(arrays["model/%s:0" % name]) for name in MLP_PARAMS}
+        return params, checkpoint.rms_from_arrays(arrays, "ob_rms")
+
+    loaded = joblib.load(path)
+    assert len(loaded) == len(MLP_PARAMS), "%s holds %d arrays, not an MlpPolicy" % (path, len(loaded))
+    params = dict(zip(MLP_PARAMS, loaded))
+    ob_rms = None
+    rms_path = legacy_rms_path(path)
+    if osp.exists(rms_path):
+        with open(rms_path, "rb") as ob_rms_fp:
+            ob_rms = pickle.load(ob_rms_fp)
+    return params, ob_rms
+
+
+class PolicyRunner(object):
+    """
+    The MlpPolicy of a checkpoint in NumPy: two 64 unit tanh layers to the
+    Gaussian mean and to the value, no TensorFlow involved.
+
+    Observations are normalized like a VecNormalize with frozen ob_rms (both
+    use RunningMeanStd.affine): clipped to [-clipob, clipob], except for the
+    last npassthrough columns, which are used as they are. npassthrough is 0
+    by default, as in the VecNormalize copies of local_test and submission. Actions are the mean, or samples of the
+    Gaussian when deterministic is False.
+    """
+    def __init__(self, params, ob_rms=None, clipob=10., epsilon=1e-8, npassthrough=0,
+                 deterministic=True, seed=None):
+        p = {name: np.asarray(params[name], dtype=np.float32) for name in MLP_PARAMS}
+        self.pi = [(p["pi_fc1/w"], p["pi_fc1/b"]), (p["pi_fc2/w"], p["pi_fc2/b"])]
+        self.vf = [(p["vf_fc1/w"], p["vf_fc1/b"]), (p["vf_fc2/w"], p["vf_fc2/b"])]
+        self.pi_out = (p["pi/w"], p["pi/b"])
+        self.vf_out = (p["vf/w"][:, 0], p["vf/b"][0])
+        self.std = np.exp(p["logstd"][0])
+        self.deterministic = deterministic
+        self.rng = np.random.RandomState(seed)
+
+        ob_size = self.pi[0][0].shape[0]
+        passthrough = np.zeros(ob_size, dtype=np.bool_)
+        passthrough[ob_size - npassthrough:] = True
+        if ob_rms is None:
+            passthrough[:] = True
+            ob_rms = RunningMeanStd(shape=(ob_size,))
+        # the same precomputation as VecNormalize(frozen=True)
+        self.scale, self.offset, self.low, self.high = ob_rms.affine(clipob, epsilon, passthrough)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        a PolicyRunner for the checkpoint at path, see load_params
+        """
+        params, ob_rms = load_params(path)
+        return cls(params, ob_rms, **kwargs)
+
+    def _normalize(self, ob):
+        x = np.asarray(ob, dtype=np.float32) * self.scale
+        x += self.offset
+        return np.clip(x, self.low, self.high, out=x)
+
+    @staticmethod
+    def _hidden(x, layers):
+        for w, b in layers:
+            x = np.tanh(x.dot(w) + b)
+        return x
+
+    def act(self, ob):
+        """
+        the action for one observation, or the actions for a batch of them
+        """
+        x = self._normalize(ob)
+        w, b = self.pi_out
+        mean = self._hidden(x, self.pi).dot(w) + b
+        if self.deterministic:
+            return mean
+        return mean + self.std * self.rng.standard_normal(mean.shape).astype(np.float32)
+
+    def value(self, ob):
+        x = self._normalize(ob)
+        w, b = self.vf_out
+        return self._hidden(x, self.vf).dot(w) + b
@@ -1,112 +1,367 @@
+import time
 import numpy as np
+from baselines import logger
+from baselines.common.timing import LatencyHistogram
 from baselines.common.vec_env import VecEnv
+from baselines.common.vec_env.shmem_transport import ShmemTransport
 import ray
 
 from nips.round2_env import OBSERVATION_SPACE
 
 
+def _kill(actor):
+    # ray.kill only exists from ray 0.8 on
+    if hasattr(ray, 'kill'):
+        ray.kill(actor)
+    else:
+        actor.__ray_terminate__.remote()
+
+
 class TaskPool(object):
     """Helper class for tracking the status of many in-flight actor tasks."""
 
-    def __init__(self, timeout=1):
+    def __init__(self, timeout=None):
         self._tasks = {}
         self.timeout = timeout
 
     def add(self, worker, obj_id):
         self._tasks[obj_id] = worker
 
-    def completed(self):
+    def completed(self, min_ready=1, timeout=None):
+        """
+        Block until at least `min_ready` tasks finished or `timeout` seconds
+        passed, then return every finished (worker, obj_id) pair.
+        """
         pending = list(self._tasks)
-        if pending:
-            ready, _ = ray.wait(pending, num_returns=len(pending), timeout=self.timeout)
-            if not ready:
-                return []
-            for obj_id in ready:
-                yield (self._tasks.pop(obj_id), obj_id)
+        if not pending:
+            return []
+        timeout = self.timeout if timeout is None else timeout
+        ready, rest = ray.wait(pending, num_returns=min(min_ready, len(pending)), timeout=timeout)
+        if ready and rest:
+            # sweep up everything else that is already done
+            more, _ = ray.wait(rest, num_returns=len(rest), timeout=0)
+            ready = ready + more
+        return [(self._tasks.pop(obj_id), obj_id) for obj_id in ready]
+
+    def workers(self):
+        return set(self._tasks.values())
+
+    def items(self):
+        return list(self._tasks.items())
+
+    def remove(self, obj_id):
+        return self._tasks.pop(obj_id)
 
     @property
     def count(self):
         return len(self._tasks)
 
 
-class Actor(object):
+class ActorGroup(object):
+    """Hosts several envs in one actor process and steps them in a local loop."""
 
-    def __init__(self, aid, env_fn):
+    def __init__(self, aid, env_fns, env_offset=0, transport=None):
         self.aid = aid
-        self.env = env_fn()
+        self.envs = [env_fn() for env_fn in env_fns]
+        # with a transport, results go to shared memory rows env_offset + i
+        self.env_offset = env_offset
+        self.transport = transport
 
-    def step(self, action):
-        ob, reward, done, info = self.env.step(action)
-        if done:
-            ob = self.env.reset()
-        return ob, reward, done, info
+    def step(self, env_ids, actions):
+        obs, rews, dones, infos = [], [], [], []
+        for i, action in zip(env_ids, actions):
+            env = self.envs[i]
+            ob, reward, done, info = env.step(action)
+            if done:
+                ob = env.reset()
+            if self.transport is not None:
+                # only the slot number travels back through ray
+                obs.append(self.transport.write(self.env_offset + i, ob, reward, done))
+            else:
+                obs.append(ob)
+                rews.append(reward)
+                dones.append(done)
+            infos.append(info)
+        if self.transport is not None:
+            return obs, infos
+        return np.asarray(obs), np.asarray(rews), np.asarray(dones, dtype=np.bool_), infos
 
     def reset(self):
-        return self.env.reset()
+        return np.asarray([env.reset() for env in self.envs])
+
+    def seed(self, seed):
+        return [env.seed(seed + i) for i, env in enumerate(self.envs)]
 
     def get_spaces(self):
-        return self.env.observation_space, self.env.action_space
+        return self.envs[0].observation_space, self.envs[0].action_space
 
     def get_id(self):
         return self.aid
 
+    def close(self):
+        # closing the envs writes out what their recorders still buffer
+        for env in self.envs:
+            env.close()
+
+
+class ActorHealth(object):
+    """
+    Step latency of one actor as an exponentially weighted moving average
+    and a LatencyHistogram for the tail, and how often it was replaced.
+    """
+    def __init__(self, decay=0.9):
+        self.decay = decay
+        self.ewma = 0.0
+        self.latency = LatencyHistogram()
+        self.replacements = 0
+
+    def add(self, seconds):
+        self.ewma = seconds if self.latency.count == 0 else self.decay * self.ewma + (1 - self.decay) * seconds
+        self.latency.add(seconds)
+
+    @property
+    def p99(self):
+        return self.latency.percentile(99)
+
+    def reset(self):
+        self.ewma = 0.0
+        self.latency.reset()
+
 
 class RemoteVecEnv(VecEnv):
-    def __init__(self, env_fns, spaces=None):
+    def __init__(self, env_fns, spaces=None, envs_per_actor=1, shmem=False, timing=False, step_timeout=None):
         """
-        envs: list of gym environments to run in subprocesses
+        envs: list of gym environments to run in ray actors
+        envs_per_actor: number of envs hosted by one actor, a step of
+            several envs of the same actor is a single ray task
+        shmem: return step results through a ShmemTransport instead of the
+            ray object store, all actors must run on this machine
+        timing: keep a LatencyHistogram per actor in step_latency, of the
+            time from dispatching a step to the poll that returns it
+        step_timeout: kill actors whose step raises or is not back after
+            step_timeout seconds, and start reseeded ones in their place. Their
+            envs are returned by poll as reset, done and flagged "replaced"
+            once the new actor reset them; a replacement that does not reset
+            within step_timeout is replaced again. Without it step errors are
+            raised.
         """
         self.waiting = False
         self.closed = False
-        self.task_pool = TaskPool(timeout=10)
+        self.task_pool = TaskPool()
+        self.envs_per_actor = envs_per_actor
 
         nenvs = len(env_fns)
+        self.transport = ShmemTransport(nenvs, (OBSERVATION_SPACE,)) if shmem else None
 
         self.actors = []
-        self.actor_to_i = {}
-        remote_actor = ray.remote(Actor)
-        for i in range(nenvs):
-            actor = remote_actor.remote(i, env_fns[i])
+        self.actor_env_fns = []
+        self.remote_actor = ray.remote(ActorGroup)
+        for start in range(0, nenvs, envs_per_actor):
+            actor = self.remote_actor.remote(len(self.actors), env_fns[start:start + envs_per_actor],
+                                             env_offset=start, transport=self.transport)
             self.actors.append(actor)
-            self.actor_to_i[actor] = i
+            self.actor_env_fns.append(env_fns[start:start + envs_per_actor])
 
         observation_space, action_space = ray.get(self.actors[0].get_spaces.remote())
         VecEnv.__init__(self, len(env_fns), observation_space, action_space)
 
         self.results = [([0] * OBSERVATION_SPACE, 0, False, {"bad": True})] * self.num_envs
+        self.step_latency = [LatencyHistogram() for _ in self.actors] if timing else None
+        self.step_timeout = step_timeout
+        self.health = [ActorHealth() for _ in self.actors]
+        self.dispatch_time = {}
+        # reset tasks of replacement actors, in the task pool like steps
+        self.resetting = set()
 
-    def step_async(self, actions):
-        for actor, action in zip(self.actors, actions):
-            # print(action, any(action))
-            if any(action):
-                # print(self.actor_to_i[actor], action)
-                self.task_pool.add(actor, actor.step.remote(action))
+    def step_async(self, actions, env_ids=None):
+        """
+        Send actions[k] to env env_ids[k]. Without env_ids, every env whose
+        action is not all zeros is stepped (legacy lockstep call).
+        """
+        if env_ids is None:
+            env_ids = [i for i, action in enumerate(actions) if any(action)]
+            actions = [actions[i] for i in env_ids]
+        in_flight = self.in_flight()
+        groups = {}
+        for i, action in zip(env_ids, actions):
+            assert i not in in_flight, 'env %d is already stepping' % i
+            ids, group_actions = groups.setdefault(i // self.envs_per_actor, ([], []))
+            ids.append(i)
+            group_actions.append(action)
+        for aid, (ids, group_actions) in groups.items():
+            local_ids = [i % self.envs_per_actor for i in ids]
+            obj_id = self.actors[aid].step.remote(local_ids, np.asarray(group_actions))
+            self.task_pool.add(tuple(ids), obj_id)
+            self.dispatch_time[obj_id] = time.perf_counter()
         self.waiting = True
 
+    def in_flight(self):
+        return set(i for ids in self.task_pool.workers() for i in ids)
+
+    def poll(self, min_ready=1, timeout=None):
+        """
+        Wait until at least min_ready in-flight steps finished, or timeout
+        seconds passed, and return the envs that did:
+        (env_ids, obs, rews, dones, infos), all aligned with env_ids.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            finished = self.task_pool.completed(min_ready, self._wait_time(deadline))
+            blocks, replaced, raised = self._fetch(finished)
+            hung = self._hung()
+            failed = raised | hung
+            # results the replaced actors returned before failing are dropped
+            blocks = [(ids, block) for ids, block in blocks if ids[0] // self.envs_per_actor not in failed]
+            # actors whose step raised still respond, hung ones are not waited for
+            for aid in sorted(failed):
+                self._replace(aid, flush=aid not in hung)
+            if blocks or replaced or self.step_timeout is None or self.task_pool.count == 0 or \
+                    (deadline is not None and time.perf_counter() >= deadline):
+                break
+        self.waiting = self.task_pool.count > 0
+        return self._results(blocks, replaced)
+
+    def _wait_time(self, deadline):
+        """
+        how long to wait for results, with a step_timeout at most until the
+        oldest step in flight times out
+        """
+        now = time.perf_counter()
+        wait = None if deadline is None else max(deadline - now, 0.0)
+        if self.step_timeout is not None and self.dispatch_time:
+            expiry = max(min(self.dispatch_time.values()) + self.step_timeout - now, 0.0)
+            wait = expiry if wait is None else min(wait, expiry)
+        return wait
+
+    def _fetch(self, finished):
+        """
+        [(env_ids, block)] of the finished steps, [(env_ids, obs)] of the
+        finished resets of replacement actors and the set of actors whose
+        step or reset raised
+        """
+        now = time.perf_counter()
+        obj_ids = [obj_id for _, obj_id in finished]
+        try:
+            values = ray.get(obj_ids)
+        except Exception:  # pylint: disable=W0703
+            if self.step_timeout is None:
+                raise
+            values = [self._get_or_error(obj_id) for obj_id in obj_ids]
+        blocks, replaced, failed = [], [], set()
+        for (ids, obj_id), value in zip(finished, values):
+            aid = ids[0] // self.envs_per_actor
+            seconds = now - self.dispatch_time.pop(obj_id)
+            is_reset = obj_id in self.resetting
+            self.resetting.discard(obj_id)
+            if isinstance(value, Exception):
+                logger.warn('actor %d failed: %s' % (aid, value))
+                failed.add(aid)
+                continue
+            if is_reset:
+                replaced.append((np.array(ids, dtype=np.int64), value))
+                continue
+            self.health[aid].add(seconds)
+            if self.step_latency is not None:
+                self.step_latency[aid].add(seconds)
+            blocks.append((ids, value))
+        return blocks, replaced, failed
+
+    @staticmethod
+    def _get_or_error(obj_id):
+        try:
+            return ray.get(obj_id)
+        except Exception as e:  # pylint: disable=W0703
+            return e
+
+    def _hung(self):
+        if self.step_timeout is None:
+            return set()
+        now = time.perf_counter()
+        hung = set()
+        for obj_id, ids in self.task_pool.items():
+            if now - self.dispatch_time[obj_id] > self.step_timeout:
+                aid = ids[0] // self.envs_per_actor
+                logger.warn('actor %d did not return a step or reset in %g seconds' % (aid, self.step_timeout))
+                hung.add(aid)
+        return hung
+
+    def _replace(self, aid, flush=False):
+        """
+        kill actor aid and start a freshly seeded one with the same envs,
+        whose reset is polled like a step. With flush, the old actor first
+        gets up to step_timeout seconds to close its envs.
+        """
+        for obj_id, ids in self.task_pool.items():
+            if ids[0] // self.envs_per_actor == aid:
+                self.task_pool.remove(obj_id)
+                del self.dispatch_time[obj_id]
+                self.resetting.discard(obj_id)
+        if flush:
+            ray.wait([self.actors[aid].close.remote()], timeout=self.step_timeout)
+        _kill(self.actors[aid])
+        start = aid * self.envs_per_actor
+        actor = self.remote_actor.remote(aid, self.actor_env_fns[aid], env_offset=start, transport=self.transport)
+        actor.seed.remote(int(np.random.randint(2 ** 31 - 1)))
+        self.actors[aid] = actor
+        self.health[aid].reset()
+        self.health[aid].replacements += 1
+        obj_id = actor.reset.remote()
+        self.task_pool.add(tuple(range(start, start + len(self.actor_env_fns[aid]))), obj_id)
+        self.dispatch_time[obj_id] = time.perf_counter()
+        self.resetting.add(obj_id)
+
+    def _results(self, blocks, replaced):
+        env_ids = [np.array([i for ids, _ in blocks for i in ids], dtype=np.int64)]
+        if not blocks:
+            obs, rews, dones, infos = (np.zeros((0,) + self.observation_space.shape), np.zeros(0),
+                                       np.zeros(0, dtype=np.bool_), [])
+        elif self.transport is not None:
+            slots, infos = zip(*[block for _, block in blocks])
+            obs, rews, dones = self.transport.read(env_ids[0], [slot for block in slots for slot in block])
+            infos = [info for block in infos for info in block]
+        else:
+            obs, rews, dones, infos = zip(*[block for _, block in blocks])
+            obs, rews, dones = np.concatenate(obs), np.concatenate(rews), np.concatenate(dones)
+            infos = [info for block in infos for info in block]
+        if not replaced:
+            return env_ids[0], obs, rews, dones, infos
+        obs, rews, dones = [obs], [rews], [dones]
+        for ids, reset_obs in replaced:
+            env_ids.append(ids)
+            obs.append(reset_obs)
+            rews.append(np.zeros(len(ids)))
+            dones.append(np.ones(len(ids), dtype=np.bool_))
+            infos = infos + [{"replaced": True} for _ in ids]
+        return np.concatenate(env_ids), np.concatenate(obs), np.concatenate(rews), np.concatenate(dones), infos
+
     def step_wait(self):
-        done_ids = set([])
-
-        count = 0
-        while count * 2 < self.task_pool.count:
-            for actor, obj in self.task_pool.completed():
-                _i = self.actor_to_i[actor]
-                done_ids.add(_i)
-                self.results[_i] = ray.get(obj)
-                count += 1
-        # print(count, self.task_pool.count, done_ids)
-        self.waiting = False
+        # lockstep compatibility: wait for a third of the in-flight envs, the
+        # others repeat their last result flagged as "bad"
+        env_ids, obs, rews, dones, infos = self.poll(min_ready=(self.task_pool.count + 2) // 3)
+        for k, i in enumerate(env_ids):
+            self.results[i] = (obs[k], rews[k], dones[k], infos[k])
         obs, rews, dones, infos = zip(*self.results)
+        done_ids = set(env_ids.tolist())
         for i in range(self.num_envs):
             infos[i]["bad"] = i not in done_ids
         return np.stack(obs), np.stack(rews), np.stack(dones), infos
 
     def reset(self):
         obj_ids = [actor.reset.remote() for actor in self.actors]
-        results = ray.get(ray.wait(obj_ids, num_returns=self.num_envs)[0])
+        results = ray.get(obj_ids)
         # TODO: should update self.results, but it's ok because this function will be invoked only at first
-        return np.stack(results)
+        return np.concatenate(results)
 
     def close(self):
         if self.closed:
             return
+        # the envs' recorders flush on close; queued behind the steps in flight
+        closing = [actor.close.remote() for actor in self.actors]
+        ready, _ = ray.wait(closing, num_returns=len(closing), timeout=self.step_timeout)
+        for obj_id in ready:
+            error = self._get_or_error(obj_id)
+            if isinstance(error, Exception):
+                logger.warn('closing an actor failed: %s' % error)
+        if self.transport is not None:
+            self.transport.close()
         self.closed = True
@@ -1,125 +1,25 @@
+from nips.step_metrics import RewardTerms, Term
 
-
-def checkpoints_0(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = 2
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 20
-
-    penalty = 0
+PENALTIES = [
+    Term(-20, "pelvis_y", "hinge_below", 0.70),
     # Small penalty for too much activation (cost of transport)
-    penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
+    Term(-0.001, "activation"),
     # Big penalty for not matching the vector on the X,Z projection.
     # No penalty for the vertical axis
-    penalty += abs(state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) * 2
-    penalty += abs(state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) * 2
-
-    reward -= penalty
-
-    return reward * 0.5
+    Term(-2, "vx_error", "abs"),
+    Term(-2, "vz_error", "abs"),
+]
 
+checkpoints_0 = RewardTerms([Term(2, "one")] + PENALTIES, scale=0.5)
 
 # 接checkpoints_0
-def checkpoints_1(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = 2 + state_desc["body_vel"]["pelvis"][0]
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 20
-
-    penalty = 0
-    # Small penalty for too much activation (cost of transport)
-    penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
-    # Big penalty for not matching the vector on the X,Z projection.
-    # No penalty for the vertical axis
-    penalty += abs(state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) * 2
-    penalty += abs(state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) * 2
-
-    reward -= penalty
-
-    return reward * 0.5
-
+checkpoints_1 = RewardTerms([Term(2, "one"), Term(1, "pelvis_vx")] + PENALTIES, scale=0.5)
 
 # 接checkpoints_1
-def checkpoints_2(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = 2
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 20
-
-    penalty = 0
-    # Small penalty for too much activation (cost of transport)
-    penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
-    # Big penalty for not matching the vector on the X,Z projection.
-    # No penalty for the vertical axis
-    penalty += abs(state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) * 2
-    penalty += abs(state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) * 2
-
-    reward -= penalty
-
-    return reward * 0.5
-
+checkpoints_2 = RewardTerms([Term(2, "one")] + PENALTIES, scale=0.5)
 
 # 接checkpoints_0
-def checkpoints_3(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = 3
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 20
-
-    penalty = 0
-    # Small penalty for too much activation (cost of transport)
-    penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
-    # Big penalty for not matching the vector on the X,Z projection.
-    # No penalty for the vertical axis
-    penalty += abs(state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) * 2
-    penalty += abs(state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) * 2
-
-    reward -= penalty
-
-    return reward * 0.5
-
+checkpoints_3 = RewardTerms([Term(3, "one")] + PENALTIES, scale=0.5)
 
 # 接checkpoints_3
-def checkpoints_4(self):
-    state_desc = self.get_state_desc()
-    prev_state_desc = self.get_prev_state_desc()
-    if not prev_state_desc:
-        return 0
-
-    reward = 2
-
-    pelvis = state_desc["body_pos"]["pelvis"][1]
-    reward -= max(0, 0.70 - pelvis) * 20
-
-    penalty = 0
-    # Small penalty for too much activation (cost of transport)
-    penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
-    # Big penalty for not matching the vector on the X,Z projection.
-    # No penalty for the vertical axis
-    penalty += abs(state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) * 2
-    penalty += abs(state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) * 2
-
-    reward -= penalty
-
-    return reward * 0.5
-
+checkpoints_4 = RewardTerms([Term(2, "one")] + PENALTIES, scale=0.5)
@@ -4,11 +4,31 @@ import gym
 import numpy as np
 from gym.spaces import Box
 
+from nips.observation import ObservationSchema, TAIL_TARGET_CLIPPED
+from nips.step_metrics import RewardTerms, Term, step_metrics
+from nips.trajectory import TrajectoryWriter, record_step
+
 OBSERVATION_SPACE = 224
 
+SHAPED_REWARD = RewardTerms([
+    Term(1, "vx_error", "exp_abs"),
+    Term(1, "vz_error", "exp_abs"),
+    # too low pelvis
+    Term(-20, "pelvis_y", "hinge_below", 0.7),
+    # activation penalty
+    Term(-0.001, "activation"),
+    # velocity matching penalty on X, Z direction
+    Term(-2, "vx_error", "abs"),
+    Term(-2, "vz_error", "abs"),
+], scale=0.5)
+
 
 class CustomEnv(ProstheticsEnv):
-    def __init__(self, visualization=True, integrator_accuracy=5e-5):
+    def __init__(self, visualization=True, integrator_accuracy=5e-5, record_dir=None):
+        """
+        record_dir: record the trajectory of every episode there, see
+            nips.trajectory
+        """
         # difficulty = 1 for round 2 environment
         super().__init__(visualization, integrator_accuracy, difficulty=1)
         self.episode_length = 0
@@ -18,13 +38,18 @@ class CustomEnv(ProstheticsEnv):
         self.episode_vx_penalty = 0.0
         self.episode_vz_penalty = 0.0
         self.observation_space = Box(low=-10, high=+10, shape=[OBSERVATION_SPACE])
+        self.observation_schema = None
 
         # random
         random.seed()
         self.random_seed = random.randint(0, 2 ** 32 - 1)
+        self.episode_seed = None
+        # small shards, an actor killed as hung loses at most the open one
+        self.recorder = TrajectoryWriter(record_dir, episodes_per_shard=8) if record_dir else None
 
     def step(self, action, project=True):
-        obs, r, done, info = super(CustomEnv, self).step(np.clip(np.array(action), 0.0, 1.0))
+        action = np.clip(np.array(action), 0.0, 1.0)
+        obs, r, done, info = super(CustomEnv, self).step(action, project=project)
         self.episode_length += 1
 
         # early termination penalty
@@ -35,13 +60,16 @@ class CustomEnv(ProstheticsEnv):
         self.episode_original_reward += original_reward
         self.episode_shaped_reward += r
 
-        state_desc = self.get_state_desc()
+        metrics = step_metrics(self)
 
         # activation penalty
-        self.episode_activation_penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
+        self.episode_activation_penalty += metrics.activation * 0.001
         # velocity matching penalty on X, Z direction
-        self.episode_vx_penalty += (state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) ** 2
-        self.episode_vz_penalty += (state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) ** 2
+        self.episode_vx_penalty += metrics.vx_error ** 2
+        self.episode_vz_penalty += metrics.vz_error ** 2
+
+        if self.recorder is not None:
+            record_step(self.recorder, self, action, r)
 
         if done:
             info['episode'] = {
@@ -52,11 +80,17 @@ class CustomEnv(ProstheticsEnv):
                 "vx_penalty": self.episode_vx_penalty,
                 "vz_penalty": self.episode_vz_penalty
             }
+            if self.recorder is not None:
+                self.recorder.end_episode(seed=self.episode_seed, **info['episode'])
 
         return obs, r, done, info
 
     def reset(self, project=True):
+        if self.recorder is not None:
+            # an episode cut short by a reset is recorded as truncated
+            self.recorder.end_episode(seed=self.episode_seed, truncated=True)
         super().reset(project=project, seed=self.random_seed)
+        self.episode_seed = self.random_seed
         random.seed(self.random_seed)
         self.random_seed = random.randint(0, 2 ** 32 - 1)
         self.episode_length = 0
@@ -68,105 +102,51 @@ class CustomEnv(ProstheticsEnv):
         obs = self.get_observation()
         return obs
 
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        super().close()
+
+    def seed(self, seed=None):
+        """
+        seed of the next episode, a fresh random one without an argument
+        """
+        self.random_seed = random.randint(0, 2 ** 32 - 1) if seed is None else seed
+        return [self.random_seed]
+
     def get_observation_space_size(self):
         return OBSERVATION_SPACE
 
     def get_observation(self):
         state_desc = self.get_state_desc()
-
-        res = []
-        pelvis = None
-
-        for body_part in ["pelvis", "head", "torso", "toes_l", "talus_l", "pros_foot_r", "pros_tibia_r"]:
-            cur = []
-            cur += state_desc["body_pos"][body_part]
-            cur += state_desc["body_vel"][body_part]
-            cur += state_desc["body_acc"][body_part]
-            cur += state_desc["body_pos_rot"][body_part]
-            cur += state_desc["body_vel_rot"][body_part]
-            cur += state_desc["body_acc_rot"][body_part]
-            if body_part == "pelvis":
-                pelvis = cur
-                res += cur[1:]  # make sense, pelvis.x is not important
-            else:
-                cur[0] -= pelvis[0]
-                cur[2] -= pelvis[2]     # relative position work for x / z axis
-                res += cur
-
-        for joint in ["ankle_l", "ankle_r", "back", "hip_l", "hip_r", "knee_l", "knee_r"]:
-            res += state_desc["joint_pos"][joint]
-            res += state_desc["joint_vel"][joint]
-            res += state_desc["joint_acc"][joint]
-
-        for muscle in sorted(state_desc["muscles"].keys()):
-            res += [state_desc["muscles"][muscle]["activation"]]
-            res += [state_desc["muscles"][muscle]["fiber_length"]]
-            res += [state_desc["muscles"][muscle]["fiber_velocity"]]
-
-        cm_pos = state_desc["misc"]["mass_center_pos"]  # relative x / z axis center of mass position
-        cm_pos[0] -= pelvis[0]
-        cm_pos[2] -= pelvis[0]
-        res = res + cm_pos
-
-        # information about target velocity
-        target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
-        current_vx, current_vz = state_desc["body_vel"]["pelvis"][0], state_desc["body_vel"]["pelvis"][2]
-        diff_vx, diff_vz = current_vx - target_vx, current_vz - target_vz
-        if diff_vx > 0.3:
-            diff_vx, target_vx = 0.3, current_vx - 0.3
-        elif diff_vx < -0.3:
-            diff_vx, target_vx = -0.3, current_vx + 0.3
-
-        if diff_vz > 0.15:
-            diff_vz, target_vz = 0.15, current_vz - 0.15
-        elif diff_vz < -0.15:
-            diff_vz, target_vz = -0.15, current_vz + 0.15
-
-        res = res + [diff_vz, target_vx, diff_vx, diff_vx, target_vz, diff_vz]
-
-        return res
+        if self.observation_schema is None:
+            self.observation_schema = ObservationSchema(state_desc, tail=TAIL_TARGET_CLIPPED)
+        return self.observation_schema(state_desc)
 
     def reward(self):
-        state_desc = self.get_state_desc()
-        prev_state_desc = self.get_prev_state_desc()
-        if not prev_state_desc:
-            return 0
-
-        target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
-        current_vx, current_vz = state_desc["body_vel"]["pelvis"][0], state_desc["body_vel"]["pelvis"][2]
-        pelvis_y = state_desc["body_pos"]["pelvis"][1]
-
-        reward_x = np.exp(-abs(target_vx - current_vx))
-        reward_z = np.exp(-abs(target_vz - current_vz))
-        reward = reward_x + reward_z
-
-        penalty = 0.0
-        # too low pelvis
-        low_pelvis = max(0, 0.7 - pelvis_y)
-        penalty += low_pelvis * 20
-        # activation penalty
-        penalty += np.sum(np.array(self.osim_model.get_activations()) ** 2) * 0.001
-        # velocity matching penalty on X, Z direction
-        penalty += abs(current_vx - target_vx) * 2
-        penalty += abs(current_vz - target_vz) * 2
-
-        reward -= penalty
-
-        return reward * 0.5
+        return SHAPED_REWARD(self)
 
 
 class CustomActionWrapper(gym.ActionWrapper):
-    def __init__(self, env, action_repeat):
+    def __init__(self, env, action_repeat, lazy_observation=False):
+        """
+        lazy_observation: skip building the observation in all but the last
+            repeat, only their rewards are used
+        """
         super(CustomActionWrapper, self).__init__(env)
         self.action_repeat = action_repeat
+        self.lazy_observation = lazy_observation
 
     def step(self, action):
         action = self.action(action)
         rew = 0
         for i in range(self.action_repeat):
-            obs, r, done, info = self.env.step(action)
+            project = not self.lazy_observation or i == self.action_repeat - 1
+            obs, r, done, info = self.env.step(action, project=project)
             rew += r
             if done:
+                if not project:
+                    obs = self.env.get_observation()
                 break
         info["action"] = action
         return obs, rew, done, info
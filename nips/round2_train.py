@@ -8,13 +8,14 @@ from baselines.common import set_global_seeds
 from baselines.common.vec_env.vec_normalize import VecNormalize
 import baselines.ppo2.policies as policies
 import baselines.ppo2.ppo2 as ppo2
+import baselines.ppo2.async_ppo2 as async_ppo2
 from nips.round2_env import CustomEnv, CustomActionWrapper
 from nips.remote_vec_env import RemoteVecEnv
 
 
 def create_env():
-    env = CustomEnv(visualization=args.vis, integrator_accuracy=args.accuracy)
-    env = CustomActionWrapper(env, action_repeat=args.repeat)
+    env = CustomEnv(visualization=args.vis, integrator_accuracy=args.accuracy, record_dir=args.record_dir)
+    env = CustomActionWrapper(env, action_repeat=args.repeat, lazy_observation=args.lazy_observation)
     return env
 
 
@@ -26,9 +27,27 @@ def train():
     )
     tf.Session(config=config).__enter__()
 
-    env = RemoteVecEnv([create_env] * args.num_cpus)
+    env = RemoteVecEnv([create_env] * args.num_cpus, envs_per_actor=args.envs_per_actor,
+                       shmem=args.shmem, timing=args.timing, step_timeout=args.step_timeout)
     env = VecNormalize(env, ret=True, gamma=args.gamma)
 
+    if args.async_actors:
+        async_ppo2.learn(
+            policy=policies.MlpPolicy, env=env,
+            total_timesteps=args.num_timesteps, nminibatches=args.num_minibatches,
+            nsteps=args.num_steps, noptepochs=args.num_epochs, lr=args.learning_rate,
+            gamma=args.gamma,
+            lam=args.lam, ent_coef=args.ent_coef, vf_coef=args.vf_coef, cliprange=args.clip_range,
+            log_interval=args.log_interval, save_interval=args.save_interval,
+            load_path=args.checkpoint_path,
+            num_casks=args.num_casks,
+            queue_size=args.queue_size,
+            in_graph_update=args.in_graph_update,
+            timing=args.timing,
+            keep_checkpoints=args.keep_checkpoints
+        )
+        return
+
     ppo2.learn(
         policy=policies.MlpPolicy, env=env,
         total_timesteps=args.num_timesteps, nminibatches=args.num_minibatches,
@@ -37,7 +56,14 @@ def train():
         lam=args.lam, ent_coef=args.ent_coef, vf_coef=args.vf_coef, cliprange=args.clip_range,
         log_interval=args.log_interval, save_interval=args.save_interval,
         load_path=args.checkpoint_path,
-        num_casks=args.num_casks
+        num_casks=args.num_casks,
+        gae_engine=args.gae_engine,
+        inference_server=args.inference_server,
+        max_latency=args.max_latency,
+        adaptive_casks=args.adaptive_casks,
+        in_graph_update=args.in_graph_update,
+        timing=args.timing,
+        keep_checkpoints=args.keep_checkpoints
     )
 
 
@@ -57,19 +83,44 @@ if __name__ == "__main__":
     parser.add_argument('--ent-coef', default=0.001, type=float, help='policy entropy coefficient')
     parser.add_argument('--vf-coef', default=0.5, type=float, help='value function loss coefficient')
     parser.add_argument('--clip-range', default=0.2, type=float, help='clipping range')
+    parser.add_argument('--gae-engine', default='auto', type=str, choices=['auto', 'loop', 'numpy', 'numba'],
+                        help='advantage estimation engine, auto uses numba when it is installed')
     # env related
     parser.add_argument('--seed', default=6730, type=int, help='random seed')
     parser.add_argument('--accuracy', default=5e-5, type=float, help='simulator integrator accuracy')
     parser.add_argument('--repeat', default=1, type=int, help='number of action repeat')
+    parser.add_argument('--lazy-observation', default=False, action='store_true',
+                        help='build the observation only for the last action repeat')
     parser.add_argument('--vis', default=False, action='store_true', help='visualization option')
+    parser.add_argument('--record-dir', default=None, type=str,
+                        help='record every episode\'s trajectory there, this builds every step\'s observation')
     # training settings
     parser.add_argument('--num-cpus', default=1, type=int, help='number of cpus')
     parser.add_argument('--num-casks', default=0, type=int, help='number of casks, for acceleration')
+    parser.add_argument('--adaptive-casks', default=False, action='store_true',
+                        help='pick the number of casks, up to --num-casks, that maximizes samples per second')
+    parser.add_argument('--envs-per-actor', default=1, type=int, help='number of envs stepped by one ray actor')
+    parser.add_argument('--shmem', default=False, action='store_true', help='return observations through shared memory')
+    parser.add_argument('--step-timeout', default=None, type=float,
+                        help='seconds after which a hanging actor is replaced, failing actors are replaced too')
+    parser.add_argument('--inference-server', default=False, action='store_true',
+                        help='run the policy only on envs that wait for an action, in a batching thread')
+    parser.add_argument('--max-latency', default=0.005, type=float,
+                        help='seconds the inference server waits to batch more requests')
+    parser.add_argument('--async-actors', default=False, action='store_true',
+                        help='keep actors stepping with a stale policy while the learner trains, v-trace corrected')
+    parser.add_argument('--queue-size', default=2, type=int, help='number of batches actors may run ahead in async mode')
+    parser.add_argument('--in-graph-update', default=False, action='store_true',
+                        help='run all training epochs of an update in one tf.while_loop')
+    parser.add_argument('--timing', default=False, action='store_true',
+                        help='log time spent per stage of the update and per actor step latencies')
     parser.add_argument('--num-gpus', default=0, type=int, help='number of gpus')
     parser.add_argument('--log-dir', default='./logs', type=str, help='logging events output directory')
     parser.add_argument('--log-interval', default=1, type=int, help='number of timesteps between logging events')
     parser.add_argument('--save-interval', default=1, type=int, help='number of timesteps between saving events')
-    parser.add_argument('--checkpoint-path', default=None, type=str, help='path to load the model checkpoint from')
+    parser.add_argument('--keep-checkpoints', default=None, type=int,
+                        help='number of newest checkpoints to keep, all are kept by default')
+    parser.add_argument('--checkpoint-path', default=None, type=str, help='checkpoint to start from, a .ckpt file also resumes the optimizer and the update counter')
     args = parser.parse_args()
     print(args)
 
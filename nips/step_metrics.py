@@ -0,0 +1,105 @@
+import types
+from collections import namedtuple
+import numpy as np
+
+# scalar features read from one physics step, in the order of StepMetrics.features
+FEATURES = ("one", "pelvis_x", "pelvis_y", "pelvis_z", "pelvis_abs_z", "pelvis_vx", "pelvis_vz", "head_x",
+            "pros_foot_x", "pros_foot_vx", "toes_x", "toes_vx", "target_vx", "target_vz",
+            "vx_error", "vz_error", "lean_back", "stride", "activation")
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURES)}
+
+# term value as a function of the feature x and the term threshold c
+OPS = ("linear", "hinge_above", "hinge_below", "min", "square", "abs", "exp_abs")
+OP_INDEX = {name: i for i, name in enumerate(OPS)}
+
+
+class StepMetrics(object):
+    """
+    Everything the rewards and penalties use from one physics step, read
+    from the state description and the muscle activations exactly once.
+    """
+    def __init__(self, state_desc, activations):
+        self.state_desc = state_desc
+        body_pos, body_vel = state_desc["body_pos"], state_desc["body_vel"]
+        pelvis_x, pelvis_y, pelvis_z = body_pos["pelvis"][:3]
+        pelvis_vx, pelvis_vz = body_vel["pelvis"][0], body_vel["pelvis"][2]
+        target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
+        head_x = body_pos["head"][0]
+        pros_foot_x, toes_x = body_pos["pros_foot_r"][0], body_pos["toes_l"][0]
+        # sum of squared activations, the cost of transport
+        self.activation = np.sum(np.array(activations) ** 2)
+        self.vx_error = pelvis_vx - target_vx
+        self.vz_error = pelvis_vz - target_vz
+        self.features = np.array([
+            1.0, pelvis_x, pelvis_y, pelvis_z, abs(pelvis_z), pelvis_vx, pelvis_vz, head_x,
+            pros_foot_x, body_vel["pros_foot_r"][0], toes_x, body_vel["toes_l"][0], target_vx, target_vz,
+            self.vx_error, self.vz_error, pelvis_x - head_x, pros_foot_x - toes_x, self.activation
+        ], dtype=np.float64)
+
+    def __getitem__(self, name):
+        return self.features[FEATURE_INDEX[name]]
+
+
+def step_metrics(env):
+    """
+    StepMetrics of the current step of an osim env, cached on the env until
+    the state description changes
+    """
+    state_desc = env.get_state_desc()
+    metrics = getattr(env, '_step_metrics', None)
+    if metrics is None or metrics.state_desc is not state_desc:
+        metrics = StepMetrics(state_desc, env.osim_model.get_activations())
+        env._step_metrics = metrics
+    return metrics
+
+
+Term = namedtuple('Term', ['weight', 'feature', 'op', 'threshold', 'gate', 'gate_threshold', 'gate_above'])
+Term.__new__.__defaults__ = ('linear', 0.0, 'one', -np.inf, True)
+Term.__doc__ = """
+weight * op(feature, threshold), counted only when the gate feature is
+above (or below, gate_above=False) gate_threshold
+"""
+
+
+class RewardTerms(object):
+    """
+    A reward shaping curriculum as a declarative list of Terms, compiled to
+    index arrays and evaluated in one vectorized pass over StepMetrics:
+
+        scale * sum(weight * op(feature, threshold) * gate)
+
+    Calling it with an env returns 0 on the first step of an episode, like
+    the hand written reward functions did. Like them, it binds as a method:
+    `CustomEnv.reward = course_0` makes env.reward() evaluate it on env.
+    """
+    def __init__(self, terms, scale=1.0):
+        self.terms = list(terms)
+        self.scale = scale
+        self._feature = np.array([FEATURE_INDEX[t.feature] for t in self.terms], dtype=np.int64)
+        self._op = np.array([OP_INDEX[t.op] for t in self.terms], dtype=np.int64)
+        self._threshold = np.array([t.threshold for t in self.terms], dtype=np.float64)
+        self._weight = np.array([t.weight for t in self.terms], dtype=np.float64)
+        self._gate = np.array([FEATURE_INDEX[t.gate] for t in self.terms], dtype=np.int64)
+        self._gate_threshold = np.array([t.gate_threshold for t in self.terms], dtype=np.float64)
+        self._gate_above = np.array([t.gate_above for t in self.terms], dtype=np.bool_)
+        self._column = np.arange(len(self.terms))
+
+    def evaluate(self, metrics):
+        x = metrics.features[self._feature]
+        d = x - self._threshold
+        table = np.stack([d, np.maximum(d, 0), np.maximum(-d, 0), np.minimum(x, self._threshold),
+                          d ** 2, np.abs(d), np.exp(-np.abs(d))])
+        values = table[self._op, self._column]
+        gate = metrics.features[self._gate] >= self._gate_threshold
+        gate = gate == self._gate_above
+        return self.scale * np.dot(self._weight, values * gate)
+
+    def __call__(self, env):
+        if not env.get_prev_state_desc():
+            return 0
+        return self.evaluate(step_metrics(env))
+
+    def __get__(self, env, owner=None):
+        if env is None:
+            return self
+        return types.MethodType(self, env)
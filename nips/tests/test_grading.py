@@ -0,0 +1,91 @@
+import csv
+import json
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from baselines.common import checkpoint
+from nips.grading import grade, write_results
+from nips.policy_runner import MLP_PARAMS
+from nips.trajectory import TrajectoryReader, TrajectoryWriter
+
+
+class _GradeEnv(object):
+    """
+    episodes of seed % 5 + 3 steps, scored by the summed first action
+    """
+    def __init__(self, record_dir=None):
+        self.recorder = TrajectoryWriter(record_dir, episodes_per_shard=1) if record_dir else None
+
+    def set_seeds(self, seeds):
+        self.seed, = seeds
+
+    @property
+    def unwrapped(self):
+        return self
+
+    def reset(self):
+        self.t, self.score = 0, 0.0
+        return np.full(4, self.seed % 7, dtype=np.float32)
+
+    def step(self, action):
+        self.t += 1
+        self.score += float(action[0])
+        done = self.t == self.seed % 5 + 3
+        if self.recorder is not None:
+            self.recorder.add_step(action=action)
+            if done:
+                self.recorder.end_episode(**self.episode_result())
+        return np.full(4, self.seed % 7, dtype=np.float32), 0.0, done, {}
+
+    def episode_result(self):
+        return OrderedDict([('seed', self.seed), ('score', self.score), ('length', self.t)])
+
+
+def _make_env(record_dir=None):
+    return _GradeEnv(record_dir)
+
+
+@pytest.fixture
+def policy(tmpdir):
+    rng = np.random.RandomState(0)
+    shapes = {"pi_fc1/w": (4, 64), "pi_fc2/w": (64, 64), "vf_fc1/w": (4, 64), "vf_fc2/w": (64, 64),
+              "vf/w": (64, 1), "vf/b": (1,), "pi/w": (64, 2), "pi/b": (2,), "logstd": (1, 2)}
+    arrays = {"model/%s:0" % name: rng.randn(*shapes.get(name, (64,))).astype(np.float32) for name in MLP_PARAMS}
+    path = str(tmpdir.join("00001.ckpt"))
+    checkpoint.save(path, arrays)
+    return path
+
+
+def test_grade_in_parallel(policy, tmpdir):
+    seeds = [11, 3, 7, 20]
+    results = grade(policy, seeds, processes=2, make_env=_make_env, deterministic=False)
+    assert [r['seed'] for r in results] == seeds
+    assert [r['length'] for r in results] == [s % 5 + 3 for s in seeds]
+    # the same seed gets the same sampled actions in any worker
+    assert grade(policy, seeds[::-1], processes=3, make_env=_make_env, deterministic=False) == results[::-1]
+
+    write_results(results, str(tmpdir.join('grade', 'results.json')))
+    with open(str(tmpdir.join('grade', 'results.json'))) as f:
+        saved = json.load(f)
+    assert saved['results'] == results
+    assert saved['summary']['seeds'] == 4
+    assert saved['summary']['mean_length'] == np.mean([r['length'] for r in results])
+
+    write_results(results, str(tmpdir.join('results.csv')))
+    with open(str(tmpdir.join('results.csv'))) as f:
+        rows = list(csv.DictReader(f))
+    assert [int(row['seed']) for row in rows] == seeds
+
+
+def test_grade_records_episodes(policy, tmpdir):
+    seeds = [4, 9, 2]
+    directory = str(tmpdir.join('trajectories'))
+    results = grade(policy, seeds, processes=2, make_env=_make_env, record_dir=directory)
+    reader = TrajectoryReader(directory)
+    recorded = {entry['seed']: entry for entry in reader.episodes}
+    assert sorted(recorded) == sorted(seeds)
+    for result in results:
+        assert recorded[result['seed']]['length'] == result['length']
+        assert recorded[result['seed']]['score'] == pytest.approx(result['score'])
@@ -0,0 +1,31 @@
+import copy
+
+import numpy as np
+import pytest
+
+from nips.bench_observation import make_state_desc, legacy_observation
+from nips.observation import ObservationSchema, TAILS, TAIL_TARGET_CLIPPED
+
+
+@pytest.mark.parametrize('tail', TAILS)
+@pytest.mark.parametrize('scale', [0.01, 1.0, 10.0])
+def test_identical_to_legacy_observation(tail, scale):
+    schema = ObservationSchema(make_state_desc(seed=0), tail=tail)
+    assert schema.size == 224
+    for seed in range(20):
+        state_desc = make_state_desc(seed, scale)
+        untouched = copy.deepcopy(state_desc)
+        expected = np.asarray(legacy_observation(copy.deepcopy(state_desc), tail), dtype=np.float32)
+        obs = schema(state_desc)
+        assert obs.dtype == np.float32
+        assert np.array_equal(obs, expected)
+        # unlike the list builder, the schema leaves state_desc alone
+        assert state_desc == untouched
+
+
+def test_out_buffer():
+    schema = ObservationSchema(make_state_desc(), tail=TAIL_TARGET_CLIPPED)
+    out = np.zeros(schema.size, dtype=np.float32)
+    first = schema(make_state_desc(1), out=out)
+    assert first is out
+    assert not np.shares_memory(schema(make_state_desc(2)), schema(make_state_desc(3)))
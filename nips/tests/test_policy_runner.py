@@ -0,0 +1,101 @@
+import pickle
+
+import joblib
+import numpy as np
+
+from baselines.common import checkpoint
+from baselines.common.running_mean_std import RunningMeanStd
+from nips.policy_runner import MLP_PARAMS, PolicyRunner
+
+OB_SIZE, AC_SIZE = 12, 3
+
+
+def _params(seed=0):
+    rng = np.random.RandomState(seed)
+    shapes = {"pi_fc1/w": (OB_SIZE, 64), "pi_fc1/b": (64,), "pi_fc2/w": (64, 64), "pi_fc2/b": (64,),
+              "vf_fc1/w": (OB_SIZE, 64), "vf_fc1/b": (64,), "vf_fc2/w": (64, 64), "vf_fc2/b": (64,),
+              "vf/w": (64, 1), "vf/b": (1,), "pi/w": (64, AC_SIZE), "pi/b": (AC_SIZE,), "logstd": (1, AC_SIZE)}
+    return {name: (rng.randn(*shapes[name]) * 0.3).astype(np.float32) for name in MLP_PARAMS}
+
+
+def _ob_rms(seed=1):
+    rms = RunningMeanStd(shape=(OB_SIZE,))
+    rms.update(np.random.RandomState(seed).randn(50, OB_SIZE) * 4 + 1)
+    return rms
+
+
+def _reference(params, ob_rms, obs, npassthrough):
+    # MlpPolicy on VecNormalize output, in float64
+    x = np.clip((obs - ob_rms.mean) / np.sqrt(ob_rms.var + 1e-8), -10., 10.)
+    if npassthrough:
+        x[:, -npassthrough:] = obs[:, -npassthrough:]
+    h = x
+    for layer in ("pi_fc1", "pi_fc2"):
+        h = np.tanh(h.dot(params[layer + "/w"]) + params[layer + "/b"])
+    return h.dot(params["pi/w"]) + params["pi/b"]
+
+
+def test_actions_match_the_policy():
+    params, ob_rms = _params(), _ob_rms()
+    obs = np.random.RandomState(2).randn(5, OB_SIZE) * 20
+    runner = PolicyRunner(params, ob_rms, npassthrough=6)
+    expected = _reference(params, ob_rms, obs, 6)
+    assert np.allclose(runner.act(obs), expected, atol=1e-5)
+    assert np.allclose(runner.act(obs[0]), expected[0], atol=1e-5)
+    assert runner.value(obs).shape == (5,)
+
+    stochastic = PolicyRunner(params, ob_rms, npassthrough=6, deterministic=False, seed=0)
+    noise = (stochastic.act(np.repeat(obs[:1], 2000, axis=0)) - expected[0]) / np.exp(params["logstd"][0])
+    assert np.allclose(noise.mean(axis=0), 0, atol=0.1) and np.allclose(noise.std(axis=0), 1, atol=0.1)
+
+
+def test_load_both_checkpoint_formats(tmpdir):
+    params, ob_rms = _params(), _ob_rms()
+    obs = np.random.RandomState(3).randn(4, OB_SIZE)
+
+    legacy = str(tmpdir.join("00160"))
+    joblib.dump([params[name] for name in MLP_PARAMS], legacy)
+    with open(str(tmpdir.join("00160_ob_rms.pkl")), "wb") as ob_rms_fp:
+        pickle.dump(ob_rms, ob_rms_fp)
+
+    arrays = {"model/%s:0" % name: params[name] for name in MLP_PARAMS}
+    arrays["model/pi_fc1/w/Adam:0"] = np.zeros((OB_SIZE, 64), np.float32)
+    arrays.update(checkpoint.rms_arrays("ob_rms", ob_rms))
+    ckpt = str(tmpdir.join("00160.ckpt"))
+    checkpoint.save(ckpt, arrays, meta={"update": 160})
+
+    expected = _reference(params, ob_rms, obs, 0)
+    for path in (legacy, ckpt):
+        assert np.allclose(PolicyRunner.load(path).act(obs), expected, atol=1e-5)
+
+
+def test_normalizes_like_frozen_vec_normalize():
+    from baselines.common.vec_env import VecEnv
+    from baselines.common.vec_env.vec_normalize import VecNormalize
+    from gym.spaces import Box
+
+    obs = (np.random.RandomState(4).randn(3, OB_SIZE) * 20).astype(np.float32)
+
+    class _ObsEnv(VecEnv):
+        def __init__(self):
+            VecEnv.__init__(self, 3, Box(-10, 10, shape=(OB_SIZE,), dtype=np.float32),
+                            Box(-1, 1, shape=(AC_SIZE,), dtype=np.float32))
+
+        def reset(self):
+            return obs
+
+        def step_async(self, actions):
+            pass
+
+        def step_wait(self):
+            pass
+
+        def close(self):
+            pass
+
+    ob_rms = _ob_rms()
+    for npassthrough in (0, 6):
+        env = VecNormalize(_ObsEnv(), npassthrough=npassthrough, frozen=True)
+        env.ob_rms = ob_rms
+        runner = PolicyRunner(_params(), ob_rms, npassthrough=npassthrough)
+        assert np.array_equal(runner._normalize(obs), env.reset())
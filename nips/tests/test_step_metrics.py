@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from nips.bench_observation import make_state_desc
+from nips.course import course_1, course_5
+from nips.round2_course import checkpoints_1
+from nips.step_metrics import step_metrics
+
+
+class _Model(object):
+    def __init__(self, activations):
+        self.activations = activations
+        self.calls = 0
+
+    def get_activations(self):
+        self.calls += 1
+        return self.activations
+
+
+class _Env(object):
+    def __init__(self, seed, scale=1.0):
+        rng = np.random.RandomState(seed)
+        self.state_desc = make_state_desc(seed, scale)
+        self.prev_state_desc = make_state_desc(seed + 1000)
+        self.osim_model = _Model(rng.rand(19).tolist())
+
+    def get_state_desc(self):
+        return self.state_desc
+
+    def get_prev_state_desc(self):
+        return self.prev_state_desc
+
+
+def _round2_reward(env):
+    # CustomEnv.reward as it was written by hand
+    state_desc = env.get_state_desc()
+    target_vx, target_vz = state_desc["target_vel"][0], state_desc["target_vel"][2]
+    current_vx, current_vz = state_desc["body_vel"]["pelvis"][0], state_desc["body_vel"]["pelvis"][2]
+    reward = np.exp(-abs(target_vx - current_vx)) + np.exp(-abs(target_vz - current_vz))
+    penalty = max(0, 0.7 - state_desc["body_pos"]["pelvis"][1]) * 20
+    penalty += np.sum(np.array(env.osim_model.get_activations()) ** 2) * 0.001
+    penalty += abs(current_vx - target_vx) * 2
+    penalty += abs(current_vz - target_vz) * 2
+    return (reward - penalty) * 0.5
+
+
+def _checkpoints_1(env):
+    state_desc = env.get_state_desc()
+    reward = 2 + state_desc["body_vel"]["pelvis"][0]
+    reward -= max(0, 0.70 - state_desc["body_pos"]["pelvis"][1]) * 20
+    reward -= np.sum(np.array(env.osim_model.get_activations()) ** 2) * 0.001
+    reward -= abs(state_desc["body_vel"]["pelvis"][0] - state_desc["target_vel"][0]) * 2
+    reward -= abs(state_desc["body_vel"]["pelvis"][2] - state_desc["target_vel"][2]) * 2
+    return reward * 0.5
+
+
+def _course_1(env):
+    state_desc = env.get_state_desc()
+    reward = min(3.0, state_desc["body_vel"]["pelvis"][0]) * 2 + 2 \
+        + state_desc["body_vel"]["pros_foot_r"][0] + state_desc["body_vel"]["toes_l"][0]
+    reward -= max(0, state_desc["body_pos"]["pelvis"][0] - state_desc["body_pos"]["head"][0] - 0.2) * 40
+    reward -= max(0, 0.70 - state_desc["body_pos"]["pelvis"][1]) * 100
+    return reward * 0.05
+
+
+def _course_5(env):
+    state_desc = env.get_state_desc()
+    pelvis_vx = state_desc["body_vel"]["pelvis"][0]
+    reward = -1 if pelvis_vx < 1.0 else 9.0 - (pelvis_vx - 3.0) ** 2
+    reward -= max(0.0, state_desc["body_pos"]["pros_foot_r"][0] - state_desc["body_pos"]["toes_l"][0] - 0.9) * 40
+    reward -= max(0, state_desc["body_pos"]["pelvis"][0] - state_desc["body_pos"]["head"][0] - 0.2) * 40
+    reward -= max(0, 0.7 - state_desc["body_pos"]["pelvis"][1]) * 100
+    reward -= max(0, abs(state_desc["body_pos"]["pelvis"][2]) - 0.6) * 100
+    return reward * 0.05
+
+
+def test_round2_reward_matches_hand_written_reward():
+    pytest.importorskip('osim')
+    from nips.round2_env import SHAPED_REWARD
+    for seed in range(30):
+        env = _Env(seed, scale=[0.3, 1.0, 3.0][seed % 3])
+        assert np.isclose(SHAPED_REWARD(env), _round2_reward(env), rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_curricula_match_hand_written_rewards(seed):
+    env = _Env(seed, scale=[0.3, 1.0, 3.0][seed % 3])
+    for terms, reference in [(checkpoints_1, _checkpoints_1), (course_1, _course_1), (course_5, _course_5)]:
+        assert np.isclose(terms(env), reference(env), rtol=1e-12, atol=1e-12)
+
+
+def test_metrics_are_read_once_per_state():
+    env = _Env(0)
+    first = step_metrics(env)
+    assert step_metrics(env) is first
+    checkpoints_1(env)
+    course_5(env)
+    assert env.osim_model.calls == 1
+
+    env.state_desc = make_state_desc(1)
+    assert step_metrics(env) is not first
+    assert env.osim_model.calls == 2
+
+
+def test_first_step_has_no_reward():
+    env = _Env(0)
+    env.prev_state_desc = {}
+    assert course_5(env) == 0
+
+
+def test_curriculum_binds_as_a_method():
+    class _CourseEnv(_Env):
+        reward = course_5
+
+    env = _CourseEnv(3)
+    assert _CourseEnv.reward is course_5
+    assert env.reward() == course_5(env)
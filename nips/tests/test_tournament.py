@@ -0,0 +1,140 @@
+import pickle
+import shutil
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+
+from baselines.common import checkpoint
+from baselines.common.running_mean_std import RunningMeanStd
+from nips.policy_runner import MLP_PARAMS
+from nips.tournament import GradeIndex, checkpoint_hash, file_hash, find_checkpoints, run_halving, run_tournament, survivors
+
+
+class _GradeEnv(object):
+    """
+    one step episodes scored by the first action
+    """
+    def set_seeds(self, seeds):
+        self.seed, = seeds
+
+    @property
+    def unwrapped(self):
+        return self
+
+    def reset(self):
+        return np.full(4, self.seed % 7, dtype=np.float32)
+
+    def step(self, action):
+        self.score = float(action[0])
+        return np.zeros(4, dtype=np.float32), 0.0, True, {}
+
+    def episode_result(self):
+        return OrderedDict([('seed', self.seed), ('score', self.score), ('length', 1)])
+
+
+def _make_env():
+    return _GradeEnv()
+
+
+def _no_env():
+    raise AssertionError('nothing should be graded')
+
+
+def _save_policy(path, seed, score=None):
+    rng = np.random.RandomState(seed)
+    shapes = {"pi_fc1/w": (4, 64), "pi_fc2/w": (64, 64), "vf_fc1/w": (4, 64), "vf_fc2/w": (64, 64),
+              "vf/w": (64, 1), "vf/b": (1,), "pi/w": (64, 2), "pi/b": (2,), "logstd": (1, 2)}
+    arrays = {"model/%s:0" % name: rng.randn(*shapes.get(name, (64,))).astype(np.float32) for name in MLP_PARAMS}
+    if score is not None:
+        # scores of score +- 0.1 depending on the seed
+        arrays["model/pi/w:0"] *= 0.1 / 64
+        arrays["model/pi/b:0"][0] = score
+    checkpoint.save(path, arrays)
+
+
+def test_tournament_grades_each_pair_once(tmpdir):
+    checkdir = str(tmpdir)
+    for update in (1, 2, 10):
+        _save_policy(str(tmpdir.join('%.5i.ckpt' % update)), update)
+    tmpdir.join('00003_ob_rms.pkl').write('')
+    tmpdir.join('.00011.ckpt.partial').write('')
+    assert [p[-10:] for p in find_checkpoints(checkdir)] == ['00001.ckpt', '00002.ckpt', '00010.ckpt']
+    assert [p[-10:] for p in find_checkpoints(checkdir, last=2)] == ['00002.ckpt', '00010.ckpt']
+
+    seeds = [5, 8, 13]
+    board = run_tournament(checkdir, seeds, processes=2, make_env=_make_env)
+    assert [row['rank'] for row in board] == [1, 2, 3]
+    assert sorted(row['checkpoint'] for row in board) == ['00001.ckpt', '00002.ckpt', '00010.ckpt']
+    scores = [row['mean_score'] for row in board]
+    assert scores == sorted(scores, reverse=True)
+
+    index = GradeIndex(str(tmpdir.join('grades.json')))
+    digest = file_hash(str(tmpdir.join('00002.ckpt')))
+    assert index.get(digest, 8)['seed'] == 8
+
+    # every pair is in the index, a copy under a new name has the same hash
+    shutil.copy(str(tmpdir.join('00002.ckpt')), str(tmpdir.join('00020.ckpt')))
+    again = run_tournament(checkdir, seeds, processes=2, make_env=_no_env)
+    row = {r['checkpoint']: r for r in again}
+    assert row['00020.ckpt']['mean_score'] == row['00002.ckpt']['mean_score']
+    assert len(index.grades) == 3
+
+    # other runner options are graded separately
+    stochastic = run_tournament(checkdir, seeds[:1], last=1, processes=1, make_env=_make_env, deterministic=False)
+    assert stochastic[0]['checkpoint'] == '00020.ckpt'
+    assert len(GradeIndex(str(tmpdir.join('grades.json'))).grades) == 4
+
+
+def test_legacy_checkpoints_are_keyed_with_their_ob_rms(tmpdir):
+    checkdir = str(tmpdir)
+    _save_policy(str(tmpdir.join('params.ckpt')), 1)
+    arrays, _ = checkpoint.load(str(tmpdir.join('params.ckpt')), mmap=False)
+    joblib.dump([np.array(arrays["model/%s:0" % name]) for name in MLP_PARAMS], str(tmpdir.join('00001')))
+    tmpdir.join('params.ckpt').remove()
+
+    def write_ob_rms(seed):
+        rms = RunningMeanStd(shape=(4,))
+        rms.update(np.random.RandomState(seed).randn(20, 4) * 3)
+        with open(str(tmpdir.join('00001_ob_rms.pkl')), 'wb') as ob_rms_fp:
+            pickle.dump(rms, ob_rms_fp)
+
+    write_ob_rms(0)
+    first = run_tournament(checkdir, [5], processes=1, make_env=_make_env)
+    assert first[0]['hash'] == checkpoint_hash(str(tmpdir.join('00001')))
+    assert first[0]['hash'] != file_hash(str(tmpdir.join('00001')))
+    assert run_tournament(checkdir, [5], processes=1, make_env=_no_env) == first
+
+    # other normalization stats act differently, the cached grade does not apply
+    write_ob_rms(1)
+    second = run_tournament(checkdir, [5], processes=1, make_env=_make_env)
+    assert second[0]['hash'] != first[0]['hash']
+    assert second[0]['mean_score'] != first[0]['mean_score']
+    assert len(GradeIndex(str(tmpdir.join('grades.json'))).grades) == 2
+
+
+def test_survivors_keep_what_can_still_win():
+    scores = {'a': [10., 10.2], 'b': [9.9, 10.1], 'c': [0., 0.1], 'd': [-5., 23.]}
+    # a and b are the best half, d is too uncertain to drop, c is out
+    assert survivors(scores, eta=2, z=2.0) == ['a', 'b', 'd']
+    assert survivors({'a': [1.]}) == ['a']
+
+
+def test_halving_finds_the_best_for_less(tmpdir):
+    checkdir = str(tmpdir)
+    for update in range(1, 9):
+        _save_policy(str(tmpdir.join('%.5i.ckpt' % update)), update, score=update)
+    seeds = list(range(100, 108))
+    board, report = run_halving(checkdir, seeds, min_seeds=2, eta=2, processes=2, make_env=_make_env)
+    assert [row['checkpoint'] for row in board[:2]] == ['00008.ckpt', '00007.ckpt']
+    assert [row['seeds'] for row in board] == [8, 8, 4, 4, 2, 2, 2, 2]
+    assert [row['pruned_at'] for row in board] == ['', '', 4, 4, 2, 2, 2, 2]
+    assert [row['rank'] for row in board] == list(range(1, 9))
+    # 8 x 2 seeds, then 4 x 2 more, then 2 x 4 more, of 8 x 8 one step episodes
+    assert report['episodes'] == report['simulated_episodes'] == 32
+    assert report['exhaustive_episodes'] == report['exhaustive_steps'] == 64
+    assert report['saved'] == 0.5
+
+    exhaustive = run_tournament(checkdir, seeds, processes=2, make_env=_make_env)
+    assert exhaustive[0]['checkpoint'] == '00008.ckpt'
+    assert exhaustive[0]['mean_score'] == board[0]['mean_score']
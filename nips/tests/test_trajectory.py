@@ -0,0 +1,71 @@
+import numpy as np
+
+from nips.trajectory import TrajectoryReader, TrajectoryWriter, record_step
+
+
+class _Env(object):
+    def __init__(self):
+        self.t = 0
+
+    def get_state_desc(self):
+        return {"body_vel": {"pelvis": [self.t, 0.1, -0.2]}, "target_vel": [1.25, 0.0, 0.5]}
+
+    def get_observation(self):
+        return np.full(5, self.t, dtype=np.float32)
+
+
+def _record(writer, lengths, first_seed=0):
+    env = _Env()
+    for seed, length in enumerate(lengths, first_seed):
+        for t in range(length):
+            env.t = seed * 100 + t
+            record_step(writer, env, np.full(3, t / 10.), reward=float(seed))
+        writer.end_episode(seed=seed, score=float(seed * length))
+
+
+def test_roundtrip_over_shards(tmpdir):
+    directory = str(tmpdir.join('trajectories'))
+    writer = TrajectoryWriter(directory, episodes_per_shard=2)
+    lengths = [3, 1, 4, 2, 5]
+    _record(writer, lengths)
+    # an unfinished episode is not written
+    writer.add_step(obs=np.zeros(5), action=np.zeros(3), reward=0., pelvis_vel=np.zeros(3), target_vel=np.zeros(3))
+    writer.close()
+    assert writer.num_shards == 3
+    # a second writer, as in another process, adds its own shards
+    other = TrajectoryWriter(directory)
+    _record(other, [2], first_seed=5)
+    other.close()
+
+    reader = TrajectoryReader(directory)
+    assert len(reader) == 6
+    assert sorted(episode['seed'] for episode in reader.episodes) == list(range(6))
+    for i, entry in enumerate(reader.episodes):
+        seed = entry['seed']
+        assert entry['length'] == (lengths + [2])[seed] and entry['score'] == seed * entry['length']
+        episode = reader.episode(i)
+        assert list(episode) == ['obs', 'action', 'reward', 'pelvis_vel', 'target_vel']
+        assert episode['obs'].shape == (entry['length'], 5) and episode['obs'].dtype == np.float32
+        assert np.array_equal(episode['obs'][:, 0], seed * 100 + np.arange(entry['length']))
+        assert np.allclose(episode['action'][:, 0], np.arange(entry['length']) / 10.)
+        assert np.array_equal(episode['pelvis_vel'][:, 0], episode['obs'][:, 0])
+        assert np.allclose(episode['target_vel'], [1.25, 0.0, 0.5])
+
+    rewards = reader.column('reward')
+    assert [len(r) for r in rewards] == [entry['length'] for entry in reader.episodes]
+    assert all(np.all(r == entry['seed']) for r, entry in zip(rewards, reader.episodes))
+    assert reader.column('target_vel', episodes=[1])[0].shape == (reader.episodes[1]['length'], 3)
+    assert list(reader.episode(0, columns=['reward'])) == ['reward']
+
+
+def test_shards_are_read_in_write_order(tmpdir, monkeypatch):
+    directory = str(tmpdir.join('trajectories'))
+    clock = iter(range(10))
+    monkeypatch.setattr('nips.trajectory.time.time', lambda: float(next(clock)))
+    # names sort the other way round than the shards are written
+    late, early = TrajectoryWriter(directory, episodes_per_shard=1), TrajectoryWriter(directory, episodes_per_shard=1)
+    late.name, early.name = 'shard-9-late', 'shard-1-early'
+    _record(late, [1], first_seed=0)
+    _record(early, [1], first_seed=1)
+    _record(late, [1], first_seed=2)
+    assert [entry['seed'] for entry in TrajectoryReader(directory).episodes] == [0, 1, 2]
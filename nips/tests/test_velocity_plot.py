@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from nips.trajectory import TrajectoryWriter
+from nips.velocity_plot import decimate, plot_velocity
+
+
+def test_decimate_keeps_extremes():
+    rng = np.random.RandomState(0)
+    y = rng.randn(10001)
+    y[1234], y[9999] = 50., -50.
+    x, d = decimate(y, 1000)
+    assert len(x) <= 1000
+    assert np.all(np.diff(x) >= 0) and x[-1] < len(y)
+    assert np.array_equal(d, y[x])
+    assert 1234 in x and 9999 in x
+
+    short = np.arange(5.)
+    x, d = decimate(short, 1000)
+    assert np.array_equal(x, np.arange(5)) and np.array_equal(d, short)
+
+
+def test_plot_recorded_episodes(tmpdir):
+    pytest.importorskip('matplotlib')
+    directory = str(tmpdir.join('trajectories'))
+    writer = TrajectoryWriter(directory, episodes_per_shard=4)
+    for seed, length in enumerate([300, 1000, 17]):
+        for t in range(length):
+            writer.add_step(pelvis_vel=[np.sin(t / 10.), 0., 0.], target_vel=[1.25, 0., 0.])
+        writer.end_episode(seed=seed, score=float(length))
+    writer.close()
+    out = str(tmpdir.join('velocity.png'))
+    plot_velocity(directory, out, max_points=200, dpi=50)
+    assert tmpdir.join('velocity.png').size() > 0
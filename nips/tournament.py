@@ -0,0 +1,250 @@
+"""
+Ranks the checkpoints of a run by local grading on a fixed seed set.
+
+Grades are cached in an index keyed by the hash of the checkpoint files (and
+the PolicyRunner options) and the seed, so a (checkpoint, seed) pair is
+simulated once, however often the tournament runs and whatever the file is
+renamed to.
+
+run_halving grades by successive halving: every checkpoint on a few seeds,
+then more seeds only for the ones that can still be the best.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import os.path as osp
+import re
+from collections import OrderedDict
+import numpy as np
+
+from baselines.common.checkpoint import is_checkpoint
+from nips.grading import grade_pairs, summarize
+from nips.policy_runner import legacy_rms_path
+
+# legacy joblib checkpoints are named %.5i, the single file ones %.5i.ckpt
+CHECKPOINT_NAME = re.compile(r'^(\d{5})(\.ckpt)?$')
+
+
+def find_checkpoints(checkdir, last=None):
+    """
+    paths of the checkpoints in checkdir by update, only the last ones if
+    last is given
+    """
+    found = []
+    for name in os.listdir(checkdir):
+        match = CHECKPOINT_NAME.match(name)
+        if match:
+            found.append((int(match.group(1)), name))
+    paths = [osp.join(checkdir, name) for _, name in sorted(found)]
+    return paths[-last:] if last else paths
+
+
+def file_hash(*paths):
+    sha = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def checkpoint_hash(path):
+    """
+    file_hash of the files load_params reads: a .ckpt file, or a legacy
+    joblib file together with its %.5i_ob_rms.pkl
+    """
+    if is_checkpoint(path):
+        return file_hash(path)
+    rms_path = legacy_rms_path(path)
+    return file_hash(path, rms_path) if osp.exists(rms_path) else file_hash(path)
+
+
+class GradeIndex(object):
+    """
+    The JSON file at path mapping checkpoint key -> seed -> result,
+    rewritten atomically on every add.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.grades = {}
+        if osp.exists(path):
+            with open(path) as f:
+                self.grades = json.load(f)
+
+    def get(self, key, seed):
+        return self.grades.get(key, {}).get(str(seed))
+
+    def add(self, key, seed, result):
+        self.grades.setdefault(key, {})[str(seed)] = result
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.grades, f)
+        os.replace(tmp_path, self.path)
+
+
+class _Tournament(object):
+    def __init__(self, checkdir, last, index_path, processes, make_env, runner_kwargs):
+        self.index = GradeIndex(index_path or osp.join(checkdir, 'grades.json'))
+        self.paths = find_checkpoints(checkdir, last)
+        self.digests = {path: checkpoint_hash(path) for path in self.paths}
+        # sampled and mean actions grade differently
+        options = ' ' + json.dumps(runner_kwargs, sort_keys=True) if runner_kwargs else ''
+        self.keys = {path: digest + options for path, digest in self.digests.items()}
+        self.processes = processes
+        self.make_env = make_env
+        self.runner_kwargs = runner_kwargs
+        self.simulated = 0
+
+    def results(self, path, seeds):
+        return [self.index.get(self.keys[path], seed) for seed in seeds]
+
+    def grade(self, paths, seeds):
+        """
+        grade the pairs that are not in the index yet
+        """
+        todo = [(path, seed) for path in paths for seed in seeds if self.index.get(self.keys[path], seed) is None]
+        for (path, seed), result in grade_pairs(todo, self.processes, self.make_env, **self.runner_kwargs):
+            self.index.add(self.keys[path], seed, result)
+            self.simulated += 1
+
+    def row(self, path, seeds):
+        row = OrderedDict([('checkpoint', osp.basename(path)), ('hash', self.digests[path])])
+        row.update(summarize(self.results(path, seeds)))
+        return row
+
+
+def _ranked(board):
+    for rank, row in enumerate(board, 1):
+        row['rank'] = rank
+        row.move_to_end('rank', last=False)
+    return board
+
+
+def run_tournament(checkdir, seeds, last=None, index_path=None, processes=None, make_env=None, **runner_kwargs):
+    """
+    Grade the (last) checkpoints of checkdir on seeds, skipping the pairs
+    in the index, and return the leaderboard: one row per checkpoint, by
+    mean score, best first. runner_kwargs go to PolicyRunner.load.
+    """
+    tournament = _Tournament(checkdir, last, index_path, processes, make_env, runner_kwargs)
+    tournament.grade(tournament.paths, seeds)
+    board = [tournament.row(path, seeds) for path in tournament.paths]
+    board.sort(key=lambda row: -row['mean_score'])
+    return _ranked(board)
+
+
+def survivors(scores, eta=2, z=2.0):
+    """
+    The checkpoints of scores (path -> scores on the same seeds) worth more
+    seeds: the best 1/eta by mean, and every other one whose upper bound
+    mean + z * stderr reaches the best lower bound mean - z * stderr.
+    """
+    means = {path: np.mean(s) for path, s in scores.items()}
+    stderr = {path: np.std(s, ddof=1) / np.sqrt(len(s)) if len(s) > 1 else np.inf for path, s in scores.items()}
+    ranked = sorted(scores, key=lambda path: -means[path])
+    keep = max(1, int(math.ceil(len(ranked) / eta)))
+    best_lower = max(means[path] - z * stderr[path] for path in ranked)
+    return [path for i, path in enumerate(ranked) if i < keep or means[path] + z * stderr[path] >= best_lower]
+
+
+def run_halving(checkdir, seeds, last=None, min_seeds=2, eta=2, z=2.0, index_path=None, processes=None,
+                make_env=None, **runner_kwargs):
+    """
+    Successive halving over the (last) checkpoints of checkdir: all of them
+    are graded on the first min_seeds seeds, the survivors() on eta times
+    as many, and so on up to all seeds.
+
+    Returns (leaderboard, report). The finalists lead the leaderboard, the
+    pruned checkpoints follow by how long they lasted; their rows hold the
+    seeds they were graded on and pruned_at, that number of seeds. The
+    report compares the episodes and steps used with exhaustive grading,
+    estimating the steps of the skipped episodes from each checkpoint's
+    mean length.
+    """
+    tournament = _Tournament(checkdir, last, index_path, processes, make_env, runner_kwargs)
+    seeds = list(seeds)
+    alive, pruned = list(tournament.paths), {}
+    n = min(min_seeds, len(seeds))
+    while alive:
+        tournament.grade(alive, seeds[:n])
+        if n == len(seeds) or len(alive) == 1:
+            break
+        scores = {path: [r['score'] for r in tournament.results(path, seeds[:n])] for path in alive}
+        keep = survivors(scores, eta, z)
+        pruned.update((path, n) for path in alive if path not in keep)
+        alive = keep
+        n = min(n * eta, len(seeds))
+
+    board, pruned_board = [], []
+    for path in tournament.paths:
+        used = pruned.get(path, n)
+        row = tournament.row(path, seeds[:used])
+        row['pruned_at'] = pruned.get(path, '')
+        (pruned_board if path in pruned else board).append(row)
+    board.sort(key=lambda row: -row['mean_score'])
+    pruned_board.sort(key=lambda row: (-row['seeds'], -row['mean_score']))
+    board = _ranked(board + pruned_board)
+
+    episodes = sum(row['seeds'] for row in board)
+    steps = sum(row['seeds'] * row['mean_length'] for row in board)
+    skipped_steps = sum((len(seeds) - row['seeds']) * row['mean_length'] for row in board)
+    report = OrderedDict([('checkpoints', len(board)),
+                          ('episodes', episodes),
+                          ('exhaustive_episodes', len(board) * len(seeds)),
+                          ('simulated_episodes', tournament.simulated),
+                          ('steps', steps),
+                          ('exhaustive_steps', steps + skipped_steps),
+                          ('saved', skipped_steps / (steps + skipped_steps) if board else 0.0)])
+    return board, report
+
+
+def write_leaderboard(board, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(board[0]))
+        writer.writeheader()
+        writer.writerows(board)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='rank checkpoints by local grading on a fixed seed set')
+    parser.add_argument('checkdir', help='directory of the checkpoints, e.g. logs/checkpoints')
+    parser.add_argument('--last', default=None, type=int, help='grade only the last checkpoints, all by default')
+    parser.add_argument('--num-seeds', default=10, type=int)
+    parser.add_argument('--seed', default=0, type=int, help='draws the seed set')
+    parser.add_argument('--processes', default=None, type=int, help='one per core by default')
+    parser.add_argument('--stochastic', default=False, action='store_true', help='sample actions')
+    parser.add_argument('--index', default=None, help='grade index, <checkdir>/grades.json by default')
+    parser.add_argument('--halving', default=False, action='store_true',
+                        help='grade more seeds only for the checkpoints that can still be the best')
+    parser.add_argument('--min-seeds', default=2, type=int, help='seeds of the first halving round')
+    parser.add_argument('--eta', default=2, type=int, help='1/eta of the checkpoints survive a halving round')
+    parser.add_argument('--z', default=2.0, type=float, help='confidence bounds are mean +- z standard errors')
+    args = parser.parse_args()
+
+    seeds = np.random.RandomState(args.seed).randint(0, 2 ** 31 - 1, size=args.num_seeds).tolist()
+    kwargs = dict(last=args.last, index_path=args.index, processes=args.processes,
+                  deterministic=not args.stochastic)
+    if args.halving:
+        board, report = run_halving(args.checkdir, seeds, min_seeds=args.min_seeds, eta=args.eta, z=args.z,
+                                    **kwargs)
+    else:
+        board, report = run_tournament(args.checkdir, seeds, **kwargs), None
+    if not board:
+        print('no checkpoints in', args.checkdir)
+        return
+    write_leaderboard(board, osp.join(args.checkdir, 'leaderboard.csv'))
+    for row in board:
+        print('%3d  %-12s  seeds %3d  mean %8.2f  std %7.2f  min %8.2f  length %6.1f' % (
+            row['rank'], row['checkpoint'], row['seeds'], row['mean_score'], row['std_score'], row['min_score'],
+            row['mean_length']))
+    if report is not None:
+        print('graded %d of %d episodes (%d simulated), %.0f of ~%.0f steps: %.0f%% saved' % (
+            report['episodes'], report['exhaustive_episodes'], report['simulated_episodes'], report['steps'],
+            report['exhaustive_steps'], 100 * report['saved']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Episode trajectories stored by column in compressed npz shards.
+
+A shard holds the steps of up to episodes_per_shard episodes, every column
+(obs, action, reward, ...) concatenated over time as one member of the npz,
+so reading a column decompresses only that column. Each shard has a JSON
+sidecar with the start, length and metadata of its episodes; the sidecars
+are the index. Shards are named by process, several envs can record into
+one directory; readers order the shards by the time they were written.
+"""
+import glob
+import json
+import os
+import os.path as osp
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+
+class TrajectoryWriter(object):
+    def __init__(self, directory, episodes_per_shard=64):
+        self.directory = directory
+        self.episodes_per_shard = episodes_per_shard
+        self.name = 'shard-%d-%s' % (os.getpid(), uuid.uuid4().hex[:8])
+        self.num_shards = 0
+        self._steps = OrderedDict()
+        self._episodes = []
+        self._columns = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def add_step(self, **columns):
+        """
+        the values of one step by column name, the same columns every step
+        """
+        for name, value in columns.items():
+            self._steps.setdefault(name, []).append(value)
+
+    def end_episode(self, **meta):
+        """
+        close the episode of the steps added so far, meta is JSON
+        serializable and stored in the index; without steps it is dropped
+        """
+        if not self._steps:
+            return
+        start = sum(episode['length'] for episode in self._episodes)
+        length = len(next(iter(self._steps.values())))
+        for name, values in self._steps.items():
+            assert len(values) == length, 'column %s has %d of %d steps' % (name, len(values), length)
+            self._columns.setdefault(name, []).append(np.asarray(values, dtype=np.float32))
+        self._steps = OrderedDict()
+        self._episodes.append(dict(meta, start=start, length=length))
+        if len(self._episodes) >= self.episodes_per_shard:
+            self.flush()
+
+    def flush(self):
+        """
+        write the finished episodes to a new shard
+        """
+        if not self._episodes:
+            return
+        shard = '%s-%05d' % (self.name, self.num_shards)
+        path = osp.join(self.directory, shard + '.npz')
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, **{name: np.concatenate(arrays) for name, arrays in self._columns.items()})
+        os.replace(path + '.tmp', path)
+        # the sidecar makes the shard visible to readers
+        with open(path[:-4] + '.json.tmp', 'w') as f:
+            # numpy scalars in meta are written as floats
+            json.dump({'shard': shard + '.npz', 'written': time.time(), 'columns': list(self._columns),
+                       'episodes': self._episodes}, f, default=float)
+        os.replace(path[:-4] + '.json.tmp', path[:-4] + '.json')
+        self.num_shards += 1
+        self._columns = OrderedDict()
+        self._episodes = []
+
+    def close(self):
+        """
+        drop an unfinished episode and write the finished ones
+        """
+        self._steps = OrderedDict()
+        self.flush()
+
+
+class TrajectoryReader(object):
+    """
+    The episodes recorded in directory, oldest shard first. episodes[i] is
+    the index entry of episode i: its metadata, shard, start and length.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.episodes = []
+        self.shard_columns = {}
+        indexes = []
+        for sidecar in glob.glob(osp.join(directory, 'shard-*.json')):
+            with open(sidecar) as f:
+                indexes.append(json.load(f))
+        # sidecars written before shards were timestamped come first
+        indexes.sort(key=lambda index: (index.get('written', 0.0), index['shard']))
+        for index in indexes:
+            self.shard_columns[index['shard']] = index['columns']
+            for episode in index['episodes']:
+                episode['shard'] = index['shard']
+                self.episodes.append(episode)
+        # the open shard and its columns read so far
+        self._shard, self._data, self._columns = None, None, {}
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def _column(self, shard, name):
+        if self._shard != shard:
+            self._shard, self._data, self._columns = shard, np.load(osp.join(self.directory, shard)), {}
+        if name not in self._columns:
+            self._columns[name] = self._data[name]
+        return self._columns[name]
+
+    def episode(self, i, columns=None):
+        """
+        the columns (all by default) of episode i by name
+        """
+        entry = self.episodes[i]
+        steps = slice(entry['start'], entry['start'] + entry['length'])
+        columns = columns or self.shard_columns[entry['shard']]
+        return OrderedDict((name, self._column(entry['shard'], name)[steps]) for name in columns)
+
+    def column(self, name, episodes=None):
+        """
+        name of the episodes (all by default) as one array per episode,
+        decompressing only that column of their shards
+        """
+        episodes = range(len(self.episodes)) if episodes is None else episodes
+        result = []
+        for i in episodes:
+            entry = self.episodes[i]
+            data = self._column(entry['shard'], name)
+            result.append(data[entry['start']:entry['start'] + entry['length']])
+        return result
+
+
+def record_step(writer, env, action, reward):
+    """
+    add the observation, action, reward and the pelvis and target velocity
+    of the step an osim env just took
+    """
+    state_desc = env.get_state_desc()
+    writer.add_step(obs=env.get_observation(), action=action, reward=reward,
+                    pelvis_vel=state_desc["body_vel"]["pelvis"][:3], target_vel=state_desc["target_vel"][:3])
@@ -0,0 +1,98 @@
+"""
+Velocity plots of recorded episodes, see nips.trajectory.
+
+Episodes are read one at a time, and each series is min/max decimated to at
+most max_points before it is plotted, so memory stays bounded however many
+and however long the episodes are. Rendering uses the Agg backend and needs
+no display.
+
+    python -m nips.velocity_plot logs/trajectories --out velocity.png
+"""
+import argparse
+import numpy as np
+
+from nips.trajectory import TrajectoryReader
+
+# more episodes than this are drawn without legend entries
+MAX_LABELS = 10
+
+
+def decimate(y, max_points):
+    """
+    (x, y) of at most max_points points keeping the minimum and the maximum
+    of every bucket of consecutive samples, in the order they occur, so
+    spikes survive the downsampling. x are the sample indices.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n), y
+    size = int(np.ceil(n / (max_points // 2)))
+    nbuckets = int(np.ceil(n / size))
+    # the last bucket is padded with its own last sample
+    padded = np.concatenate([y, np.repeat(y[-1:], nbuckets * size - n)]).reshape(nbuckets, size)
+    starts = np.arange(nbuckets) * size
+    lo = starts + padded.argmin(axis=1)
+    hi = starts + padded.argmax(axis=1)
+    x = np.minimum(np.stack([np.minimum(lo, hi), np.maximum(lo, hi)], axis=1).ravel(), n - 1)
+    return x, y[x]
+
+
+def _label(i, entry):
+    score = entry.get('score', entry.get('r'))
+    label = 'seed %s' % entry['seed'] if entry.get('seed') is not None else 'episode %d' % i
+    return label if score is None else '%s - %.2f' % (label, score)
+
+
+def plot_velocity(directory, out, component=0, episodes=None, max_points=2000, dpi=300):
+    """
+    Plot the pelvis velocity along component (0 is x) of the recorded
+    episodes (all by default, or these indices) against the step, with the
+    target velocity dotted, and save the figure to out.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    reader = TrajectoryReader(directory)
+    episodes = range(len(reader)) if episodes is None else episodes
+    labeled = len(episodes) <= MAX_LABELS
+
+    fig, ax = plt.subplots()
+    ax.grid(True)
+    ax.set_title('velocity distribution')
+    ax.set_xlabel('timestamp')
+    ax.set_ylabel('velocity')
+    for i in episodes:
+        entry = reader.episodes[i]
+        velocity, = reader.column('pelvis_vel', [i])
+        x, y = decimate(velocity[:, component], max_points)
+        line, = ax.plot(x + 1, y, linewidth=0.8, label=_label(i, entry) if labeled else None)
+        target, = reader.column('target_vel', [i])
+        x, y = decimate(target[:, component], max_points)
+        ax.plot(x + 1, y, ':', linewidth=0.8, color=line.get_color())
+    if labeled and len(episodes):
+        ax.legend(fontsize='small')
+    fig.savefig(out, dpi=dpi)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='plot the pelvis velocity of recorded episodes')
+    parser.add_argument('directory', help='trajectory directory, see nips.trajectory')
+    parser.add_argument('--out', default='velocity_distribution.png', help='image file')
+    parser.add_argument('--component', default=0, type=int, help='velocity component, 0 is x and 2 is z')
+    parser.add_argument('--last', default=None, type=int, help='plot only the last episodes, all by default')
+    parser.add_argument('--max-points', default=2000, type=int, help='points per plotted series')
+    parser.add_argument('--dpi', default=300, type=int)
+    args = parser.parse_args()
+
+    num_episodes = len(TrajectoryReader(args.directory))
+    episodes = range(max(0, num_episodes - args.last), num_episodes) if args.last else None
+    plot_velocity(args.directory, args.out, component=args.component, episodes=episodes,
+                  max_points=args.max_points, dpi=args.dpi)
+    print('plotted', num_episodes if episodes is None else len(episodes), 'episodes to', args.out)
+
+
+if __name__ == '__main__':
+    main()
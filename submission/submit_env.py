@@ -1,9 +1,19 @@
 import gym
 from gym.spaces import Box
 
+from nips.observation import ObservationSchema, TAIL_MASS_CENTER
+from nips.trajectory import TrajectoryWriter
+
+# the round 1 target velocity, round 2 state_desc carries its own
+TARGET_VEL = [3.0, 0.0, 0.0]
+
 
 class SubmitEnv:
-    def __init__(self):
+    def __init__(self, record_dir=None):
+        """
+        record_dir: record the trajectory of every episode there, see
+            nips.trajectory
+        """
         from osim.http.client import Client
         remote_base = "http://grader.crowdai.org:1729"
         self.crowdai_token = "e47cb9f7fd533dc036dbd5d65d0d68c3"
@@ -13,9 +23,12 @@ class SubmitEnv:
         self.observation_space = Box(low=-3, high=3, shape=[224])
         self.episodic_length = 0
         self.score = 0.0
+        self.observation_schema = None
 
         self.reward_range = None
         self.metadata = None
+        self.num_episodes = 0
+        self.recorder = TrajectoryWriter(record_dir, episodes_per_shard=1) if record_dir else None
 
     def reset(self):
         self.episodic_length = 0
@@ -26,6 +39,8 @@ class SubmitEnv:
         else:
             obs = self.client.env_reset()
             if obs is None:
+                if self.recorder is not None:
+                    self.recorder.close()
                 self.client.submit()
                 print('SUBMITTED')
                 import sys
@@ -40,47 +55,22 @@ class SubmitEnv:
         print(f'timestamp={self.episodic_length:3d} score={self.score:5.2f} velocity={pelvis_vx:3.2f}')
         import sys
         sys.stdout.flush()
-        return self.get_observation(obs), rew, done, info
+        observation = self.get_observation(obs)
+        if self.recorder is not None:
+            self.recorder.add_step(obs=observation, action=action, reward=rew, pelvis_vel=obs['body_vel']['pelvis'][:3],
+                                   target_vel=obs.get('target_vel', TARGET_VEL)[:3])
+            if done:
+                self.recorder.end_episode(episode=self.num_episodes, score=self.score)
+                self.num_episodes += 1
+        return observation, rew, done, info
 
     def close(self):
         pass
 
     def get_observation(self, state_desc):
-        res = []
-        pelvis = None
-
-        for body_part in ["pelvis", "head", "torso", "toes_l", "talus_l", "pros_foot_r", "pros_tibia_r"]:
-            cur = []
-            cur += state_desc["body_pos"][body_part]
-            cur += state_desc["body_vel"][body_part]
-            cur += state_desc["body_acc"][body_part]
-            cur += state_desc["body_pos_rot"][body_part]
-            cur += state_desc["body_vel_rot"][body_part]
-            cur += state_desc["body_acc_rot"][body_part]
-            if body_part == "pelvis":
-                pelvis = cur
-                res += cur[1:]  # make sense, pelvis.x is not important
-            else:
-                cur[0] -= pelvis[0]
-                cur[2] -= pelvis[2]     # relative position work for x / z axis
-                res += cur
-
-        for joint in ["ankle_l", "ankle_r", "back", "hip_l", "hip_r", "knee_l", "knee_r"]:
-            res += state_desc["joint_pos"][joint]
-            res += state_desc["joint_vel"][joint]
-            res += state_desc["joint_acc"][joint]
-
-        for muscle in sorted(state_desc["muscles"].keys()):
-            res += [state_desc["muscles"][muscle]["activation"]]
-            res += [state_desc["muscles"][muscle]["fiber_length"]]
-            res += [state_desc["muscles"][muscle]["fiber_velocity"]]
-
-        cm_pos = state_desc["misc"]["mass_center_pos"]  # relative x / z axis center of mass position
-        cm_pos[0] -= pelvis[0]
-        cm_pos[2] -= pelvis[0]
-        res = res + cm_pos + state_desc["misc"]["mass_center_vel"] + state_desc["misc"]["mass_center_acc"]
-
-        return res
+        if self.observation_schema is None:
+            self.observation_schema = ObservationSchema(state_desc, tail=TAIL_MASS_CENTER)
+        return self.observation_schema(state_desc)
 
 
 class SubmitRepeatActionEnv(gym.ActionWrapper):
@@ -99,7 +89,7 @@ class SubmitRepeatActionEnv(gym.ActionWrapper):
         return obs, total_reward, done, info
         
 
-def make_submit_env():
-    env = SubmitEnv()
+def make_submit_env(record_dir=None):
+    env = SubmitEnv(record_dir)
     env = SubmitRepeatActionEnv(env=env, repeat=2)
     return env